@@ -51,3 +51,14 @@ class AuditLogAdmin(admin.ModelAdmin):
         'details',
     )
 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'finished_at', 'company')
+    list_filter = ('status', 'name', 'company')
+    search_fields = ('name', 'last_error')
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refs', 'created_at', 'touched_at')
+    search_fields = ('sha256', 'name')
@@ -0,0 +1,177 @@
+"""PDF rendering service for company documents.
+
+A :class:`Document` describes what to print: a title, label/value pairs,
+an item table and closing paragraphs. :func:`render_pdf` lays it out with
+reportlab's flowables, so long tables continue onto new pages with their
+header row repeated. The company letterhead is drawn on every page.
+
+Letterheads are read from storage once per process and kept as parsed
+images. Output for documents that no longer change (approved requisitions,
+issued orders) can be stored under a hash of its content with
+:func:`cached_pdf`. Identical content is then served from storage without
+rendering again. :func:`render_combined` and :func:`zip_documents` handle
+batches.
+"""
+
+import hashlib
+import io
+import json
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from xml.sax.saxutils import escape
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from erp_project import metrics
+
+RENDERER_VERSION = 1
+CACHE_DIR = 'documents/cache'
+LETTERHEAD_CACHE_SIZE = 64
+
+_letterheads = OrderedDict()
+_letterhead_lock = threading.Lock()
+
+
+@dataclass
+class Document:
+    title: str
+    filename: str
+    meta: list = field(default_factory=list)
+    headers: list = field(default_factory=list)
+    rows: list = field(default_factory=list)
+    notes: list = field(default_factory=list)
+
+    def content_hash(self, company):
+        """Hash of everything that affects the rendered output."""
+        letterhead = company.letterhead.name if company.letterhead else ''
+        payload = json.dumps(
+            [RENDERER_VERSION, company.pk, company.name, letterhead, asdict(self)],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def letterhead_image(company):
+    """Return the parsed letterhead as an ``ImageReader`` or ``None``.
+
+    Entries are keyed by storage name, which changes whenever a new file is
+    uploaded, so replaced letterheads are never served stale.
+    """
+    if not company.letterhead:
+        return None
+    from reportlab.lib.utils import ImageReader
+
+    name = company.letterhead.name
+    with _letterhead_lock:
+        if name in _letterheads:
+            _letterheads.move_to_end(name)
+            metrics.cache_result('letterhead', hit=True)
+            return _letterheads[name]
+    metrics.cache_result('letterhead', hit=False)
+    try:
+        with company.letterhead.open('rb') as fh:
+            image = ImageReader(io.BytesIO(fh.read()))
+        image.getSize()
+    except Exception:
+        image = None
+    with _letterhead_lock:
+        _letterheads[name] = image
+        while len(_letterheads) > LETTERHEAD_CACHE_SIZE:
+            _letterheads.popitem(last=False)
+    return image
+
+
+def _story(document, styles):
+    from reportlab.lib import colors
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    story = [Paragraph(escape(document.title), styles['Title'])]
+    for label, value in document.meta:
+        story.append(Paragraph(f'<b>{escape(label)}:</b> {escape(str(value))}', styles['Normal']))
+    story.append(Spacer(1, 12))
+    if document.rows:
+        body = styles['BodyText']
+        data = [document.headers] + [
+            [Paragraph(escape(str(cell)), body) for cell in row] for row in document.rows
+        ]
+        table = Table(data, repeatRows=1, hAlign='LEFT')
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story.append(table)
+        story.append(Spacer(1, 12))
+    for note in document.notes:
+        story.append(Paragraph(escape(note), styles['Normal']))
+    return story
+
+
+def _build(company, documents, out):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, SimpleDocTemplate
+
+    letterhead = letterhead_image(company)
+    width, height = A4
+    top = 110 if letterhead else 40
+
+    def decorate(canvas, doc):
+        canvas.saveState()
+        if letterhead is not None:
+            canvas.drawImage(letterhead, 40, height - 90, width=200, height=60,
+                             preserveAspectRatio=True, mask='auto')
+        canvas.setFont('Helvetica', 8)
+        canvas.drawRightString(width - 40, 20, f'{company.name} - Page {doc.page}')
+        canvas.restoreState()
+
+    styles = getSampleStyleSheet()
+    story = []
+    for idx, document in enumerate(documents):
+        if idx:
+            story.append(PageBreak())
+        story.extend(_story(document, styles))
+    doc = SimpleDocTemplate(out, pagesize=A4, topMargin=top, bottomMargin=40,
+                            leftMargin=40, rightMargin=40)
+    doc.build(story, onFirstPage=decorate, onLaterPages=decorate)
+
+
+def render_pdf(company, document):
+    """Render one document and return the PDF bytes."""
+    out = io.BytesIO()
+    _build(company, [document], out)
+    return out.getvalue()
+
+
+def cached_pdf(company, document):
+    """Return PDF bytes for an immutable document, rendering at most once."""
+    path = f'{CACHE_DIR}/{document.content_hash(company)}.pdf'
+    if default_storage.exists(path):
+        metrics.cache_result('pdf', hit=True)
+        with default_storage.open(path, 'rb') as fh:
+            return fh.read()
+    metrics.cache_result('pdf', hit=False)
+    data = render_pdf(company, document)
+    default_storage.save(path, ContentFile(data))
+    return data
+
+
+def render_combined(company, documents):
+    """Render several documents into one PDF, each starting on a new page."""
+    out = io.BytesIO()
+    _build(company, list(documents), out)
+    return out.getvalue()
+
+
+def zip_documents(company, documents, cache=True):
+    """Return a zip archive holding one PDF per document."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for document in documents:
+            data = cached_pdf(company, document) if cache else render_pdf(company, document)
+            archive.writestr(document.filename, data)
+    return out.getvalue()
@@ -0,0 +1,283 @@
+"""Database-backed background jobs.
+
+Slow side effects (emails, PDF rendering) are stored as :class:`Job` rows
+with :func:`enqueue` and executed by ``python manage.py run_jobs``. The queue
+row is written in the caller's transaction, so a job is only visible once
+the request that created it commits, and disappears if it rolls back.
+
+Workers claim jobs with a conditional ``UPDATE`` (``queued`` -> ``running``),
+which is safe with several workers on SQLite or Postgres without any
+external broker. A failing job is retried with exponential backoff until
+``max_attempts`` is reached and then marked ``failed`` with its traceback.
+
+Task functions are registered with :func:`task` in ``<app>/tasks.py``
+modules, which are discovered on first use. Their arguments must be JSON
+serialisable. :func:`enqueue_on_commit` merges the jobs a transaction asks
+for, so recomputing signals queue one job per commit instead of per row.
+"""
+
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+from .utils import serialized_write
+
+MAX_BACKOFF = 3600
+
+_registry = {}
+_discovered = False
+
+
+class UnknownTask(LookupError):
+    pass
+
+
+def task(name):
+    """Register the decorated function as the job ``name``."""
+    def register(fn):
+        _registry[name] = fn
+        return fn
+    return register
+
+
+def get_task(name):
+    global _discovered
+    if name not in _registry and not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(f'No task registered as {name!r}') from None
+
+
+def _run_eager(job_id):
+    claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, attempts=1, locked_by='eager', locked_at=timezone.now()
+    )
+    if claimed:
+        run_job(job_id)
+
+
+def enqueue(name, company=None, delay=None, max_attempts=3, **payload):
+    """Queue the task ``name`` with keyword arguments ``payload``.
+
+    With ``settings.JOBS_EAGER`` the job runs before this returns, which is
+    handy in development and tests.
+    """
+    get_task(name)
+    run_after = timezone.now() + (delay or timedelta(0))
+    with serialized_write(Job):
+        job = Job.objects.create(
+            name=name, payload=payload, company_id=getattr(company, 'pk', company),
+            max_attempts=max_attempts, run_after=run_after,
+        )
+    if getattr(settings, 'JOBS_EAGER', False):
+        _run_eager(job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def enqueue_many(name, payloads, company=None, max_attempts=3):
+    """Queue one ``name`` job per payload dict with a single bulk insert."""
+    get_task(name)
+    now = timezone.now()
+    with serialized_write(Job):
+        jobs = Job.objects.bulk_create(
+            [
+                Job(name=name, payload=p, company_id=getattr(company, 'pk', company), max_attempts=max_attempts,
+                    run_after=now)
+                for p in payloads
+            ],
+            batch_size=500,
+        )
+    if getattr(settings, 'JOBS_EAGER', False):
+        for job in jobs:
+            _run_eager(job.pk)
+    return jobs
+
+
+class _Batch:
+    """Jobs requested during one transaction, queued by one on_commit callback."""
+
+    def __init__(self):
+        self.sent = False
+        self.jobs = {}  # (name, company id) -> {argument: set of values}
+
+    def add(self, name, company_id, sets):
+        args = self.jobs.setdefault((name, company_id), {})
+        for arg, values in sets.items():
+            args.setdefault(arg, set()).update(values)
+
+    def send(self):
+        self.sent = True
+        for (name, company_id), args in self.jobs.items():
+            enqueue(name, company=company_id, company_id=company_id,
+                    **{arg: sorted(values) for arg, values in args.items()})
+
+
+def enqueue_on_commit(name, company_id, **sets):
+    """Queue ``name`` once the current transaction commits.
+
+    Calls for the same task and company within one transaction are merged
+    into a single job whose keyword arguments are the unions of ``sets``, and
+    the job also gets ``company_id``. Outside a transaction it is queued at
+    once.
+    """
+    get_task(name)
+    connection = transaction.get_connection()
+    batch = getattr(connection, 'job_batch', None)
+    # A rollback drops the callback along with the batch it would send.
+    fresh = batch is None or batch.sent or not any(
+        callback == batch.send for _, callback, _ in connection.run_on_commit
+    )
+    if fresh:
+        batch = connection.job_batch = _Batch()
+    batch.add(name, company_id, sets)
+    if fresh:
+        transaction.on_commit(batch.send, robust=True)
+
+
+def enqueue_mail(subject, message, recipients, company=None, from_email=None):
+    """Queue an email. Blank recipients are dropped; returns ``None`` if none remain.
+
+    Without ``from_email`` the worker sends from ``settings.DEFAULT_FROM_EMAIL``.
+    """
+    recipients = [r for r in recipients if r]
+    if not recipients:
+        return None
+    return enqueue(
+        'send_mail', company=company, subject=subject, message=message,
+        from_email=from_email, recipient_list=recipients,
+    )
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``."""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 30)
+    return min(base * 2 ** max(attempts - 1, 0), MAX_BACKOFF)
+
+
+def claim(worker_id, limit=1, now=None):
+    """Mark up to ``limit`` due jobs as running for ``worker_id``; return their ids."""
+    now = now or timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'pk').values_list('pk', 'attempts')[:limit]
+    )
+    claimed = []
+    for pk, attempts in candidates:
+        # Another worker may have taken the job since it was read; the status
+        # condition makes sure only one update succeeds.
+        updated = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=attempts + 1, locked_by=worker_id, locked_at=now
+        )
+        if updated:
+            claimed.append(pk)
+    return claimed
+
+
+def run_job(job_id):
+    """Execute a claimed job and record the outcome. Returns the new status."""
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    try:
+        get_task(job.name)(**job.payload)
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            fields = {'status': Job.FAILED, 'finished_at': now}
+        else:
+            fields = {'status': Job.QUEUED, 'run_after': now + timedelta(seconds=backoff(job.attempts))}
+        Job.objects.filter(pk=job.pk).update(last_error=error, locked_by='', locked_at=None, **fields)
+        return fields['status']
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, finished_at=timezone.now(), last_error='', locked_by='', locked_at=None
+    )
+    return Job.DONE
+
+
+def requeue_stale(timeout=600, now=None):
+    """Return jobs left ``running`` by a worker that died to the queue."""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=timeout)
+    ).update(status=Job.QUEUED, locked_by='', locked_at=None, run_after=now)
+
+
+def purge(days, now=None):
+    """Delete finished jobs older than ``days``. Returns the count."""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=now - timedelta(days=days)
+    ).delete()
+    return deleted
+
+
+def _run_in_thread(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def _init_process():
+    import django
+
+    django.setup()
+
+
+def run_worker(worker_id=None, concurrency=1, processes=False, once=False, poll=1.0, stale_after=600):
+    """Process jobs until interrupted, or until the queue is empty with ``once``.
+
+    ``concurrency`` jobs run at a time in a thread pool, or in a process pool
+    with ``processes`` (better for CPU-bound rendering). Returns the number
+    of jobs executed.
+    """
+    worker_id = worker_id or default_worker_id()
+    requeue_stale(stale_after)
+    executor = None
+    if concurrency > 1:
+        if processes:
+            # Children must not share the parent's database sockets.
+            connections.close_all()
+            executor = ProcessPoolExecutor(concurrency, initializer=_init_process)
+        else:
+            executor = ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+    target = run_job if processes else _run_in_thread
+    inflight = set()
+    total = 0
+    try:
+        while True:
+            ids = claim(worker_id, limit=max(concurrency - len(inflight), 0))
+            if executor is None:
+                for pk in ids:
+                    run_job(pk)
+            else:
+                inflight.update(executor.submit(target, pk) for pk in ids)
+            total += len(ids)
+            if inflight:
+                done, inflight = wait(inflight, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            elif not ids:
+                if once:
+                    return total
+                time.sleep(poll)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
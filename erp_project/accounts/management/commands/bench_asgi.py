@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+MODES = ('wsgi', 'asgi')
+ENDPOINTS = (
+    ('product_search', {'q': 'Item 1'}),
+    ('bank_search', {'q': 'Bank'}),
+    ('service_search', {'q': 'Service'}),
+    ('whoami', {}),
+)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the search and lookup endpoints through '
+        'the WSGI handler (one thread per request) and the ASGI handler '
+        '(concurrent requests on one event loop).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+        parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            result = self.work(options['worker'], options['concurrency'], options['requests'])
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(f"{'mode':<8}{'requests':>10}{'errors':>8}{'seconds':>10}{'req/s':>10}{'p95 ms':>10}")
+        for mode in MODES:
+            result = self.spawn(mode, options)
+            self.stdout.write(
+                f"{mode:<8}{result['ok']:>10}{result['errors']:>8}{result['seconds']:>10.2f}"
+                f"{result['ok'] / result['seconds']:>10.1f}{result['p95'] * 1000:>10.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def spawn(self, mode, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bench_asgi', '--worker', mode,
+                '--concurrency', str(options['concurrency']), '--requests', str(options['requests']),
+            ]
+            env = {**os.environ, 'DB_ENGINE': 'sqlite', 'DB_NAME': str(Path(tmp) / 'bench.sqlite3')}
+            env.pop('DB_REPLICA_NAME', None)
+            env.pop('DB_REPLICA_HOST', None)
+            out = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    def setup_data(self):
+        from django.core.management import call_command
+        from django.test.utils import setup_test_environment
+
+        from accounts.models import Company, User
+        from inventory.models import Product, ProductUnit
+        from purchasing.models import Bank, ServiceItem
+
+        call_command('migrate', verbosity=0)
+        setup_test_environment()
+        company = Company.objects.create(name='Bench', code='BENCH')
+        unit = ProductUnit.objects.create(code='BX', name='Box')
+        Product.objects.bulk_create(
+            [Product(name=f'Item {n}', sku=f'SKU{n}', unit=unit, company=company) for n in range(500)]
+        )
+        ServiceItem.objects.bulk_create(
+            [ServiceItem(name=f'Service {n}', unit=unit, company=company) for n in range(200)]
+        )
+        Bank.objects.bulk_create([Bank(name=f'Bank {n}', swift_code=f'BANK{n:04}') for n in range(50)])
+        return User.objects.create_superuser('bench', 'bench@example.com', 'x', company=company)
+
+    def work(self, mode, concurrency, requests):
+        from django.urls import reverse
+
+        user = self.setup_data()
+        urls = [(reverse(name), params) for name, params in ENDPOINTS]
+        timings, errors = [], []
+        if mode == 'wsgi':
+            run = self.run_threads
+        else:
+            run = self.run_event_loop
+        start = time.perf_counter()
+        run(user, urls, concurrency, requests, timings, errors)
+        return {
+            'ok': len(timings),
+            'errors': len(errors),
+            'seconds': time.perf_counter() - start,
+            'p95': _percentile(timings, 0.95) if timings else 0,
+        }
+
+    def run_threads(self, user, urls, concurrency, requests, timings, errors):
+        from django.test import Client
+
+        barrier = threading.Barrier(concurrency)
+
+        def client_loop():
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            for i in range(requests):
+                url, params = urls[i % len(urls)]
+                began = time.perf_counter()
+                response = client.get(url, params)
+                (timings if response.status_code == 200 else errors).append(time.perf_counter() - began)
+
+        threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_event_loop(self, user, urls, concurrency, requests, timings, errors):
+        from django.test import AsyncClient
+
+        async def client_loop(client):
+            for i in range(requests):
+                url, params = urls[i % len(urls)]
+                began = time.perf_counter()
+                response = await client.get(url, params)
+                (timings if response.status_code == 200 else errors).append(time.perf_counter() - began)
+
+        async def main():
+            clients = []
+            for _ in range(concurrency):
+                client = AsyncClient()
+                await client.aforce_login(user)
+                clients.append(client)
+            await asyncio.gather(*(client_loop(client) for client in clients))
+
+        asyncio.run(main())
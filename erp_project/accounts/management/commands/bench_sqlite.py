@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+MODES = {
+    'default': {'DB_SQLITE_TUNING': '0', 'SQLITE_WRITE_LOCK': '0'},
+    'tuned': {'DB_SQLITE_TUNING': '1', 'SQLITE_WRITE_LOCK': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent request throughput on SQLite with the stock '
+        'settings and with WAL, busy timeout and the write lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests per thread, alternating audit log reads and logins')
+        parser.add_argument('--worker', choices=sorted(MODES), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.work(options['threads'], options['requests'])))
+            return
+        self.stdout.write(f"{'mode':<10}{'ok':>8}{'locked':>8}{'seconds':>10}{'req/s':>10}")
+        for mode, env in MODES.items():
+            result = self.spawn(mode, env, options)
+            self.stdout.write(
+                f"{mode:<10}{result['ok']:>8}{result['locked']:>8}"
+                f"{result['seconds']:>10.2f}{result['ok'] / result['seconds']:>10.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def spawn(self, mode, env, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bench_sqlite',
+                '--worker', mode, '--threads', str(options['threads']), '--requests', str(options['requests']),
+            ]
+            env = {**os.environ, **env, 'DB_ENGINE': 'sqlite', 'DB_NAME': str(Path(tmp) / 'bench.sqlite3')}
+            env.pop('DB_REPLICA_NAME', None)
+            env.pop('DB_REPLICA_HOST', None)
+            out = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    def work(self, threads, requests):
+        from django.core.management import call_command
+        from django.test import Client
+        from django.test.utils import setup_test_environment
+        from django.urls import reverse
+
+        from accounts.models import Company, User
+
+        settings.SQLITE_WRITE_LOCK = os.environ.get('SQLITE_WRITE_LOCK') == '1'
+        # Time the database, not password hashing.
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        call_command('migrate', verbosity=0)
+        setup_test_environment()
+        company = Company.objects.create(name='Bench', code='BENCH')
+        user = User.objects.create_superuser('bench', 'bench@example.com', 'x', company=company)
+        barrier = threading.Barrier(threads)
+        counts = {'ok': 0, 'locked': 0}
+        count_lock = threading.Lock()
+
+        def run(n):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            for i in range(requests):
+                try:
+                    if i % 2:
+                        # Writes a session, last_login and an audit log row.
+                        client.post(reverse('login'), {'username': 'bench', 'password': 'x'})
+                    else:
+                        client.get(reverse('audit_log_list'))
+                    outcome = 'ok'
+                except OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    outcome = 'locked'
+                with count_lock:
+                    counts[outcome] += 1
+
+        workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return {**counts, 'seconds': time.perf_counter() - start}
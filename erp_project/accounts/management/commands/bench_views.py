@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+BENCH_COMPANY = 'BENCH'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a benchmark database and record the query count, time and peak '
+        'memory of every page as a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--movements', type=int, default=200000)
+        parser.add_argument('--audit-rows', type=int, default=200000)
+        parser.add_argument('--tenants', action='store_true',
+                            help='Run seed_companies first so the database holds other tenants too')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per page')
+        parser.add_argument('--db', help='SQLite file to seed and keep; reused when already seeded')
+        parser.add_argument('--output', default='bench_views.json')
+        parser.add_argument('--baseline', help='Earlier report; fail if any page runs more queries')
+        parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.work(options)
+            return
+        output = Path(options['output']).resolve()
+        with tempfile.TemporaryDirectory() as tmp:
+            db = options['db'] or str(Path(tmp) / 'bench.sqlite3')
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bench_views', '--worker',
+                '--products', str(options['products']), '--movements', str(options['movements']),
+                '--audit-rows', str(options['audit_rows']), '--repeat', str(options['repeat']),
+                '--output', str(output),
+            ]
+            if options['tenants']:
+                command.append('--tenants')
+            env = {**os.environ, 'DB_ENGINE': 'sqlite', 'DB_NAME': db}
+            env.pop('DB_REPLICA_NAME', None)
+            env.pop('DB_REPLICA_HOST', None)
+            subprocess.run(command, env=env, check=True)
+        report = json.loads(output.read_text())
+        self.print_report(report)
+        if options['baseline']:
+            self.compare(report, json.loads(Path(options['baseline']).read_text()))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
+
+    def work(self, options):
+        from django.core.management import call_command
+        from django.test import Client
+        from django.test.utils import setup_test_environment
+
+        from accounts.models import AuditLog, Company, User
+        from erp_project import benchmark
+        from inventory.models import Product, StockMovement
+
+        # Time the pages, not password hashing.
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        call_command('migrate', verbosity=0)
+        setup_test_environment()
+        company = Company.objects.filter(code=BENCH_COMPANY).first()
+        if company is None:
+            if options['tenants']:
+                call_command('seed_companies')
+            company = Company.objects.create(name='Benchmark Trading', code=BENCH_COMPANY)
+            user = User.objects.create_superuser('bench', 'bench@example.com', 'bench', company=company)
+            self.stdout.write('Seeding...')
+            objects = benchmark.seed(
+                company, user, products=options['products'], movements=options['movements'],
+                audit_rows=options['audit_rows'],
+            )
+        else:
+            user = User.objects.get(username='bench')
+            objects = benchmark.objects_for(company, user)
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        dataset = {
+            'products': Product.objects.filter(company=company).count(),
+            'stock_movements': StockMovement.objects.filter(product__company=company).count(),
+            'audit_rows': AuditLog.objects.filter(company=company).count(),
+        }
+        report = benchmark.run(client, objects, repeat=options['repeat'], dataset=dataset)
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+
+    def print_report(self, report):
+        self.stdout.write(', '.join(f'{k}={v}' for k, v in report['dataset'].items()))
+        self.stdout.write(f"{'page':<30}{'status':>7}{'queries':>9}{'budget':>8}{'ms':>9}{'peak KB':>10}")
+        for view in report['views']:
+            line = (
+                f"{view['name']:<30}{view['status']:>7}{view['queries']:>9}{view['budget']:>8}"
+                f"{view['ms']:>9.1f}{view['peak_kb']:>10.1f}"
+            )
+            over = view['queries'] > view['budget'] or view['status'] >= 500
+            self.stdout.write(self.style.ERROR(line) if over else line)
+
+    def compare(self, report, baseline):
+        before = {view['name']: view for view in baseline['views']}
+        regressions = []
+        for view in report['views']:
+            old = before.get(view['name'])
+            if old is None:
+                continue
+            if view['queries'] > old['queries']:
+                regressions.append(f"{view['name']}: {old['queries']} -> {view['queries']} queries")
+            if old['ms'] and view['ms'] > old['ms'] * 1.5:
+                self.stdout.write(self.style.WARNING(f"{view['name']}: {old['ms']} -> {view['ms']} ms"))
+        if regressions:
+            raise CommandError('Query count regressions:\n' + '\n'.join(regressions))
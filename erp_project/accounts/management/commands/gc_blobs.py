@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from accounts.storage import collect_garbage, purge_temp, recount
+
+
+class Command(BaseCommand):
+    help = 'Delete stored files that no record references any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=1.0,
+                            help='Keep unreferenced files touched within this many hours')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the database first')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options['grace_hours'])
+        if options['recount']:
+            fixed = recount()
+            self.stdout.write(f'Corrected {fixed} reference counts')
+        count, freed = collect_garbage(grace=grace, dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} files ({freed} bytes)'))
+        if not options['dry_run']:
+            purge_temp(grace)
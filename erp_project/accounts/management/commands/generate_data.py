@@ -0,0 +1,38 @@
+import time
+from dataclasses import fields
+
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_project.generator import Scale, generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate companies filled with consistent synthetic data for '
+        'capacity testing, one worker process per company.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1)
+        for field in fields(Scale):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default,
+                                help=f'Per company (default {field.default})')
+        parser.add_argument('--workers', type=int, default=1, help='Companies generated in parallel')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['companies'] < 1:
+            raise CommandError('--companies must be at least 1')
+        scale = Scale(**{field.name: options[field.name] for field in fields(Scale)})
+        start = time.perf_counter()
+
+        def progress(company_id, counts):
+            self.stdout.write(f'Company #{company_id}: {sum(counts.values())} rows')
+
+        totals = generate(options['companies'], scale, workers=options['workers'], seed=options['seed'],
+                          on_company=progress)
+        seconds = time.perf_counter() - start
+        for label, count in sorted(totals.items()):
+            self.stdout.write(f'{label:<40}{count:>12}')
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(f'{rows} rows in {seconds:.1f}s ({rows / seconds:.0f} rows/s)'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import purge, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Jobs to run at the same time')
+        parser.add_argument('--processes', action='store_true', help='Use a process pool instead of threads')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls of an empty queue')
+        parser.add_argument('--worker-id', default=None)
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help='Delete completed jobs older than this many days before starting')
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            count = purge(options['purge_days'])
+            self.stdout.write(f'Purged {count} completed jobs')
+        try:
+            total = run_worker(
+                worker_id=options['worker_id'],
+                concurrency=max(options['concurrency'], 1),
+                processes=options['processes'],
+                once=options['once'],
+                poll=options['poll'],
+            )
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} jobs'))
@@ -1,14 +1,36 @@
 import json
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from .utils import log_action
 
 class AuditLogMiddleware:
-    """Log every authenticated request with JSON details."""
+    """Log every authenticated request with JSON details.
+
+    Works in both modes: under ASGI the response is awaited and the log row
+    is written from a worker thread, so async views stay async.
+    """
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         response = self.get_response(request)
+        self.log_request(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self.log_request)(request)
+        return response
+
+    def log_request(self, request):
         user = getattr(request, "user", None)
         if user and user.is_authenticated:
             details = {
@@ -33,4 +55,3 @@ class AuditLogMiddleware:
                 request_type=request.method,
                 company=user.company,
             )
-        return response
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:34
+
+import accounts.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='company',
+            name='letterhead',
+            field=models.FileField(blank=True, null=True, storage=accounts.storage.get_blob_storage, upload_to='letterheads/'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refs', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('touched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refs', 'touched_at'], name='blob_gc_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from .storage import get_blob_storage
 
 
 class Permission(models.Model):
@@ -15,7 +17,7 @@ class Company(models.Model):
     name = models.CharField(max_length=255)
     code = models.CharField(max_length=50, unique=True, blank=True)
     address = models.TextField(blank=True)
-    letterhead = models.FileField(upload_to="letterheads/", null=True, blank=True)
+    letterhead = models.FileField(upload_to="letterheads/", storage=get_blob_storage, null=True, blank=True)
 
     def save(self, *args, **kwargs):
         if not self.code:
@@ -87,3 +89,61 @@ class RolePermission(models.Model):
 
     class Meta:
         unique_together = ('role', 'permission')
+
+
+class Job(models.Model):
+    """Background task stored in the database and run by ``run_jobs``."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class Blob(models.Model):
+    """File stored once by content hash in ``accounts.storage.BlobStorage``.
+
+    ``refs`` counts the model fields currently pointing at ``name``.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refs = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refs', 'touched_at'], name='blob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,223 @@
+"""Content-addressed, deduplicating file storage.
+
+:class:`BlobStorage` stores every upload under the SHA-256 of its bytes,
+``blobs/ab/cd/abcd...<ext>``, so the same photo or PDF uploaded many times
+occupies disk once. Uploads are streamed to a temporary file in chunks while
+being hashed, and never read into memory as a whole.
+
+Each stored file has a :class:`~accounts.models.Blob` row whose ``refs``
+counts the model fields pointing at it. :func:`connect` hooks every
+``FileField`` using this storage, so saving, replacing or deleting a record
+adjusts the count. Blobs with no references are removed by
+:func:`collect_garbage` (``manage.py gc_blobs``) after a grace period, which
+leaves time for an upload to be attached to its record. Writes that bypass
+model signals, such as ``QuerySet.update()``, are corrected by
+:func:`recount`.
+
+Files saved before this storage was introduced keep their old names and are
+served as before; they are not reference counted.
+"""
+
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+GC_GRACE = timedelta(hours=1)
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """File system storage that names files by their content hash."""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen from the content in _save.
+        return name
+
+    def blob_name(self, digest, name):
+        ext = os.path.splitext(name)[1].lower()[:10]
+        return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            digest = digest.hexdigest()
+            final = self.blob_name(digest, name)
+            blob = _touch_blob(digest, final, size)
+            final = blob.name
+            path = self.path(final)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return final
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+blob_storage = BlobStorage()
+
+
+def _touch_blob(digest, name, size):
+    """Return the Blob row for ``digest``, marking it as just used."""
+    from .models import Blob
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            blob, created = Blob.objects.get_or_create(
+                sha256=digest, defaults={'name': name, 'size': size, 'touched_at': now}
+            )
+    except IntegrityError:
+        blob, created = Blob.objects.get(sha256=digest), False
+    if not created:
+        Blob.objects.filter(pk=blob.pk).update(touched_at=now)
+    return blob
+
+
+def _adjust(name, delta):
+    from .models import Blob
+
+    if name and name.startswith(f'{BLOB_DIR}/'):
+        Blob.objects.filter(name=name).update(refs=F('refs') + delta, touched_at=timezone.now())
+
+
+def _value(instance, attname):
+    value = instance.__dict__.get(attname)
+    return getattr(value, 'name', value) or None
+
+
+def tracked_fields():
+    """Return ``[(model, field)]`` for every file field using BlobStorage."""
+    from django.apps import apps
+    from django.db.models import FileField
+
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, BlobStorage)
+    ]
+
+
+def connect():
+    by_model = {}
+    for model, field in tracked_fields():
+        by_model.setdefault(model, []).append(field.attname)
+    for model, attnames in by_model.items():
+        def remember(sender, instance, attnames=attnames, **kwargs):
+            instance._blob_names = {a: _value(instance, a) for a in attnames}
+
+        def saved(sender, instance, attnames=attnames, **kwargs):
+            previous = getattr(instance, '_blob_names', {})
+            for attname in attnames:
+                old, new = previous.get(attname), _value(instance, attname)
+                if old != new:
+                    _adjust(new, 1)
+                    _adjust(old, -1)
+            instance._blob_names = {a: _value(instance, a) for a in attnames}
+
+        def deleted(sender, instance, attnames=attnames, **kwargs):
+            for attname in attnames:
+                _adjust(getattr(instance, '_blob_names', {}).get(attname), -1)
+
+        uid = f'blob_refs_{model._meta.label_lower}'
+        post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+        post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def recount():
+    """Recompute ``refs`` for every blob from the tracked fields. Returns rows fixed."""
+    from .models import Blob
+
+    counts = {}
+    for model, field in tracked_fields():
+        rows = (
+            model._default_manager.filter(**{f'{field.attname}__startswith': f'{BLOB_DIR}/'})
+            .values_list(field.attname).annotate(n=Count('pk')).order_by()
+        )
+        for name, n in rows:
+            counts[name] = counts.get(name, 0) + n
+    fixed = 0
+    for pk, name, refs in Blob.objects.values_list('pk', 'name', 'refs').iterator():
+        actual = counts.get(name, 0)
+        if refs != actual:
+            fixed += Blob.objects.filter(pk=pk).update(refs=actual)
+    return fixed
+
+
+def collect_garbage(grace=GC_GRACE, dry_run=False, now=None):
+    """Delete unreferenced blobs untouched for ``grace``. Returns ``(count, bytes)``."""
+    from .models import Blob
+
+    cutoff = (now or timezone.now()) - grace
+    count = freed = 0
+    candidates = Blob.objects.filter(refs__lte=0, touched_at__lt=cutoff)
+    for blob in candidates.iterator():
+        if dry_run:
+            count += 1
+            freed += blob.size
+            continue
+        # Conditional delete: a concurrent upload or save may have just
+        # touched the blob again.
+        deleted, _ = Blob.objects.filter(pk=blob.pk, refs__lte=0, touched_at__lt=cutoff).delete()
+        if not deleted:
+            continue
+        path = blob_storage.path(blob.name)
+        trash = f'{path}.{uuid.uuid4().hex}.trash'
+        try:
+            os.replace(path, trash)
+        except FileNotFoundError:
+            continue
+        if Blob.objects.filter(sha256=blob.sha256).exists():
+            # Re-uploaded meanwhile; the content is identical, put it back.
+            os.replace(trash, path)
+            continue
+        os.remove(trash)
+        count += 1
+        freed += blob.size
+    return count, freed
+
+
+def purge_temp(grace=GC_GRACE, now=None):
+    """Remove temporary upload files left behind by crashed processes."""
+    tmp_dir = blob_storage.path(f'{BLOB_DIR}/tmp')
+    if not os.path.isdir(tmp_dir):
+        return 0
+    cutoff = ((now or timezone.now()) - grace).timestamp()
+    removed = 0
+    for entry in os.scandir(tmp_dir):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    return removed
@@ -0,0 +1,9 @@
+from django.core.mail import send_mail
+
+from .jobs import task
+
+
+@task('send_mail')
+def send_mail_task(subject, message, recipient_list, from_email=None):
+    # Raise on delivery errors so the job is retried.
+    send_mail(subject, message, from_email, recipient_list, fail_silently=False)
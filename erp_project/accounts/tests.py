@@ -1,8 +1,10 @@
+import json
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import connections
 from django.core.files.uploadedfile import SimpleUploadedFile
-from unittest import mock
+from unittest import mock, skipUnless
 from .models import Company, Role, UserRole, Permission, AuditLog
 from .utils import log_action
 
@@ -585,6 +587,12 @@ class AuditLogDetailTests(TestCase):
         resp = self.client.get(reverse('audit_log_detail', args=[self.log2.id]))
         self.assertEqual(resp.status_code, 403)
 
+    def test_detail_requires_permission(self):
+        User.objects.create_user(username='d3', password='pass', company=self.company1)
+        self.client.login(username='d3', password='pass')
+        resp = self.client.get(reverse('audit_log_detail', args=[self.log1.id]))
+        self.assertEqual(resp.status_code, 403)
+
 
 class UserListFeatureTests(TestCase):
     def setUp(self):
@@ -681,3 +689,441 @@ class TemplatePermissionFilterTests(TestCase):
 
 
 
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        from . import jobs
+
+        self.jobs = jobs
+        self.calls = []
+
+        @jobs.task('test_flaky')
+        def flaky(fail_times):
+            self.calls.append(fail_times)
+            if len(self.calls) <= fail_times:
+                raise RuntimeError('boom')
+
+    def test_mail_is_sent_by_worker(self):
+        from django.core import mail
+        from .models import Job
+
+        job = self.jobs.enqueue_mail('Hello', 'Body', ['a@example.com', None])
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(len(mail.outbox), 0)
+        with self.settings(DEFAULT_FROM_EMAIL='erp@example.org'):
+            self.assertEqual(self.jobs.run_worker(once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(mail.outbox[0].to, ['a@example.com'])
+        self.assertEqual(mail.outbox[0].from_email, 'erp@example.org')
+        self.assertIsNone(self.jobs.enqueue_mail('Hello', 'Body', ['']))
+
+    def test_retry_with_backoff_then_fail(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Job
+
+        job = self.jobs.enqueue('test_flaky', max_attempts=2, fail_times=5)
+        self.jobs.run_worker(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        # Not due yet, so a second pass does nothing.
+        self.assertEqual(self.jobs.run_worker(once=True), 0)
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(self.jobs.claim('w1', now=later), [job.pk])
+        self.assertEqual(self.jobs.claim('w2', now=later), [])
+        self.assertEqual(self.jobs.run_job(job.pk), Job.FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_eager_mode_and_stale_requeue(self):
+        from datetime import timedelta
+        from django.test import override_settings
+        from django.utils import timezone
+        from .models import Job
+
+        with override_settings(JOBS_EAGER=True):
+            job = self.jobs.enqueue('test_flaky', fail_times=0)
+        self.assertEqual(job.status, Job.DONE)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, locked_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(self.jobs.requeue_stale(timeout=60), 1)
+        with self.assertRaises(self.jobs.UnknownTask):
+            self.jobs.enqueue('no_such_task')
+
+
+class BlobStorageTests(TestCase):
+    def test_dedup_refcount_and_gc(self):
+        import os
+        from datetime import timedelta
+        from django.core.files.base import ContentFile
+        from django.utils import timezone
+        from .models import Blob
+        from .storage import blob_storage, collect_garbage, recount
+
+        a = Company.objects.create(name='BlobA', code='BA1')
+        b = Company.objects.create(name='BlobB', code='BB1')
+        a.letterhead.save('head.png', ContentFile(b'same-bytes'))
+        b.letterhead.save('other.PNG', ContentFile(b'same-bytes'))
+        self.assertEqual(a.letterhead.name, b.letterhead.name)
+        self.assertTrue(a.letterhead.name.startswith('blobs/'))
+        self.assertTrue(a.letterhead.name.endswith('.png'))
+        blob = Blob.objects.get(name=a.letterhead.name)
+        self.assertEqual((blob.refs, blob.size), (2, 10))
+        with Company.objects.get(pk=a.pk).letterhead.open('rb') as fh:
+            self.assertEqual(fh.read(), b'same-bytes')
+
+        b.letterhead.save('new.png', ContentFile(b'new-bytes'))
+        blob.refresh_from_db()
+        self.assertEqual(blob.refs, 1)
+        Company.objects.get(pk=a.pk).delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refs, 0)
+
+        path = blob_storage.path(blob.name)
+        self.assertEqual(collect_garbage(), (0, 0))  # still within the grace period
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(collect_garbage(now=later, dry_run=True), (1, 10))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(collect_garbage(now=later), (1, 10))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+
+        Blob.objects.filter(name=b.letterhead.name).update(refs=7)
+        self.assertEqual(recount(), 1)
+        self.assertEqual(Blob.objects.get(name=b.letterhead.name).refs, 1)
+
+
+class DatabaseConfigTests(TestCase):
+    def test_profiles_from_environment(self):
+        from pathlib import Path
+        from django.core.exceptions import ImproperlyConfigured
+        from erp_project.database import database_config
+        sqlite = database_config({}, Path('/srv'))
+        self.assertEqual(sqlite['default']['NAME'], Path('/srv/db.sqlite3'))
+        self.assertNotIn('replica', sqlite)
+
+        env = {
+            'DB_ENGINE': 'postgres', 'DB_NAME': 'erp', 'DB_HOST': 'db1', 'DB_CONN_MAX_AGE': '300',
+            'DB_REPLICA_HOST': 'db2', 'DB_REPLICA_USER': 'reader',
+        }
+        pg = database_config(env, Path('/srv'))
+        default, replica = pg['default'], pg['replica']
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((default['HOST'], default['CONN_MAX_AGE']), ('db1', 300))
+        self.assertFalse(default['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(default['TEST'], {'NAME': 'test_erp'})
+        self.assertEqual((replica['HOST'], replica['USER'], replica['NAME']), ('db2', 'reader', 'erp'))
+        self.assertEqual(replica['TEST'], {'MIRROR': 'default'})
+
+        pooled = database_config({**env, 'DB_POOL': '1', 'DB_POOL_MAX_SIZE': '20'}, Path('/srv'))['default']
+        self.assertEqual(pooled['OPTIONS']['pool'], {'min_size': 2, 'max_size': 20})
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        with self.assertRaises(ImproperlyConfigured):
+            database_config({'DB_ENGINE': 'oracle'}, Path('/srv'))
+
+    def test_sqlite_concurrency_settings(self):
+        from pathlib import Path
+        from django.db import connection
+        from django.test import override_settings
+        from erp_project.database import database_config
+        from . import utils
+        options = database_config({'DB_SQLITE_BUSY_TIMEOUT': '5'}, Path('/srv'))['default']['OPTIONS']
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(options['timeout'], 5.0)
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'].split(';'))
+        self.assertEqual(database_config({'DB_SQLITE_TUNING': '0'}, Path('/srv'))['default']['OPTIONS'], {})
+
+        # The test transaction may hold the database lock: never wait inside it.
+        with utils.serialized_write(AuditLog):
+            self.assertFalse(utils._write_lock.locked())
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            with utils.serialized_write(AuditLog):
+                self.assertTrue(utils._write_lock.locked())
+            with override_settings(SQLITE_WRITE_LOCK=False), utils.serialized_write(AuditLog):
+                self.assertFalse(utils._write_lock.locked())
+        self.assertFalse(utils._write_lock.locked())
+
+    def test_list_views_route_reads_to_replica(self):
+        from erp_project import routers
+        router = routers.ReplicaRouter()
+        with routers.replica_reads(), mock.patch.dict(connections.settings):
+            connections.settings.pop('replica', None)
+            self.assertIsNone(router.db_for_read(User))
+            with mock.patch.dict(connections.settings, {'replica': connections.settings['default']}):
+                self.assertEqual(router.db_for_read(User), 'replica')
+                self.assertEqual(router.db_for_write(User), 'default')
+                self.assertFalse(router.allow_migrate('replica', 'accounts'))
+
+        company = Company.objects.create(name='ReplicaCo', code='RC')
+        User.objects.create_superuser(username='root', password='pass', email='r@rc.com', company=company)
+        self.client.login(username='root', password='pass')
+        routed = []
+
+        def spy(self, model, **hints):
+            routed.append(routers._use_replica.get())
+
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read', spy):
+            self.client.get(reverse('user_list', args=[company.pk]))
+            self.assertTrue(any(routed))
+            self.assertFalse(routers._use_replica.get())
+            routed.clear()
+            self.client.get(reverse('dashboard'))
+            self.client.post(reverse('role_add'), {'name': 'Clerk'})
+            self.assertTrue(routed)
+            self.assertFalse(any(routed))
+
+
+class AsyncEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from inventory.models import Product, ProductUnit
+        cls.company = Company.objects.create(name='AsyncCo', code='AC')
+        cls.user = User.objects.create_user(username='clerk', password='pass', company=cls.company)
+        role = Role.objects.create(name='Clerk', company=cls.company)
+        role.permissions.add(Permission.objects.get_or_create(codename='view_product')[0])
+        UserRole.objects.create(user=cls.user, role=role, company=cls.company)
+        unit = ProductUnit.objects.create(code='BX', name='Box')
+        Product.objects.create(name='Widget', barcode='555', unit=unit, company=cls.company)
+
+    async def test_search_scan_and_audit_under_asgi(self):
+        from asgiref.sync import iscoroutinefunction
+        from inventory.views import ProductSearchView
+        from pos.views import pos_scan
+        self.assertTrue(iscoroutinefunction(ProductSearchView.as_view()))
+        self.assertTrue(iscoroutinefunction(pos_scan))
+
+        resp = await self.async_client.get(reverse('product_search'), {'q': 'Wid'})
+        self.assertEqual(resp.status_code, 302)
+        await self.async_client.aforce_login(self.user)
+        resp = await self.async_client.get(reverse('product_search'), {'q': 'Wid'})
+        self.assertEqual(resp.json()['results'][0]['unit'], 'Box')
+        resp = await self.async_client.get(reverse('whoami'))
+        self.assertEqual(resp.json(), {'username': 'clerk', 'company': 'AsyncCo', 'roles': ['Clerk']})
+        resp = await self.async_client.post(reverse('pos_scan'), {'code': '555'})
+        self.assertContains(resp, 'Found: Widget')
+        logged = AuditLog.objects.filter(actor=self.user, action='request', company=self.company)
+        self.assertEqual(await logged.acount(), 3)
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from erp_project import benchmark
+        company = Company.objects.create(name='BudgetCo', code='BC')
+        cls.user = User.objects.create_superuser(username='root', password='pass', email='r@bc.com', company=company)
+        cls.objects = benchmark.seed(company, cls.user, products=40, movements=200, audit_rows=200, batch_size=100)
+
+    def test_every_page_stays_within_its_query_budget(self):
+        from erp_project import benchmark
+        self.client.force_login(self.user)
+        urls = dict(benchmark.view_urls(self.objects))
+        self.assertIn('product_detail', urls)
+        self.assertIn('goods_receipt_add', urls)
+        for name, url in urls.items():
+            with self.subTest(name):
+                self.client.get(url)
+                response, queries = benchmark.capture(self.client, url)
+                self.assertLess(response.status_code, 500)
+                self.assertLessEqual(len(queries), benchmark.budget(name), [q['sql'] for q in queries])
+
+    def test_measure_reports_time_memory_and_size(self):
+        from erp_project import benchmark
+        self.client.force_login(self.user)
+        result = benchmark.measure(self.client, reverse('product_list'), repeat=1)
+        self.assertEqual(result['status'], 200)
+        self.assertGreater(result['queries'], 0)
+        self.assertGreater(result['peak_kb'], 0)
+        self.assertGreater(result['bytes'], 0)
+
+
+class GeneratorTests(TestCase):
+    def test_generated_companies_are_consistent(self):
+        from django.db.models import F, Sum
+        from erp_project.generator import Scale, generate
+        from inventory.models import Product, StockLot
+        from inventory.stock import stock_levels
+        from ledger.models import LedgerLine
+        from purchasing.models import ApprovalQueueCount, ApprovalTask, PurchaseOrder
+        scale = Scale(users=3, products=30, warehouses=2, suppliers=3, items=2, orders=12,
+                      movements=200, requisitions=10, batch_size=50)
+        totals = generate(2, scale, seed=1)
+        companies = list(Company.objects.filter(code__startswith='G').order_by('code'))
+        self.assertEqual([c.code for c in companies], ['G00001', 'G00002'])
+        self.assertEqual(totals['inventory.Product'], 60)
+        for company in companies:
+            with self.subTest(company.code):
+                skus = Product.objects.filter(company=company).values_list('sku', flat=True)
+                self.assertTrue(all(sku.startswith(f'{company.code}-') for sku in skus))
+                self.assertTrue(PurchaseOrder.objects.filter(company=company, order_number=f'{company.code}-PO000001').exists())
+                sums = LedgerLine.objects.filter(entry__company=company).aggregate(d=Sum('debit'), c=Sum('credit'))
+                self.assertGreater(sums['d'], 0)
+                self.assertEqual(sums['d'], sums['c'])
+                self.assertGreaterEqual(min(stock_levels(company).values()), 0)
+                self.assertFalse(StockLot.objects.filter(product__company=company, consumed_qty__gt=F('qty')).exists())
+                pending = ApprovalTask.objects.filter(company=company, status=ApprovalTask.PENDING).count()
+                counted = ApprovalQueueCount.objects.filter(company=company).aggregate(n=Sum('pending'))['n'] or 0
+                self.assertEqual(pending, counted)
+
+
+@override_settings(PERF_PROFILING={'enabled': True, 'sample_rate': 1.0})
+class ProfilingTests(TestCase):
+    def setUp(self):
+        from erp_project import profiling
+        profiling.clear()
+        self.addCleanup(profiling.clear)
+        self.company = Company.objects.create(name='ProfCo', code='PF')
+        self.admin = User.objects.create_superuser(username='root', password='pass', company=self.company)
+        self.client.force_login(self.admin)
+
+    def test_sampled_request_is_recorded_and_logged(self):
+        from erp_project import profiling
+        with self.assertLogs('erp_project.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('audit_log_list'))
+        record = profiling.records()[-1]
+        self.assertEqual(record['view'], 'audit_log_list')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['bytes'], len(response.content))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['path'], reverse('audit_log_list'))
+
+    def test_repeated_statements_count_as_duplicates(self):
+        from erp_project import profiling
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        profile = profiling.Profile()
+        for _ in range(3):
+            profile.add_query('SELECT * FROM product WHERE id = %s', 0.002)
+        profile.add_query('SELECT * FROM lot WHERE id IN (%s, %s)', 0.001)
+        profile.add_query('SELECT * FROM lot WHERE id IN (%s, %s, %s)', 0.001)
+        record = profiling.build_record(RequestFactory().get('/x/'), HttpResponse('ok'), profile)
+        self.assertEqual(record['queries'], 5)
+        self.assertEqual(record['duplicates'], 3)
+        self.assertEqual(record['top_queries'][0], {'sql': 'SELECT * FROM product WHERE id = %s', 'runs': 3, 'ms': 6.0})
+
+    def test_unsampled_requests_are_not_recorded(self):
+        from erp_project import profiling
+        with self.settings(PERF_PROFILING={'enabled': True, 'sample_rate': 0}):
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(profiling.records(), [])
+
+    def test_performance_page_is_superuser_only(self):
+        with self.assertLogs('erp_project.profiling', 'INFO') as logs:
+            self.client.get(reverse('audit_log_list'))
+            response = self.client.get(reverse('performance'))
+            self.assertContains(response, 'audit_log_list')
+            User.objects.create_user(username='clerk', password='pass', company=self.company)
+            self.client.force_login(User.objects.get(username='clerk'))
+            self.assertEqual(self.client.get(reverse('performance')).status_code, 403)
+        self.assertEqual([json.loads(r.getMessage())['status'] for r in logs.records], [200, 200, 403])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='MetricCo', code='MT')
+        self.admin = User.objects.create_superuser(username='root', password='pass', company=self.company)
+
+    def test_requests_are_exposed_by_url_name(self):
+        from erp_project import metrics
+        self.client.force_login(self.admin)
+        before = metrics.REQUESTS.value(view='audit_log_list', method='GET', status=200)
+        self.client.get(reverse('audit_log_list'))
+        self.assertEqual(metrics.REQUESTS.value(view='audit_log_list', method='GET', status=200), before + 1)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE erp_http_request_duration_seconds histogram', body)
+        self.assertIn('erp_http_request_duration_seconds_bucket{view="audit_log_list",method="GET",le="+Inf"}', body)
+        self.assertIn('erp_http_request_queries_count{view="audit_log_list"}', body)
+        self.assertIn('erp_audit_log_queue_depth 0', body)
+
+    def test_endpoint_needs_superuser_or_token(self):
+        with self.settings(METRICS={'token': 'scrape-me'}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertEqual(response.status_code, 200)
+        with self.settings(METRICS={'enabled': False}):
+            self.client.force_login(self.admin)
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_hooks_count_postings_audit_writes_and_stock_timings(self):
+        from erp_project import metrics
+        from inventory.stock import stock_levels
+        from ledger.models import LedgerAccount
+        from ledger.utils import post_entry
+        for code in ('Inventory', 'Supplier'):
+            LedgerAccount.objects.create(code=code, name=code, company=self.company)
+        postings = metrics.LEDGER_POSTINGS.value()
+        writes = metrics.AUDIT_WRITES.value()
+        timings = metrics.STOCK_SECONDS.value(function='stock_levels') or [0]
+        post_entry(self.company, 'GRN', [('Inventory', 10, 0), ('Supplier', 0, 10)])
+        log_action(self.admin, 'test')
+        stock_levels(self.company)
+        self.assertEqual(metrics.LEDGER_POSTINGS.value(), postings + 1)
+        self.assertEqual(metrics.AUDIT_WRITES.value(), writes + 1)
+        self.assertEqual(metrics.AUDIT_QUEUE.value(), 0)
+        self.assertEqual(metrics.STOCK_SECONDS.value(function='stock_levels')[-1], timings[-1] + 1)
+
+    def test_worker_files_are_merged(self):
+        import os
+        import tempfile
+        from pathlib import Path
+        from erp_project import metrics
+        worker = {'erp_supplier_otp_issued_total': [[[], 2]], 'erp_audit_log_queue_depth': [[[], 3]]}
+        with tempfile.TemporaryDirectory() as tmp, self.settings(METRICS={'dir': tmp}):
+            own = metrics.OTP_ISSUED.value()
+            metrics.flush()
+            self.assertTrue((Path(tmp) / f'{os.getpid()}.json').exists())
+            (Path(tmp) / f'{os.getppid()}.json').write_text(json.dumps(worker))
+            (Path(tmp) / '999999999.json').write_text(json.dumps(worker))
+            merged = metrics.collect()
+            # The exited worker is folded into the dead-process file once.
+            self.assertFalse((Path(tmp) / '999999999.json').exists())
+            self.assertEqual(json.loads((Path(tmp) / 'dead.json').read_text()),
+                             {'erp_supplier_otp_issued_total': [[[], 2]]})
+            self.assertEqual(metrics.collect(), merged)
+        self.assertEqual(merged['erp_supplier_otp_issued_total'][()], own + 4)
+        # Gauges of exited workers are dropped, counters are kept.
+        self.assertEqual(merged['erp_audit_log_queue_depth'][()], metrics.AUDIT_QUEUE.value() + 3)
+
+    def test_reused_pid_folds_the_previous_file(self):
+        import os
+        import tempfile
+        from pathlib import Path
+        from unittest import mock
+        from erp_project import metrics
+        previous = {'erp_ledger_postings_total': [[[], 5]]}
+        with tempfile.TemporaryDirectory() as tmp, self.settings(METRICS={'dir': tmp}), \
+                mock.patch.object(metrics, '_claimed', False):
+            (Path(tmp) / f'{os.getpid()}.json').write_text(json.dumps(previous))
+            metrics.flush()
+            self.assertEqual(json.loads((Path(tmp) / 'dead.json').read_text()), previous)
+            merged = metrics.collect()
+        self.assertEqual(merged['erp_ledger_postings_total'][()], metrics.LEDGER_POSTINGS.value() + 5)
+
+
+@skipUnless('replica' in connections.settings, 'set DB_REPLICA_NAME or DB_REPLICA_HOST to test a replica')
+class ReplicaDatabaseTests(TransactionTestCase):
+    # Committed rows are visible to the replica connection, which mirrors
+    # the test database.
+    databases = '__all__'
+    serialized_rollback = True
+
+    def test_list_page_reads_from_replica(self):
+        from django.test.utils import CaptureQueriesContext
+        company = Company.objects.create(name='MirrorCo', code='MC')
+        User.objects.create_superuser(username='root', password='pass', email='r@mc.com', company=company)
+        self.client.login(username='root', password='pass')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            resp = self.client.get(reverse('user_list', args=[company.pk]), {'q': 'roo'})
+        self.assertContains(resp, 'r@mc.com')
+        self.assertTrue(any('accounts_user' in q['sql'] for q in replica.captured_queries))
+        self.assertFalse(any('django_session' in q['sql'] for q in replica.captured_queries))
+        self.assertTrue(AuditLog.objects.using('default').filter(action='request').exists())
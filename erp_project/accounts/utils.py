@@ -1,10 +1,19 @@
+from contextlib import contextmanager
 from functools import wraps
 import json
+import threading
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections, router
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Permission
 from django.db.models import Q
 from django.core.paginator import Paginator
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from .exports import EXPORT_FORMATS
+from erp_project import metrics
 
 
 def require_permission(codename=None, allow_self=False):
@@ -12,38 +21,56 @@ def require_permission(codename=None, allow_self=False):
 
     If ``allow_self`` is True, the view is allowed when the target ``pk`` in the
     URL matches the logged-in user's id.
-    ``codename`` is auto-created if missing.
+    ``codename`` is auto-created if missing. ``async def`` views stay async;
+    the check itself runs in a worker thread.
     """
 
-    def decorator(view_func):
-        @wraps(view_func)
-        @login_required
-        def _wrapped(request, *args, **kwargs):
-            if request.user.is_superuser:
-                return view_func(request, *args, **kwargs)
-
-            if allow_self:
-                target_pk = kwargs.get("pk")
-                if target_pk and int(target_pk) == request.user.pk:
-                    return view_func(request, *args, **kwargs)
-
-            if codename:
-                perm_obj, _ = Permission.objects.get_or_create(
-                    codename=codename,
-                    defaults={"description": codename},
-                )
-                has_perm = request.user.userrole_set.filter(
-                    role__permissions=perm_obj,
-                    company=request.user.company,
-                ).exists()
-                if has_perm:
-                    return view_func(request, *args, **kwargs)
+    def denied(request, kwargs):
+        """Return the 403 response, or ``None`` when the view may run."""
+        if request.user.is_superuser:
+            return None
+
+        if allow_self:
+            target_pk = kwargs.get("pk")
+            if target_pk and int(target_pk) == request.user.pk:
+                return None
+
+        if codename:
+            perm_obj, _ = Permission.objects.get_or_create(
+                codename=codename,
+                defaults={"description": codename},
+            )
+            has_perm = request.user.userrole_set.filter(
+                role__permissions=perm_obj,
+                company=request.user.company,
+            ).exists()
+            if not has_perm:
                 return render(
                     request,
                     "403.html",
                     {"missing_permission": codename},
                     status=403,
                 )
+        return None
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            @login_required
+            async def _awrapped(request, *args, **kwargs):
+                response = await sync_to_async(denied)(request, kwargs)
+                if response is not None:
+                    return response
+                return await view_func(request, *args, **kwargs)
+
+            return _awrapped
+
+        @wraps(view_func)
+        @login_required
+        def _wrapped(request, *args, **kwargs):
+            response = denied(request, kwargs)
+            if response is not None:
+                return response
             return view_func(request, *args, **kwargs)
 
         return _wrapped
@@ -51,6 +78,21 @@ def require_permission(codename=None, allow_self=False):
     return decorator
 
 
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """``LoginRequiredMixin`` for views whose handlers are ``async def``.
+
+    The user is loaded with ``request.auser()`` and stored on
+    ``request.user``. Its relations are not loaded, so handlers should use
+    ids such as ``request.user.company_id``.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
 def user_has_permission(user, codename):
     """Check if ``user`` has the custom permission ``codename``."""
     if user.is_superuser:
@@ -62,6 +104,32 @@ def user_has_permission(user, codename):
     return user.userrole_set.filter(role__permissions=perm, company=user.company).exists()
 
 
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def serialized_write(model):
+    """Let one thread at a time write ``model`` on SQLite.
+
+    SQLite has a single writer, so threads inserting into hot append-only
+    tables such as the audit log queue here instead of piling up on the
+    database lock and timing out. Other databases, or
+    ``SQLITE_WRITE_LOCK = False``, skip the lock. So does a write inside
+    ``atomic()``: the transaction may already hold the database lock, and
+    waiting here for a thread that waits on it would deadlock.
+    """
+    connection = connections[router.db_for_write(model)]
+    if (
+        connection.vendor != "sqlite"
+        or connection.in_atomic_block
+        or not getattr(settings, "SQLITE_WRITE_LOCK", True)
+    ):
+        yield
+        return
+    with _write_lock:
+        yield
+
+
 def log_action(actor, action, target=None, details="", request_type=None, company=None):
     """Create an AuditLog entry.
 
@@ -70,29 +138,42 @@ def log_action(actor, action, target=None, details="", request_type=None, compan
     from .models import AuditLog
     if isinstance(details, dict):
         details = json.dumps(details)
-    AuditLog.objects.create(
-        actor=actor,
-        action=action,
-        target_user=target,
-        details=details,
-        request_type=request_type,
-        company=company or getattr(actor, "company", None),
-    )
+    with metrics.AUDIT_QUEUE.track(), serialized_write(AuditLog):
+        AuditLog.objects.create(
+            actor=actor,
+            action=action,
+            target_user=target,
+            details=details,
+            request_type=request_type,
+            company=company or getattr(actor, "company", None),
+        )
+    metrics.AUDIT_WRITES.inc()
 
 
 class AdvancedListMixin:
-    """Mixin providing search, sort and pagination helpers."""
+    """Mixin providing search, sort, pagination and export helpers.
+
+    Setting ``export_fields`` to a list of ``values_list`` lookups enables
+    ``?export=<format>`` on the view. Exports reuse the current search, filter
+    and sort parameters and stream rows in chunks of ``export_chunk_size``
+    (through a server-side cursor on PostgreSQL). List pages read from the
+    read replica when one is configured.
+    """
 
+    read_replica = True
     model = None
     search_fields = []
     filter_fields = []
     default_sort = "id"
     paginate_by = 10
+    export_fields = []
+    export_chunk_size = 2000
 
     def base_queryset(self):
         return self.model.objects.all()
 
-    def get_queryset(self):
+    def filtered_queryset(self):
+        """Return the queryset with search, filters and sorting applied."""
         qs = self.base_queryset()
         q = self.request.GET.get("q", "").strip()
         if q and self.search_fields:
@@ -105,11 +186,47 @@ class AdvancedListMixin:
             if val not in (None, ""):
                 qs = qs.filter(**{f: val})
         sort = self.request.GET.get("sort", self.default_sort)
-        qs = qs.order_by(sort)
-        paginator = Paginator(qs, self.paginate_by)
+        return qs.order_by(sort)
+
+    def get_queryset(self):
+        paginator = Paginator(self.filtered_queryset(), self.paginate_by)
         page = self.request.GET.get("page")
         return paginator.get_page(page)
 
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get("export")
+        if fmt and self.export_fields:
+            return self.export_response(fmt)
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["export_formats"] = list(EXPORT_FORMATS) if self.export_fields else []
+        return context
+
+    def export_rows(self):
+        """Yield row tuples for the export without caching the queryset."""
+        qs = self.filtered_queryset().values_list(*self.export_fields)
+        return qs.iterator(chunk_size=self.export_chunk_size)
+
+    def export_response(self, fmt):
+        if fmt not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Unknown export format")
+        writer, content_type, ext = EXPORT_FORMATS[fmt]
+        response = StreamingHttpResponse(
+            writer(self.export_fields, self.export_rows()),
+            content_type=content_type,
+        )
+        name = self.model._meta.model_name
+        response["Content-Disposition"] = f'attachment; filename="{name}s.{ext}"'
+        log_action(
+            self.request.user,
+            "export",
+            details={"model": name, "format": fmt, "query": self.request.GET.dict()},
+            request_type=self.request.method,
+        )
+        return response
+
     def query_string(self):
         """Return current query string without the page parameter."""
         qd = self.request.GET.copy()
@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
@@ -5,13 +6,18 @@ from django.views.generic import CreateView, TemplateView
 from .models import Company
 import json
 from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import method_decorator
 from .utils import (
     require_permission,
     log_action,
     user_has_permission,
     AdvancedListMixin,
+    AsyncLoginRequiredMixin,
 )
+from purchasing.pipeline import dashboard_metrics
+from erp_project import metrics, profiling
 
 class SuperuserRequiredMixin(UserPassesTestMixin):
     def test_func(self):
@@ -67,6 +73,12 @@ class CompanyListView(LoginRequiredMixin, SuperuserRequiredMixin, AdvancedListMi
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.user.company:
+            context['pipeline'] = dashboard_metrics(self.request.user.company)
+        return context
+
 class CustomLoginView(LoginView):
     template_name = 'login.html'
 
@@ -370,16 +382,23 @@ def change_password_view(request, pk):
     context = {'target': target, 'error': error, 'require_current': require_current}
     return render(request, 'change_password_form.html', context)
 
-class WhoAmIView(LoginRequiredMixin, View):
-    def get(self, request):
-        roles = list(request.user.userrole_set.values_list('role__name', flat=True))
-        company = request.user.company.name if request.user.company else None
+class WhoAmIView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
+        roles = [name async for name in request.user.userrole_set.values_list('role__name', flat=True)]
+        company = await Company.objects.filter(pk=request.user.company_id).values_list('name', flat=True).afirst()
         return JsonResponse({'username': request.user.username, 'company': company, 'roles': roles})
 
-class DashboardAPI(LoginRequiredMixin, View):
-    def get(self, request):
-        company = request.user.company.name if request.user.company else None
-        return JsonResponse({'username': request.user.username, 'company': company})
+class DashboardAPI(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
+        company = await Company.objects.filter(pk=request.user.company_id).afirst()
+        data = {'username': request.user.username, 'company': company.name if company else None}
+        if company:
+            pipeline = await sync_to_async(dashboard_metrics)(company)
+            data['pipeline'] = {
+                key: {'count': m.count, 'amount': str(m.amount), 'data': m.data, 'updated_at': m.updated_at}
+                for key, m in pipeline.items()
+            }
+        return JsonResponse(data)
 
 @method_decorator(require_permission('view_role'), name='dispatch')
 class RoleListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
@@ -537,6 +556,34 @@ class AuditLogListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
         return context
 
 
+class PerformanceView(LoginRequiredMixin, SuperuserRequiredMixin, TemplateView):
+    """Slowest endpoints and worst queries from this process's profiling buffer."""
+
+    template_name = 'performance.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        config = profiling._config()
+        context['enabled'] = config['enabled']
+        context['sample_rate'] = config['sample_rate']
+        context['recorded'] = len(profiling.records())
+        context['endpoints'] = profiling.slowest_endpoints()
+        context['queries'] = profiling.worst_queries()
+        return context
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for superusers or the ``METRICS`` token."""
+    config = metrics._config()
+    if not config['enabled']:
+        raise Http404
+    token = config['token']
+    sent = request.headers.get('Authorization', '')
+    if not (request.user.is_superuser or (token and constant_time_compare(sent, f'Bearer {token}'))):
+        raise PermissionDenied
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
+
 @method_decorator(require_permission('view_auditlog'), name='dispatch')
 class AuditLogDetailView(LoginRequiredMixin, TemplateView):
     """Display a single audit log entry with parsed JSON details."""
@@ -0,0 +1,323 @@
+"""Query-count, latency and memory benchmarks for every page.
+
+:func:`seed` fills one company with realistic volumes: products in a
+category tree, stock lots and movements, audit rows, and a few of each
+purchasing document so every detail page has something to show. Master
+data comes from the ``build_*`` helpers of :mod:`erp_project.generator`.
+Volume tables are written with ``bulk_create``. Documents go through
+``create`` and the approval engine, like the views do.
+
+:func:`view_urls` lists a GET URL for each named pattern of
+``erp_project.urls``, which includes the inventory and purchasing URLs.
+Arguments are filled from the seeded objects. :func:`measure` requests one
+URL and records its status, query count, median and worst time, peak
+Python memory and response size. :func:`run` builds the JSON report that
+``bench_views`` writes.
+
+``DEFAULT_QUERY_BUDGET`` (or an entry in ``QUERY_BUDGETS``) caps the
+queries each page may run. The caps hold for a superuser whatever the data
+volume. The test seed fills every list page, so a query per row on a list
+page breaks the budget tests.
+"""
+
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from . import generator
+
+DEFAULT_QUERY_BUDGET = 12
+# Pages that legitimately need more queries than the default.
+QUERY_BUDGETS = {}
+
+# Named patterns whose GET changes state.
+SKIP = {'logout'}
+
+# url name prefix -> seeded object used for ``pk``; longest prefix wins
+PK_OBJECTS = {
+    'company_': 'company',
+    'user_': 'user',
+    'role_': 'role',
+    'audit_log_': 'audit_log',
+    'warehouse_': 'warehouse',
+    'category_': 'category',
+    'product_image_': 'product_image',
+    'product_': 'product',
+    'supplier_': 'supplier',
+    'purchase_order_': 'purchase_order',
+    'invoice_': 'invoice',
+    'payment_': 'payment',
+    'requisition_': 'requisition',
+    'service_': 'service_item',
+    'office_supply_': 'office_supply_item',
+    'asset_item_': 'asset_item',
+    'it_item_': 'it_item',
+}
+KWARG_OBJECTS = {
+    'company_id': 'company',
+    'supplier_id': 'supplier',
+    'po_id': 'purchase_order',
+}
+LINE_OBJECTS = {
+    'goods_receipt_add': 'purchase_order_line',
+    'quotation_select': 'quotation_line',
+}
+
+AUDIT_ACTIONS = ('request', 'login', 'create_product', 'create_quotation', 'user_update', 'stock_move')
+
+
+def seed(company, user, products=2000, movements=200000, audit_rows=200000, batch_size=5000, seed_value=0):
+    """Fill ``company`` with benchmark data; returns the objects URLs need.
+
+    ``user`` is the actor of the audit rows and the requester of the
+    requisitions. The same ``seed_value`` builds the same dataset.
+    """
+    from faker import Faker
+
+    from accounts.models import AuditLog, Role
+    from inventory.models import ProductUnit, StockLot, StockMovement
+    from purchasing import approvals
+    from purchasing.models import (
+        Bank,
+        GoodsReceipt,
+        Payment,
+        PurchaseOrder,
+        PurchaseOrderLine,
+        PurchaseRequisition,
+        QuotationRequest,
+        QuotationRequestLine,
+        SupplierInvoice,
+    )
+    from purchasing.requisitions import create_lines
+
+    fake = Faker()
+    fake.seed_instance(seed_value)
+    rng = random.Random(seed_value)
+    code = company.code
+    writer = generator.Writer(batch_size)
+    unit, _ = ProductUnit.objects.get_or_create(code='PCS', defaults={'name': 'Pieces'})
+
+    categories = generator.build_categories(writer, fake, company.pk, 8)
+    warehouses = generator.build_warehouses(writer, fake, company.pk, 5)
+    warehouse_ids = [w.pk for w in warehouses]
+    catalogue = generator.build_products(writer, fake, rng, company, categories, unit.pk, products)
+    product_ids = [p.pk for p in catalogue]
+    received = timezone.now() - timedelta(days=365)
+    writer.insert(StockLot, generator.opening_lots(rng, code, catalogue, warehouse_ids, received))
+
+    for start in range(0, movements, batch_size):
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=rng.choice(product_ids),
+                warehouse_id=rng.choice(warehouse_ids),
+                user=user,
+                quantity=rng.randint(1, 20),
+                unit_cost=Decimal(rng.randint(50, 5000)) / 100,
+                movement_type=StockMovement.IN if rng.random() < 0.6 else StockMovement.OUT,
+                reference=f'BENCH-{start + i}',
+            )
+            for i in range(min(batch_size, movements - start))
+        ])
+
+    for start in range(0, audit_rows, batch_size):
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                actor=user,
+                company=company,
+                action=rng.choice(AUDIT_ACTIONS),
+                request_type=rng.choice(('GET', 'POST')),
+                details=json.dumps({'path': f'/inventory/products/{rng.choice(product_ids)}/', 'GET': {}}),
+            )
+            for _ in range(min(batch_size, audit_rows - start))
+        ])
+
+    generator.build_item_masters(writer, fake, company.pk, unit.pk, 50)
+    generator.ledger_accounts(writer, company.pk)
+    bank, _ = Bank.objects.get_or_create(swift_code=f'BNCH{code[:4]}', defaults={'name': f'Bench Bank {code}'})
+    suppliers = generator.build_suppliers(writer, fake, rng, company, bank, 20)
+    order_lines = []
+    for n in range(20):
+        po = PurchaseOrder.objects.create(order_number=f'{code}-BPO{n:05d}', supplier=suppliers[n], company=company)
+        for pid in rng.sample(product_ids, min(5, len(product_ids))):
+            order_lines.append(PurchaseOrderLine.objects.create(
+                purchase_order=po, product_id=pid, quantity=rng.randint(1, 20), unit_price=rng.randint(5, 500),
+            ))
+        GoodsReceipt.objects.create(
+            purchase_order=po, product_id=order_lines[-1].product_id, qty_received=1,
+            warehouse=warehouses[0], ean=f'{n:013d}', serial=f'{code}-SN{n}',
+        )
+        SupplierInvoice.objects.create(number=f'{code}-BINV{n:05d}', purchase_order=po, amount=100, company=company)
+        payment = Payment.objects.create(
+            purchase_order=po, amount=100, method=Payment.METHOD_CASH, company=company,
+        )
+        approvals.start(approvals.KIND_PAYMENT, payment)
+    quotation = QuotationRequest.objects.create(number=f'{code}-BQ00001', supplier=suppliers[0], company=company)
+    QuotationRequestLine.objects.create(quotation=quotation, product_id=product_ids[0], quantity=5)
+
+    for n in range(20):
+        pr = PurchaseRequisition.objects.create(
+            number=f'{code}-BPR{n:05d}', request_type=PurchaseRequisition.TYPE_PRODUCT,
+            requester=user, company=company,
+        )
+        create_lines(pr, [
+            {'item_id': pid, 'quantity': rng.randint(1, 10)} for pid in rng.sample(product_ids, min(3, len(product_ids)))
+        ])
+        approvals.start(approvals.KIND_REQUISITION, pr)
+
+    Role.objects.create(name='Bench Clerk', company=company)
+    return objects_for(company, user)
+
+
+def objects_for(company, user):
+    """The first object of each kind in ``company``, keyed for URL arguments."""
+    from accounts.models import AuditLog, Role
+    from inventory.models import Product, ProductCategory, ProductImage, Warehouse
+    from purchasing.models import (
+        AssetItem,
+        ITSoftwareItem,
+        OfficeSupplyItem,
+        Payment,
+        PurchaseOrder,
+        PurchaseOrderLine,
+        PurchaseRequisition,
+        QuotationRequestLine,
+        ServiceItem,
+        Supplier,
+        SupplierInvoice,
+    )
+
+    def first(queryset):
+        return queryset.order_by('pk').first()
+
+    return {
+        'company': company,
+        'user': user,
+        'role': first(Role.objects.filter(company=company)),
+        'audit_log': first(AuditLog.objects.filter(company=company)),
+        'warehouse': first(Warehouse.objects.filter(company=company)),
+        'category': first(ProductCategory.objects.filter(company=company)),
+        'product': first(Product.objects.filter(company=company)),
+        'product_image': first(ProductImage.objects.filter(product__company=company)),
+        'supplier': first(Supplier.objects.filter(company=company)),
+        'purchase_order': first(PurchaseOrder.objects.filter(company=company)),
+        'purchase_order_line': first(PurchaseOrderLine.objects.filter(purchase_order__company=company)),
+        'quotation_line': first(QuotationRequestLine.objects.filter(quotation__company=company)),
+        'invoice': first(SupplierInvoice.objects.filter(company=company)),
+        'payment': first(Payment.objects.filter(company=company)),
+        'requisition': first(PurchaseRequisition.objects.filter(company=company)),
+        'service_item': first(ServiceItem.objects.filter(company=company)),
+        'office_supply_item': first(OfficeSupplyItem.objects.filter(company=company)),
+        'asset_item': first(AssetItem.objects.filter(company=company)),
+        'it_item': first(ITSoftwareItem.objects.filter(company=company)),
+    }
+
+
+def _patterns(resolver):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace is None:
+                yield from _patterns(pattern)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+def _object_for(name, kwarg):
+    if kwarg == 'line_id':
+        return LINE_OBJECTS.get(name)
+    if kwarg != 'pk':
+        return KWARG_OBJECTS.get(kwarg)
+    prefixes = [p for p in PK_OBJECTS if name.startswith(p)]
+    return PK_OBJECTS[max(prefixes, key=len)] if prefixes else None
+
+
+def view_urls(objects):
+    """Return ``(name, url)`` for every GET-able named pattern.
+
+    Patterns whose arguments have no seeded object are left out.
+    """
+    urls = []
+    for pattern in _patterns(get_resolver()):
+        if pattern.name in SKIP:
+            continue
+        kwargs = {}
+        for kwarg in pattern.pattern.converters:
+            obj = objects.get(_object_for(pattern.name, kwarg))
+            if obj is None:
+                break
+            kwargs[kwarg] = obj.pk
+        else:
+            urls.append((pattern.name, reverse(pattern.name, kwargs=kwargs)))
+    return urls
+
+
+def budget(name):
+    return QUERY_BUDGETS.get(name, DEFAULT_QUERY_BUDGET)
+
+
+def _get(client, url):
+    response = client.get(url)
+    size = sum(len(chunk) for chunk in response) if response.streaming else len(response.content)
+    return response, size
+
+
+def capture(client, url):
+    """Request ``url`` once; returns the response and the queries it ran."""
+    with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+        response, _ = _get(client, url)
+    # Read now: the next request clears the connection's query log.
+    return response, context.captured_queries
+
+
+def measure(client, url, repeat=3):
+    """Request ``url`` with ``client`` and return its measurements.
+
+    One untimed request warms caches first. Memory is traced on a separate
+    request so the tracing does not skew the timings.
+    """
+    _get(client, url)
+    response, queries = capture(client, url)
+    timings, size = [], 0
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        _, size = _get(client, url)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        _get(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'queries': len(queries),
+        'sql_ms': round(sum(float(q['time']) for q in queries) * 1000, 2),
+        'ms': round(statistics.median(timings) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+        'peak_kb': round(peak / 1024, 1),
+        'bytes': size,
+    }
+
+
+def run(client, objects, repeat=3, dataset=None):
+    """Measure every URL from :func:`view_urls`; returns the report dict."""
+    views = []
+    for name, url in view_urls(objects):
+        result = measure(client, url, repeat)
+        views.append({'name': name, 'url': url, 'budget': budget(name), **result})
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'django': django.get_version(),
+        'database': connections[DEFAULT_DB_ALIAS].vendor,
+        'dataset': dataset or {},
+        'views': views,
+    }
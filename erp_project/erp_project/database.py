@@ -0,0 +1,97 @@
+"""Build ``DATABASES`` from environment variables.
+
+``DB_ENGINE`` picks the profile:
+
+* ``sqlite`` (default): ``DB_NAME`` is the file, ``db.sqlite3`` in the
+  project directory unless set. Tuned for concurrent requests unless
+  ``DB_SQLITE_TUNING=0``: WAL journal so readers never block the writer,
+  ``synchronous=NORMAL`` (safe with WAL), ``DB_SQLITE_MMAP_SIZE`` bytes of
+  memory-mapped reads (128 MiB), and a ``DB_SQLITE_BUSY_TIMEOUT`` second
+  wait for the write lock (20). Transactions begin ``IMMEDIATE`` so a
+  writer takes the lock up front instead of failing when it upgrades from
+  a read.
+* ``postgres``: ``DB_NAME``, ``DB_USER``, ``DB_PASSWORD``, ``DB_HOST`` and
+  ``DB_PORT``. Connections persist for ``DB_CONN_MAX_AGE`` seconds (60)
+  with health checks. ``DB_POOL=1`` uses psycopg's connection pool instead,
+  sized by ``DB_POOL_MIN_SIZE``/``DB_POOL_MAX_SIZE``. ``.iterator()``
+  streams through server-side cursors unless
+  ``DB_DISABLE_SERVER_SIDE_CURSORS=1``, which transaction-mode PgBouncer
+  needs. The test database is ``DB_TEST_NAME`` (``test_<name>``).
+
+Setting ``DB_REPLICA_NAME`` or ``DB_REPLICA_HOST`` adds a ``replica`` alias
+with the same profile; ``DB_REPLICA_USER``, ``DB_REPLICA_PASSWORD`` and
+``DB_REPLICA_PORT`` override the primary's values. During tests the replica
+mirrors ``default``. :mod:`erp_project.routers` decides which reads use it.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+
+REPLICA = 'replica'
+
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _sqlite(env, base_dir):
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('DB_NAME') or base_dir / 'db.sqlite3',
+        'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 0)),
+        'OPTIONS': {},
+    }
+    if _flag(env.get('DB_SQLITE_TUNING', '1')):
+        config['OPTIONS'] = {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': float(env.get('DB_SQLITE_BUSY_TIMEOUT', 20)),
+            'init_command': ';'.join([
+                'PRAGMA journal_mode=WAL',
+                'PRAGMA synchronous=NORMAL',
+                f"PRAGMA mmap_size={int(env.get('DB_SQLITE_MMAP_SIZE', 128 * 1024 * 1024))}",
+            ]),
+        }
+    return config
+
+
+def _postgres(env):
+    name = env.get('DB_NAME', 'erp')
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': env.get('DB_USER', 'erp'),
+        'PASSWORD': env.get('DB_PASSWORD', ''),
+        'HOST': env.get('DB_HOST', 'localhost'),
+        'PORT': env.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': _flag(env.get('DB_DISABLE_SERVER_SIDE_CURSORS', '')),
+        'OPTIONS': {},
+        'TEST': {'NAME': env.get('DB_TEST_NAME', f'test_{name}')},
+    }
+    if _flag(env.get('DB_POOL', '')):
+        config['OPTIONS']['pool'] = {
+            'min_size': int(env.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(env.get('DB_POOL_MAX_SIZE', 10)),
+        }
+        # Django refuses persistent connections together with the pool.
+        config['CONN_MAX_AGE'] = 0
+    return config
+
+
+def database_config(env, base_dir):
+    """Return the ``DATABASES`` setting for the environment mapping ``env``."""
+    engine = env.get('DB_ENGINE', 'sqlite').lower()
+    if engine == 'sqlite':
+        default = _sqlite(env, base_dir)
+    elif engine in ('postgres', 'postgresql'):
+        default = _postgres(env)
+    else:
+        raise ImproperlyConfigured(f'Unknown DB_ENGINE {engine!r}; use sqlite or postgres')
+    databases = {'default': default}
+    if env.get('DB_REPLICA_NAME') or env.get('DB_REPLICA_HOST'):
+        replica = {**default, 'OPTIONS': dict(default.get('OPTIONS', {})), 'TEST': {'MIRROR': 'default'}}
+        for key in ('NAME', 'HOST', 'PORT', 'USER', 'PASSWORD'):
+            if env.get(f'DB_REPLICA_{key}'):
+                replica[key] = env[f'DB_REPLICA_{key}']
+        databases[REPLICA] = replica
+    return databases
@@ -0,0 +1,493 @@
+"""Synthetic datasets for capacity testing.
+
+:func:`generate` creates companies and fills each one with users and
+roles, a category tree, products, warehouses, suppliers, item masters,
+purchase orders with receipts, stock lots, stock movements, invoices,
+payments, requisitions and the ledger entries those documents post. Rows
+are built in memory and written with ``bulk_create`` in ``batch_size``
+chunks. Each chunk commits on its own, so parallel workers take turns on
+SQLite instead of holding the write lock for a whole company.
+
+The ``build_*`` helpers write the master data of one company. The
+benchmark seed uses them too, so both datasets share one set of formats.
+
+Companies are independent, so they are generated in parallel by
+``workers`` processes. The data is consistent:
+
+* SKUs, PO, invoice and requisition numbers follow the formats the models
+  generate.
+* Receipts add inbound movements as ``GoodsReceipt.save`` does. Every
+  product starts with an opening lot, and outbound movements consume the
+  lots first in, first out, so stock never goes negative.
+* Every receipt and approved payment has a balanced ledger entry. An
+  opening entry books the lots and funds the payments.
+* Pending payments and requisitions have approval tasks.
+
+Rollups are rebuilt per company at the end: pipeline metrics, supplier
+scorecards and approval counts. Fields with ``auto_now_add`` get the
+generation time. Requisition line dates are spread over the past year so
+the demand report has history.
+"""
+
+import random
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.utils import timezone
+
+LEDGER_ACCOUNTS = ('Inventory', 'Supplier', 'Supplier Advance', 'Cash', 'Bank', 'Capital')
+CENT = Decimal('0.01')
+OPENING_LIMIT = Decimal('10000000')
+
+
+@dataclass(frozen=True)
+class Scale:
+    """Rows generated per company."""
+
+    users: int = 50
+    products: int = 2000
+    warehouses: int = 5
+    suppliers: int = 50
+    items: int = 20  # of each service, office supply, asset and IT master
+    orders: int = 1000
+    lines_per_order: int = 5  # at most
+    movements: int = 20000  # outbound, on top of the receipts
+    requisitions: int = 500
+    batch_size: int = 5000
+
+
+def _base36(n, width):
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    out = ''
+    while n:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+    return out.rjust(width, '0')
+
+
+class Writer:
+    """Bulk inserts rows and counts them per model."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.counts = Counter()
+
+    def insert(self, model, rows):
+        """Bulk insert ``rows`` one chunk per transaction; returns them with pks."""
+        for start in range(0, len(rows), self.batch_size):
+            model.objects.bulk_create(rows[start:start + self.batch_size])
+        self.counts[model._meta.label] += len(rows)
+        return rows
+
+
+def _ledger(writer, company_id, accounts, postings):
+    """Insert one entry per ``(description, [(account, debit, credit)])``."""
+    from ledger.models import LedgerEntry, LedgerLine
+
+    entries = writer.insert(LedgerEntry, [
+        LedgerEntry(company_id=company_id, description=description) for description, _ in postings
+    ])
+    writer.insert(LedgerLine, [
+        LedgerLine(entry_id=entry.pk, account_id=accounts[code], debit=debit, credit=credit)
+        for entry, (_, lines) in zip(entries, postings)
+        for code, debit, credit in lines
+    ])
+
+
+def build_categories(writer, fake, company_id, roots):
+    """Insert ``roots`` top-level categories with three children each."""
+    from inventory.models import ProductCategory
+
+    prefix = f'G{_base36(company_id, 3)}'
+    parents = writer.insert(ProductCategory, [
+        ProductCategory(name=f'{fake.word().title()} {n}', code=f'{prefix}{_base36(n, 4)}', company_id=company_id)
+        for n in range(roots)
+    ])
+    children = writer.insert(ProductCategory, [
+        ProductCategory(name=f'{root.name} / {fake.word()} {n}', code=f'{prefix}{_base36(roots + i * 3 + n, 4)}',
+                        parent_id=root.pk, company_id=company_id)
+        for i, root in enumerate(parents) for n in range(3)
+    ])
+    return parents + children
+
+
+def build_warehouses(writer, fake, company_id, count):
+    from inventory.models import Warehouse
+
+    return writer.insert(Warehouse, [
+        Warehouse(name=f'{fake.city()} {n}', location=fake.street_address(), company_id=company_id)
+        for n in range(count)
+    ])
+
+
+def build_products(writer, fake, rng, company, categories, unit_id, count):
+    """Insert ``count`` products with SKUs numbered per category."""
+    from inventory.models import Product
+
+    serial = Counter()
+    rows = []
+    for n in range(count):
+        category = rng.choice(categories)
+        serial[category.pk] += 1
+        rows.append(Product(
+            name=f'{fake.catch_phrase()} {n}'[:255],
+            sku=f'{company.code}-{category.code}-{serial[category.pk]:06d}',
+            barcode=f'{company.pk % 100000:05d}{n:08d}',
+            unit_id=unit_id,
+            brand=fake.company()[:255],
+            category_id=category.pk,
+            company_id=company.pk,
+            description=fake.sentence(),
+            sale_price=Decimal(rng.randint(100, 100000)) / 100,
+            vat_rate=Decimal('5.00'),
+            reorder_level=rng.randint(0, 50),
+        ))
+    return writer.insert(Product, rows)
+
+
+def opening_lots(rng, code, products, warehouse_ids, received_at):
+    """One unsaved lot per product, received a minute apart from ``received_at``."""
+    from inventory.models import StockLot
+
+    return [
+        StockLot(
+            batch_number=f'{code}-LOT{n + 1:07d}', qty=rng.randint(10, 500), product_id=product.pk,
+            warehouse_id=rng.choice(warehouse_ids), received_at=received_at + timedelta(minutes=n),
+            unit_cost=(product.sale_price * Decimal('0.6')).quantize(CENT),
+            expiry_date=(received_at + timedelta(days=rng.randint(400, 1100))).date(),
+        )
+        for n, product in enumerate(products)
+    ]
+
+
+def build_suppliers(writer, fake, rng, company, bank, count):
+    from purchasing.models import Supplier
+
+    suppliers = []
+    for n in range(count):
+        supplier = Supplier(
+            name=fake.company(), contact_person=fake.name()[:100],
+            email=f'{company.code.lower()}-{n}@suppliers.example.com', address=fake.address(), bank=bank,
+            company_id=company.pk, is_verified=rng.random() < 0.8,
+        )
+        supplier.normalize_identifiers()
+        suppliers.append(supplier)
+    return writer.insert(Supplier, suppliers)
+
+
+def build_item_masters(writer, fake, company_id, unit_id, count):
+    """Insert ``count`` service, office supply, asset and IT items each."""
+    from purchasing.models import AssetItem, ITSoftwareItem, OfficeSupplyItem, ServiceItem
+
+    for model in (ServiceItem, OfficeSupplyItem, AssetItem, ITSoftwareItem):
+        writer.insert(model, [
+            model(name=f'{fake.bs().title()} {n}'[:255], description=fake.sentence(), unit_id=unit_id,
+                  company_id=company_id)
+            for n in range(count)
+        ])
+
+
+def ledger_accounts(writer, company_id):
+    """Create the missing :data:`LEDGER_ACCOUNTS`; returns ``{code: pk}``."""
+    from ledger.models import LedgerAccount
+
+    accounts = {a.code: a.pk for a in LedgerAccount.objects.filter(company_id=company_id)}
+    accounts.update({a.code: a.pk for a in writer.insert(LedgerAccount, [
+        LedgerAccount(code=c, name=c, company_id=company_id) for c in LEDGER_ACCOUNTS if c not in accounts
+    ])})
+    return accounts
+
+
+def generate_company(company_id, scale, seed=0):
+    """Fill one existing company; returns ``{model label: rows}``."""
+    from faker import Faker
+
+    from accounts.models import Company, Permission, Role, RolePermission, User, UserRole
+    from inventory.models import ProductUnit, StockLot, StockMovement
+    from purchasing import approvals
+    from purchasing.models import (
+        ApprovalTask,
+        Bank,
+        GoodsReceipt,
+        Payment,
+        PurchaseOrder,
+        PurchaseOrderLine,
+        PurchaseRequisition,
+        PurchaseRequisitionLine,
+        SupplierInvoice,
+    )
+    from purchasing.pipeline import refresh_metrics
+    from purchasing.scorecards import refresh_scorecards
+
+    if isinstance(scale, dict):
+        scale = Scale(**scale)
+    company = Company.objects.get(pk=company_id)
+    code = company.code
+    rng = random.Random(f'{seed}-{company_id}')
+    fake = Faker()
+    fake.seed_instance(f'{seed}-{company_id}')
+    writer = Writer(scale.batch_size)
+    unit = ProductUnit.objects.get(code='PCS')
+    bank = Bank.objects.order_by('pk').first()
+
+    # Users and roles
+    permission_ids = list(Permission.objects.values_list('pk', flat=True))
+    roles = writer.insert(Role, [
+        Role(name=name, description=f'{name} role', company_id=company_id)
+        for name in ('Manager', 'Buyer', 'Storekeeper')
+    ])
+    writer.insert(RolePermission, [
+        RolePermission(role_id=role.pk, permission_id=pid)
+        for role in roles
+        for pid in rng.sample(permission_ids, rng.randint(1, len(permission_ids)))
+    ] if permission_ids else [])
+    password = make_password('pass')
+    users = writer.insert(User, [
+        User(
+            username=f'{code.lower()}_{n}', password=password, email=f'{code.lower()}_{n}@example.com',
+            first_name=fake.first_name(), last_name=fake.last_name(), company_id=company_id,
+        )
+        for n in range(max(scale.users, 1))
+    ])
+    writer.insert(UserRole, [
+        UserRole(user_id=user.pk, role_id=rng.choice(roles).pk, company_id=company_id) for user in users
+    ])
+    user_ids = [user.pk for user in users]
+
+    # Category tree, warehouses and products
+    categories = build_categories(writer, fake, company_id, max(4, scale.products // 250))
+    warehouse_ids = [w.pk for w in build_warehouses(writer, fake, company_id, max(scale.warehouses, 1))]
+    products = build_products(writer, fake, rng, company, categories, unit.pk, max(scale.products, 1))
+    prices = {p.pk: p.sale_price for p in products}
+    product_ids = list(prices)
+
+    # Suppliers and item masters
+    suppliers = build_suppliers(writer, fake, rng, company, bank, max(scale.suppliers, 1))
+    build_item_masters(writer, fake, company_id, unit.pk, scale.items)
+
+    # Purchase orders and lines
+    orders = writer.insert(PurchaseOrder, [
+        PurchaseOrder(order_number=f'{code}-PO{n + 1:06d}', status=PurchaseOrder.SUBMITTED,
+                      supplier_id=rng.choice(suppliers).pk, company_id=company_id)
+        for n in range(scale.orders)
+    ])
+    lines = writer.insert(PurchaseOrderLine, [
+        PurchaseOrderLine(purchase_order_id=po.pk, product_id=pid, quantity=rng.randint(1, 50),
+                          unit_price=(prices[pid] * Decimal(rng.uniform(0.5, 0.8))).quantize(CENT))
+        for po in orders
+        for pid in rng.sample(product_ids, min(rng.randint(1, max(scale.lines_per_order, 1)), len(product_ids)))
+    ])
+    lines_by_order = defaultdict(list)
+    for line in lines:
+        lines_by_order[line.purchase_order_id].append(line)
+
+    # Receipts for most orders, each with its inbound movement and ledger entry
+    received = [po for po in orders if rng.random() < 0.8]
+    receipts, inbound, postings = [], [], []
+    for po in received:
+        for line in lines_by_order[po.pk]:
+            warehouse_id = rng.choice(warehouse_ids)
+            receipts.append(GoodsReceipt(
+                purchase_order_id=po.pk, product_id=line.product_id, qty_received=line.quantity,
+                unit_cost=line.unit_price, warehouse_id=warehouse_id, ean=f'{line.product_id:013d}'[-13:],
+                serial=f'{po.order_number}-{line.pk}',
+            ))
+            inbound.append(StockMovement(
+                product_id=line.product_id, warehouse_id=warehouse_id, quantity=line.quantity,
+                unit_cost=line.unit_price, movement_type=StockMovement.IN, reference=f'GRN {po.order_number}',
+                user_id=rng.choice(user_ids),
+            ))
+            amount = (line.quantity * line.unit_price).quantize(CENT)
+            postings.append((f'GRN {po.order_number}', [('Inventory', amount, 0), ('Supplier', 0, amount)]))
+    writer.insert(GoodsReceipt, receipts)
+
+    # Opening lots, picked first in, first out by the outbound movements
+    lots = opening_lots(rng, code, products, warehouse_ids, timezone.now() - timedelta(days=365))
+    open_lots = defaultdict(deque)
+    for lot in lots:
+        open_lots[(lot.product_id, lot.warehouse_id)].append(lot)
+    outbound = []
+    stocked = list(open_lots)
+    while stocked and len(outbound) < scale.movements:
+        index = rng.randrange(len(stocked))
+        queue = open_lots[stocked[index]]
+        lot = queue[0]
+        qty = min(rng.randint(1, 5), lot.qty - lot.consumed_qty)
+        lot.consumed_qty += qty
+        outbound.append((lot, qty))
+        if lot.consumed_qty >= lot.qty:
+            queue.popleft()
+            if not queue:
+                stocked[index] = stocked[-1]
+                stocked.pop()
+    writer.insert(StockLot, lots)
+    writer.insert(StockMovement, inbound + [
+        StockMovement(
+            product_id=lot.product_id, warehouse_id=lot.warehouse_id, batch_id=lot.pk, quantity=qty,
+            unit_cost=lot.unit_cost, movement_type=StockMovement.OUT, reference=f'SO {code}-{n + 1:07d}',
+            user_id=rng.choice(user_ids),
+        )
+        for n, (lot, qty) in enumerate(outbound)
+    ])
+    stock_value = sum((lot.qty * lot.unit_cost for lot in lots), Decimal('0')).quantize(CENT)
+
+    # Invoices and payments for received orders
+    invoices, payments, pending = [], [], []
+    for po in received:
+        total = sum((l.quantity * l.unit_price for l in lines_by_order[po.pk]), Decimal('0')).quantize(CENT)
+        invoices.append(SupplierInvoice(
+            number=f'{code}-INV{len(invoices) + 1:06d}', purchase_order_id=po.pk, amount=total,
+            status=rng.choice((SupplierInvoice.STATUS_PENDING, SupplierInvoice.STATUS_MATCHED)),
+            company_id=company_id,
+        ))
+        if rng.random() < 0.7:
+            approved = rng.random() < 0.8
+            payment = Payment(
+                purchase_order_id=po.pk, amount=total, company_id=company_id,
+                method=rng.choice((Payment.METHOD_CASH, Payment.METHOD_BANK)),
+                status=Payment.STATUS_APPROVED if approved else Payment.STATUS_PENDING,
+            )
+            payments.append(payment)
+            if approved:
+                credit = 'Cash' if payment.method == Payment.METHOD_CASH else 'Bank'
+                postings.append(('Payment', [('Supplier', total, 0), (credit, 0, total)]))
+    writer.insert(SupplierInvoice, invoices)
+    writer.insert(Payment, payments)
+    for payment in payments:
+        if payment.status == Payment.STATUS_PENDING:
+            pending.append((approvals.KIND_PAYMENT, payment.pk, payment.amount, payment.method,
+                            f'Payment #{payment.pk}', None))
+
+    # Ledger: opening funds, then every receipt and approved payment
+    accounts = ledger_accounts(writer, company_id)
+    paid = Counter()
+    for description, entry_lines in postings:
+        if description == 'Payment':
+            paid[entry_lines[1][0]] += entry_lines[1][2]
+    opening = []
+    for account, total in (('Inventory', stock_value), ('Cash', paid['Cash'] + 10000), ('Bank', paid['Bank'] + 10000)):
+        # Ledger lines hold ten digits, so large balances span several entries.
+        while total > 0:
+            amount = min(total, OPENING_LIMIT)
+            opening.append(('Opening balance', [(account, amount, 0), ('Capital', 0, amount)]))
+            total -= amount
+    _ledger(writer, company_id, accounts, opening + postings)
+
+    # Requisitions with their lines
+    start = timezone.now().date() - timedelta(days=365)
+    statuses = (PurchaseRequisition.PENDING, PurchaseRequisition.APPROVED, PurchaseRequisition.REJECTED)
+    requisitions = []
+    for n in range(scale.requisitions):
+        status = rng.choices(statuses, weights=(3, 6, 1))[0]
+        requisitions.append(PurchaseRequisition(
+            number=f'{code}-PR{n + 1:06d}', request_type=PurchaseRequisition.TYPE_PRODUCT,
+            requester_id=rng.choice(user_ids), status=status, company_id=company_id,
+            approver_id=None if status == PurchaseRequisition.PENDING else rng.choice(user_ids),
+            approved_at=None if status == PurchaseRequisition.PENDING else timezone.now(),
+        ))
+    writer.insert(PurchaseRequisition, requisitions)
+    products_by_pk = {p.pk: p for p in products}
+    pr_lines = []
+    for pr in requisitions:
+        requested_on = start + timedelta(days=rng.randint(0, 365))
+        amount = Decimal('0')
+        for line_no, pid in enumerate(rng.sample(product_ids, min(rng.randint(1, 3), len(product_ids))), start=1):
+            qty = Decimal(rng.randint(1, 20))
+            amount += qty * prices[pid]
+            pr_lines.append(PurchaseRequisitionLine(
+                requisition_id=pr.pk, line_no=line_no, item_type=pr.request_type, product_id=pid,
+                name=products_by_pk[pid].name, quantity=qty, unit=unit.code, company_id=company_id,
+                requested_on=requested_on,
+                approved_quantity={PurchaseRequisition.APPROVED: qty, PurchaseRequisition.REJECTED: 0}.get(pr.status),
+            ))
+        if pr.status == PurchaseRequisition.PENDING:
+            pending.append((approvals.KIND_REQUISITION, pr.pk, amount, pr.request_type, pr.number,
+                            pr.requester_id))
+    writer.insert(PurchaseRequisitionLine, pr_lines)
+
+    # Approval chains of pending documents, level 1 awaiting a decision
+    tasks = []
+    for kind, object_id, amount, item_type, title, requested_by in pending:
+        for level, permission in enumerate(approvals.levels_for(kind, amount, item_type), start=1):
+            tasks.append(ApprovalTask(
+                company_id=company_id, kind=kind, object_id=object_id, level=level, permission=permission,
+                status=ApprovalTask.PENDING if level == 1 else ApprovalTask.WAITING,
+                title=title, amount=amount.quantize(CENT), requested_by_id=requested_by,
+            ))
+    writer.insert(ApprovalTask, tasks)
+
+    refresh_metrics(company)
+    refresh_scorecards(company)
+    approvals.rebuild_counts(company)
+    return dict(writer.counts)
+
+
+def _prepare():
+    """Rows every company shares."""
+    from inventory.models import ProductUnit
+    from purchasing.models import Bank
+
+    ProductUnit.objects.get_or_create(code='PCS', defaults={'name': 'Pieces'})
+    Bank.objects.get_or_create(swift_code='GENBANK0000', defaults={'name': 'Generated Bank'})
+
+
+def create_companies(count, prefix='G'):
+    """Create ``count`` new companies coded ``<prefix>00001`` and up."""
+    from faker import Faker
+
+    from accounts.models import Company
+
+    fake = Faker()
+    existing = Company.objects.filter(code__startswith=prefix).count()
+    companies = [
+        Company(name=fake.company(), code=f'{prefix}{existing + n + 1:05d}', address=fake.address())
+        for n in range(count)
+    ]
+    Company.objects.bulk_create(companies)
+    return [company.pk for company in companies]
+
+
+def _init_process():
+    import django
+
+    django.setup()
+
+
+def _run(company_id, scale, seed):
+    try:
+        return company_id, generate_company(company_id, scale, seed)
+    finally:
+        connections.close_all()
+
+
+def generate(companies, scale=None, workers=1, seed=0, on_company=None):
+    """Create and fill ``companies`` companies; returns total rows per model.
+
+    ``on_company(company_id, counts)`` is called as each company finishes.
+    """
+    scale = scale or Scale()
+    _prepare()
+    company_ids = create_companies(companies)
+    totals = Counter()
+    if workers <= 1:
+        results = ((cid, generate_company(cid, scale, seed)) for cid in company_ids)
+        for company_id, counts in results:
+            totals.update(counts)
+            if on_company:
+                on_company(company_id, counts)
+        return totals
+    # Children must not share the parent's database sockets.
+    connections.close_all()
+    with ProcessPoolExecutor(workers, initializer=_init_process) as executor:
+        futures = [executor.submit(_run, cid, asdict(scale), seed) for cid in company_ids]
+        for future in as_completed(futures):
+            company_id, counts = future.result()
+            totals.update(counts)
+            if on_company:
+                on_company(company_id, counts)
+    return totals
@@ -0,0 +1,431 @@
+"""Prometheus metrics.
+
+Counters, gauges and histograms are aggregated in memory by each process
+under one lock. :func:`exposition` renders them in the Prometheus text
+format for the ``/metrics`` view.
+
+Worker servers such as gunicorn run several processes, and a scrape only
+reaches one of them. Setting ``METRICS['dir']`` to a directory the workers
+share makes each process write its values to ``<dir>/<pid>.json``. Writes
+happen at most every ``flush_seconds`` and replace the file atomically. The
+view merges every file:
+
+* Counters and histograms are added up, including those of workers that
+  have exited, so totals never go backwards.
+* Gauges are summed over live processes only.
+
+A scrape folds the counters and histograms of exited workers into
+``<dir>/dead.json`` and deletes their files, so the directory does not grow
+with worker restarts. A new process whose pid was reused folds the
+leftover file the same way before writing its own. Folding holds an
+exclusive ``flock`` on ``<dir>/.lock``.
+
+Without a directory, only the serving process is reported.
+
+Labels are always small fixed sets, such as URL names or function names,
+and never paths or ids, so the number of series stays bounded.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULTS = {
+    'enabled': True,
+    'dir': '',
+    'flush_seconds': 1,
+    'token': '',
+}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_values = defaultdict(dict)  # metric name -> {label values: value}
+_last_flush = 0.0
+_claimed = False  # whether <pid>.json was written by this process
+DEAD_FILE = 'dead.json'
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, key, amount):
+        with _lock:
+            samples = _values[self.name]
+            samples[key] = samples.get(key, 0) + amount
+        _maybe_flush()
+
+    def value(self, **labels):
+        """Current value in this process, mainly for tests."""
+        with _lock:
+            value = _values[self.name].get(self._key(labels), 0)
+            return list(value) if isinstance(value, list) else value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key(labels), amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            samples = _values[self.name]
+            # Per-bucket counts (not cumulative), then +Inf, sum and count.
+            sample = samples.get(key)
+            if sample is None:
+                sample = samples[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[i] += 1
+                    break
+            else:
+                sample[-3] += 1
+            sample[-2] += value
+            sample[-1] += 1
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds the block takes; also works as a decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+REQUEST_SECONDS = Histogram(
+    'erp_http_request_duration_seconds', 'Request latency by URL name.', ['view', 'method'],
+)
+REQUEST_QUERIES = Histogram(
+    'erp_http_request_queries', 'Database queries per request by URL name.', ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUESTS = Counter('erp_http_requests_total', 'Requests by URL name and status.', ['view', 'method', 'status'])
+AUDIT_QUEUE = Gauge('erp_audit_log_queue_depth', 'Audit log writes waiting for or holding the write lock.')
+AUDIT_WRITES = Counter('erp_audit_log_writes_total', 'Audit log rows written.')
+LEDGER_POSTINGS = Counter('erp_ledger_postings_total', 'Ledger entries posted through post_entry.')
+LEDGER_LINES = Counter('erp_ledger_lines_total', 'Ledger lines posted through post_entry.')
+STOCK_SECONDS = Histogram(
+    'erp_stock_computation_seconds', 'Time to compute or rebuild stock balances.', ['function'],
+)
+CACHE_REQUESTS = Counter('erp_cache_requests_total', 'Cache lookups by cache and result.', ['cache', 'result'])
+OTP_ISSUED = Counter('erp_supplier_otp_issued_total', 'Supplier one-time passcodes issued.')
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# Storage shared between processes
+
+def _snapshot():
+    with _lock:
+        return {
+            name: [[list(key), list(value) if isinstance(value, list) else value] for key, value in samples.items()]
+            for name, samples in _values.items()
+        }
+
+
+def flush():
+    """Write this process's values to the shared directory, if any."""
+    with _flush_lock:
+        _write()
+
+
+def _write():
+    global _last_flush, _claimed
+    directory = _config()['dir']
+    _last_flush = time.monotonic()
+    if not directory:
+        return
+    path = Path(directory) / f'{os.getpid()}.json'
+    if not _claimed:
+        # Left behind by an exited process that had the same pid.
+        with _folding(directory):
+            _fold(directory, path)
+        _claimed = True
+    _write_json(path, _snapshot())
+
+
+def _maybe_flush():
+    interval = getattr(settings, 'METRICS', DEFAULTS).get('flush_seconds', DEFAULTS['flush_seconds'])
+    if time.monotonic() - _last_flush < interval:
+        return
+    # One thread writes; the others carry on and are picked up next time.
+    if _flush_lock.acquire(blocking=False):
+        try:
+            _write()
+        finally:
+            _flush_lock.release()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(merged, name, key, value):
+    current = merged[name].get(key)
+    if current is None:
+        merged[name][key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        merged[name][key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[name][key] = current + value
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _folding(directory):
+    with open(Path(directory) / '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _fold(directory, path):
+    """Add the counters and histograms of ``path`` to the dead-process file and delete it."""
+    if not path.exists():
+        return
+    data = _read(path) or {}
+    merged = defaultdict(dict)
+    for source in (_read(Path(directory) / DEAD_FILE) or {}, data):
+        for name, samples in source.items():
+            metric = REGISTRY.get(name)
+            if metric is None or metric.kind == 'gauge':
+                continue
+            for key, value in samples:
+                _merge(merged, name, tuple(key), value)
+    _write_json(Path(directory) / DEAD_FILE, {
+        name: [[list(key), value] for key, value in samples.items()] for name, samples in merged.items()
+    })
+    path.unlink()
+
+
+def collect():
+    """Values of every process, merged: ``{name: {label values: value}}``."""
+    merged = defaultdict(dict)
+    for name, samples in _snapshot().items():
+        for key, value in samples:
+            _merge(merged, name, tuple(key), value)
+    directory = _config()['dir']
+    if not directory:
+        return merged
+    workers = []
+    for path in Path(directory).glob('*.json'):
+        try:
+            pid = int(path.stem)
+        except ValueError:
+            continue
+        if pid != os.getpid():
+            workers.append((pid, path))
+    live = [path for pid, path in workers if _alive(pid)]
+    dead = [path for pid, path in workers if path not in live]
+    if dead:
+        with _folding(directory):
+            for path in dead:
+                _fold(directory, path)
+    # The dead-process file goes last: a worker folded by a concurrent
+    # scrape after the listing is then still counted once.
+    for path in live + [Path(directory) / DEAD_FILE]:
+        data = _read(path)
+        for name, samples in (data or {}).items():
+            if name not in REGISTRY:
+                continue
+            for key, value in samples:
+                _merge(merged, name, tuple(key), value)
+    return merged
+
+
+def _labels(metric, key, extra=()):
+    pairs = list(zip(metric.labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """All metrics in the Prometheus text format."""
+    merged = collect()
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        samples = merged.get(metric.name, {})
+        if not samples and not metric.labelnames:
+            samples = {(): [0] * (len(metric.buckets) + 3) if metric.kind == 'histogram' else 0}
+        for key, value in sorted(samples.items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{metric.name}{_labels(metric, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{_labels(metric, key, [('le', bound)])} {cumulative}")
+            lines.append(f'{metric.name}_sum{_labels(metric, key)} {_number(value[-2])}')
+            lines.append(f'{metric.name}_count{_labels(metric, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _reset_after_fork():
+    # Workers forked from a preloaded master start from zero under their own pid.
+    global _lock, _flush_lock, _last_flush, _claimed
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _values.clear()
+    _last_flush = 0.0
+    _claimed = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
+
+
+# Request instrumentation
+
+_queries = ContextVar('metrics_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _wrap_connection(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class MetricsMiddleware:
+    """Record latency, status and query count of every request by URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _config()['enabled']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        for connection in connections.all():
+            _wrap_connection(connection)
+        connection_created.connect(_wrap_connection, dispatch_uid='metrics_queries')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counter = [0]
+        token = _queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    async def __acall__(self, request):
+        counter = [0]
+        token = _queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter[0])
+        return response
+
+    def record(self, request, response, seconds, queries):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unmatched>'
+        REQUEST_SECONDS.observe(seconds, view=view, method=request.method)
+        REQUEST_QUERIES.observe(queries, view=view)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
@@ -0,0 +1,253 @@
+"""Opt-in per-request performance profiling.
+
+:class:`ProfilingMiddleware` measures a sample of requests. For each one it
+records:
+
+* wall time, status and response size
+* the number of queries and the time spent in SQL
+* duplicated queries, i.e. the same statement run more than once, which
+  is how N+1 loops show up
+* template render time, including queries run while rendering
+
+The middleware is off unless ``PERF_PROFILING['enabled']`` is set, in which
+case Django drops it from the stack at startup. When on, unsampled requests
+only pay for one random draw. Each record is logged as one JSON line on the
+``erp_project.profiling`` logger. The latest ``buffer_size`` records are
+also kept in a per-process ring buffer, which :func:`slowest_endpoints` and
+:func:`worst_queries` summarise for the performance page.
+
+Streaming responses are measured up to the moment they are returned, so
+rows read while the body streams are not counted.
+"""
+
+import json
+import logging
+import random
+import re
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'enabled': False,
+    'sample_rate': 1.0,
+    'buffer_size': 1000,
+    'top_queries': 5,  # statements kept per record, by total time
+}
+
+_current = ContextVar('profile', default=None)
+_records = deque(maxlen=DEFAULTS['buffer_size'])
+_PLACEHOLDERS = re.compile(r'%s(?:, %s)+')
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'PERF_PROFILING', {})}
+
+
+class Profile:
+    """Counters of one sampled request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = defaultdict(lambda: [0, 0.0])  # sql -> [runs, seconds]
+        self.template_time = 0.0
+        self.rendering = False
+
+    def add_query(self, sql, seconds):
+        stat = self.statements[sql]
+        stat[0] += 1
+        stat[1] += seconds
+
+
+def _time_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - start)
+
+
+def _wrap_connection(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _install():
+    """Hook query and template timing into this process, once."""
+    for connection in connections.all():
+        _wrap_connection(connection)
+    # Threads and async views open their own connections later.
+    connection_created.connect(_wrap_connection, dispatch_uid='perf_profiling')
+    if getattr(Template.render, 'profiled', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context):
+        profile = _current.get()
+        if profile is None or profile.rendering:
+            return render(self, context)
+        profile.rendering = True  # included templates count towards the outer one
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_time += time.perf_counter() - start
+            profile.rendering = False
+
+    timed_render.profiled = True
+    Template.render = timed_render
+
+
+def _resize(size):
+    global _records
+    if _records.maxlen != size:
+        _records = deque(_records, maxlen=size)
+
+
+def _normalize(sql):
+    # ``IN (%s, %s, ...)`` lists of any length count as one statement.
+    return _PLACEHOLDERS.sub('%s, ...', sql)
+
+
+def build_record(request, response, profile, top=DEFAULTS['top_queries']):
+    statements = defaultdict(lambda: [0, 0.0])
+    for sql, (runs, seconds) in profile.statements.items():
+        stat = statements[_normalize(sql)]
+        stat[0] += runs
+        stat[1] += seconds
+    match = getattr(request, 'resolver_match', None)
+    worst = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        'time': timezone.now().isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else '',
+        'status': response.status_code,
+        'ms': round((time.perf_counter() - profile.started) * 1000, 2),
+        'queries': sum(runs for runs, _ in statements.values()),
+        'sql_ms': round(sum(seconds for _, seconds in statements.values()) * 1000, 2),
+        'duplicates': sum(runs - 1 for runs, _ in statements.values()),
+        'template_ms': round(profile.template_time * 1000, 2),
+        'bytes': None if response.streaming else len(response.content),
+        'top_queries': [
+            {'sql': sql, 'runs': runs, 'ms': round(seconds * 1000, 2)} for sql, (runs, seconds) in worst
+        ],
+    }
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = _config()
+        if not config['enabled']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(config['sample_rate'])
+        self.top = config['top_queries']
+        _resize(config['buffer_size'])
+        _install()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile)
+        return response
+
+    def record(self, request, response, profile):
+        record = build_record(request, response, profile, self.top)
+        _records.append(record)
+        logger.info(json.dumps(record))
+
+
+def records():
+    """Buffered records of this process, oldest first."""
+    return list(_records)
+
+
+def clear():
+    _records.clear()
+
+
+def slowest_endpoints(limit=20):
+    """Per-view averages of the buffered records, slowest first."""
+    groups = defaultdict(list)
+    for record in records():
+        groups[record['view'] or record['path']].append(record)
+    rows = []
+    for view, items in groups.items():
+        n = len(items)
+        sizes = [r['bytes'] for r in items if r['bytes'] is not None]
+        rows.append({
+            'view': view,
+            'requests': n,
+            'avg_ms': round(sum(r['ms'] for r in items) / n, 2),
+            'max_ms': max(r['ms'] for r in items),
+            'avg_queries': round(sum(r['queries'] for r in items) / n, 1),
+            'avg_sql_ms': round(sum(r['sql_ms'] for r in items) / n, 2),
+            'max_duplicates': max(r['duplicates'] for r in items),
+            'avg_template_ms': round(sum(r['template_ms'] for r in items) / n, 2),
+            'avg_bytes': round(sum(sizes) / len(sizes)) if sizes else None,
+        })
+    rows.sort(key=lambda row: row['avg_ms'], reverse=True)
+    return rows[:limit]
+
+
+def worst_queries(limit=20):
+    """Statements with the most total time across the buffered records.
+
+    Only each record's ``top_queries`` are kept, so cheap statements may be
+    missing.
+    """
+    stats = {}
+    for record in records():
+        for query in record['top_queries']:
+            stat = stats.setdefault(query['sql'], {
+                'sql': query['sql'], 'runs': 0, 'total_ms': 0.0, 'max_runs': 0, 'views': set(),
+            })
+            stat['runs'] += query['runs']
+            stat['total_ms'] += query['ms']
+            stat['max_runs'] = max(stat['max_runs'], query['runs'])
+            stat['views'].add(record['view'] or record['path'])
+    rows = sorted(stats.values(), key=lambda stat: stat['total_ms'], reverse=True)[:limit]
+    for row in rows:
+        row['total_ms'] = round(row['total_ms'], 2)
+        row['views'] = sorted(row['views'])
+    return rows
@@ -0,0 +1,94 @@
+"""Send the reads of list and report pages to the read replica.
+
+Views opt in with a ``read_replica = True`` class attribute, which
+``AdvancedListMixin`` sets for every list page, or with the
+:func:`read_replica` decorator for function views.
+:class:`ReadReplicaMiddleware` turns routing on for GET and HEAD requests to
+those views. It stays on until the response is closed, so streamed exports
+read from the replica too. :class:`ReplicaRouter` then answers reads from
+the ``replica`` alias when one is configured. Sessions and the logged-in
+user are always read from ``default`` so a lagging replica cannot log
+anyone out. Writes, such as the audit log, always go to ``default``.
+Without a replica alias nothing changes.
+
+Replicas lag, so the list shown right after a write may not include it.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.signals import request_finished
+from django.db import connections
+
+from .database import REPLICA
+
+_use_replica = ContextVar('use_replica', default=False)
+PRIMARY_ONLY = {'sessions'}
+
+
+def read_replica(view):
+    """Mark a function view as safe to serve from the replica."""
+    view.read_replica = True
+    return view
+
+
+@contextmanager
+def replica_reads():
+    """Route reads inside the block to the replica."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA in connections.settings and model._meta.app_label not in PRIMARY_ONLY:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA
+
+
+def _reset(**kwargs):
+    _use_replica.set(False)
+
+
+class ReadReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        request_finished.connect(_reset, dispatch_uid='read_replica_reset')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        _use_replica.set(False)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        _use_replica.set(False)
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if request.method in ('GET', 'HEAD') and getattr(view, 'read_replica', False):
+            user = getattr(request, 'user', None)
+            if user is not None:
+                user.is_authenticated  # load the lazy user from the primary first
+            _use_replica.set(True)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,7 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'erp_project.profiling.ProfilingMiddleware',
+    'erp_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'erp_project.routers.ReadReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +74,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'accounts.context_processors.nav_permissions',
+                'purchasing.context_processors.approval_queue',
             ],
         },
     },
@@ -78,13 +85,12 @@ WSGI_APPLICATION = 'erp_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Read from DB_* environment variables (see ``erp_project.database``). SQLite
+# by default; ``DB_ENGINE=postgres`` for production. List and report pages
+# read from the ``replica`` alias when one is configured.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+DATABASES = database_config(os.environ, BASE_DIR)
+DATABASE_ROUTERS = ['erp_project.routers.ReplicaRouter']
 
 
 # Password validation
@@ -139,6 +145,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Send emails to console during development
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@example.com')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -150,3 +157,78 @@ AUTH_USER_MODEL = 'accounts.User'
 # `/accounts/profile/` path which does not exist in this project.
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
+
+# Three-way match tolerances. An invoice matches when it is within
+# ``percent`` of the received value or within ``amount`` of it, whichever is
+# larger. ``qty_percent`` allows over-receipt against ordered quantities.
+INVOICE_MATCH_TOLERANCE = {
+    'percent': '0.5',
+    'amount': '1.00',
+    'qty_percent': '0',
+}
+
+# Background jobs (``accounts.jobs``). With ``JOBS_EAGER`` jobs run inside
+# the request that queues them instead of waiting for ``run_jobs``. Failed
+# jobs are retried after ``JOBS_RETRY_BACKOFF`` seconds, doubling each time.
+JOBS_EAGER = False
+JOBS_RETRY_BACKOFF = 30
+
+# Supplier scorecards (``purchasing.scorecards``). A receipt is on time when it
+# arrives within ``on_time_days`` of its PO date. Evaluation scores are out of
+# ``evaluation_max``. ``weights`` combine the components into a 0-100 score.
+SUPPLIER_SCORECARD = {
+    'on_time_days': 14,
+    'evaluation_max': '10',
+    'weights': {'quality': 30, 'delivery': 30, 'price': 20, 'accuracy': 20},
+}
+
+# Approval chains (``purchasing.approvals``) for requisitions and payments.
+# Levels run in order. A level applies when the document amount is at least
+# ``min_amount`` and, if ``types`` is given, the request type or payment
+# method is listed. Each level is approved by users holding ``permission``.
+APPROVAL_WORKFLOWS = {
+    'requisition': [
+        {'permission': 'approve_purchaserequisition'},
+    ],
+    'payment': [
+        {'permission': 'approve_payment'},
+    ],
+}
+
+# On SQLite, serialize this process's inserts into hot append-only tables
+# (audit log, job queue) behind a lock instead of contending for the
+# database's single write lock. See ``accounts.utils.serialized_write``.
+SQLITE_WRITE_LOCK = True
+
+# Per-request profiling (``erp_project.profiling``), off unless
+# PERF_PROFILING=1. ``sample_rate`` is the share of requests measured and
+# ``buffer_size`` how many recent records each process keeps for the
+# performance page. Records are also logged as JSON lines.
+PERF_PROFILING = {
+    'enabled': os.environ.get('PERF_PROFILING') == '1',
+    'sample_rate': float(os.environ.get('PERF_SAMPLE_RATE', '0.05')),
+    'buffer_size': 1000,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'erp_project.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Prometheus metrics (``erp_project.metrics``), served at /metrics to
+# superusers and to scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``.
+# With several worker processes set METRICS_DIR to a directory they share;
+# each process writes its values there at most every ``flush_seconds`` and
+# the endpoint adds them up.
+METRICS = {
+    'enabled': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'dir': os.environ.get('METRICS_DIR', ''),
+    'flush_seconds': 1,
+    'token': os.environ.get('METRICS_TOKEN', ''),
+}
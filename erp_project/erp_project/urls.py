@@ -24,7 +24,7 @@ from accounts.views import (
     CompanyDetailView, CompanyUpdateView, UserListView, CompanyUserCreateView,
     UserDetailView, UserUpdateView, UserToggleActiveView, WhoAmIView, DashboardAPI,
     RoleListView, RoleCreateView, RoleUpdateView, change_password_view,
-    AuditLogListView, AuditLogDetailView,
+    AuditLogListView, AuditLogDetailView, PerformanceView, metrics_view,
 )
 
 urlpatterns = [
@@ -46,6 +46,8 @@ urlpatterns = [
     path('roles/<int:pk>/edit/', RoleUpdateView.as_view(), name='role_edit'),
     path('audit-logs/', AuditLogListView.as_view(), name='audit_log_list'),
     path('audit-logs/<int:pk>/', AuditLogDetailView.as_view(), name='audit_log_detail'),
+    path('performance/', PerformanceView.as_view(), name='performance'),
+    path('metrics', metrics_view, name='metrics'),
     path('inventory/', include('inventory.urls')),
     path('purchasing/', include('purchasing.urls')),
     path('pos/', include('pos.urls')),
@@ -0,0 +1,165 @@
+"""Lot allocation engine for outbound stock.
+
+A lot's ``qty`` is what was received. ``reserved_qty`` holds quantities
+promised to open picks and ``consumed_qty`` what has physically left. The
+allocatable remainder is ``qty - reserved_qty - consumed_qty``. Consuming a
+lot also records an ``OUT`` movement tied to the batch, so stock totals from
+:mod:`inventory.stock` stay correct.
+
+Lots are picked in FEFO order (earliest expiry first, undated lots last) or
+FIFO order (oldest lot first). Expired lots are never allocated. Candidate
+lots are locked with ``select_for_update`` so concurrent picks cannot
+allocate the same quantity twice.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import StockLot, StockMovement
+
+FEFO = 'fefo'
+FIFO = 'fifo'
+STRATEGIES = (FEFO, FIFO)
+
+
+class AllocationError(ValueError):
+    """Raised when lots cannot cover a requested quantity.
+
+    ``line`` is the index of the offending line, if the error has one, and
+    ``reason`` the message without the line prefix.
+    """
+
+    def __init__(self, reason, line=None):
+        self.reason = reason
+        self.line = line
+        super().__init__(reason if line is None else f'Line {line}: {reason}')
+
+
+def available_lots(products, warehouses, strategy=FEFO, as_of=None):
+    """Return lots with allocatable stock, ordered for picking.
+
+    Ordering is by product and warehouse first, so one query serves a whole
+    order. This matches the ``(product, warehouse, expiry_date)`` index.
+    """
+    if strategy not in STRATEGIES:
+        raise AllocationError(f'Unknown strategy {strategy}')
+    as_of = as_of or timezone.localdate()
+    qs = (
+        StockLot.objects.filter(product__in=products, warehouse__in=warehouses)
+        .filter(Q(expiry_date__isnull=True) | Q(expiry_date__gte=as_of))
+        .filter(qty__gt=F('reserved_qty') + F('consumed_qty'))
+    )
+    if strategy == FEFO:
+        order = ['product_id', 'warehouse_id', F('expiry_date').asc(nulls_last=True), 'id']
+    else:
+        order = ['product_id', 'warehouse_id', 'id']
+    return qs.order_by(*order)
+
+
+def _allocate(lines, strategy, as_of):
+    """Split each ``(product_id, warehouse_id, qty)`` line across lots.
+
+    Must run inside a transaction. Returns one list of ``(lot, qty)`` pairs
+    per line, in the same order as ``lines``.
+    """
+    lines = [(int(p), int(w), Decimal(str(q))) for p, w, q in lines]
+    products = {p for p, _, _ in lines}
+    warehouses = {w for _, w, _ in lines}
+    pools = defaultdict(list)
+    for lot in available_lots(products, warehouses, strategy, as_of).select_for_update():
+        pools[(lot.product_id, lot.warehouse_id)].append(lot)
+    taken = defaultdict(Decimal)
+    result = []
+    for idx, (pid, wid, qty) in enumerate(lines):
+        if qty <= 0:
+            raise AllocationError('quantity must be positive', line=idx)
+        remaining = qty
+        picks = []
+        for lot in pools[(pid, wid)]:
+            free = lot.qty - lot.reserved_qty - lot.consumed_qty - taken[lot.pk]
+            if free <= 0:
+                continue
+            use = min(free, remaining)
+            picks.append((lot, use))
+            taken[lot.pk] += use
+            remaining -= use
+            if not remaining:
+                break
+        if remaining:
+            raise AllocationError(f'short by {remaining}', line=idx)
+        result.append(picks)
+    return result
+
+
+def _apply(allocations, field, sign=1):
+    totals = defaultdict(Decimal)
+    lots = {}
+    for picks in allocations:
+        for lot, qty in picks:
+            totals[lot.pk] += qty
+            lots[lot.pk] = lot
+    for pk, lot in lots.items():
+        setattr(lot, field, getattr(lot, field) + sign * totals[pk])
+    StockLot.objects.bulk_update(lots.values(), [field])
+
+
+def reserve_order(lines, strategy=FEFO, as_of=None):
+    """Reserve lot quantities for every line, all or nothing."""
+    with transaction.atomic():
+        allocations = _allocate(lines, strategy, as_of)
+        _apply(allocations, 'reserved_qty')
+    return allocations
+
+
+def pick_order(lines, strategy=FEFO, user=None, reference='', as_of=None):
+    """Allocate and immediately consume lots, recording OUT movements."""
+    with transaction.atomic():
+        allocations = _allocate(lines, strategy, as_of)
+        _apply(allocations, 'consumed_qty')
+        StockMovement.objects.bulk_create(_movements(allocations, user, reference))
+    return allocations
+
+
+def consume(allocations, user=None, reference=''):
+    """Turn reservations made by :func:`reserve_order` into consumption."""
+    with transaction.atomic():
+        _relock(allocations)
+        _apply(allocations, 'reserved_qty', -1)
+        _apply(allocations, 'consumed_qty')
+        StockMovement.objects.bulk_create(_movements(allocations, user, reference))
+
+
+def release(allocations):
+    """Return reserved quantities to the lots."""
+    with transaction.atomic():
+        _relock(allocations)
+        _apply(allocations, 'reserved_qty', -1)
+
+
+def _relock(allocations):
+    """Refresh lot counters under a row lock before changing them."""
+    lots = {lot.pk: lot for picks in allocations for lot, _ in picks}
+    fresh = StockLot.objects.select_for_update().in_bulk(list(lots))
+    for pk, lot in lots.items():
+        lot.reserved_qty = fresh[pk].reserved_qty
+        lot.consumed_qty = fresh[pk].consumed_qty
+
+
+def _movements(allocations, user, reference):
+    return [
+        StockMovement(
+            product_id=lot.product_id,
+            warehouse_id=lot.warehouse_id,
+            batch=lot,
+            quantity=qty,
+            movement_type=StockMovement.OUT,
+            user=user,
+            reference=reference,
+        )
+        for picks in allocations
+        for lot, qty in picks
+    ]
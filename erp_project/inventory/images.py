@@ -0,0 +1,175 @@
+"""Resized derivatives of product photos.
+
+Uploads are stored as-is and hashed in the request; :func:`add_images` skips
+files the product already has. The resizing itself runs in the
+``process_product_image`` background job: :func:`process_image` records the
+original dimensions and writes a JPEG and a WebP copy for every size in
+:data:`SIZES`. Derivatives are stored under the content hash, so identical
+photos on different products share them.
+
+Templates use the ``product_images`` tags to pick the smallest adequate
+size, falling back to the original until processing has finished.
+"""
+
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from accounts.jobs import enqueue
+
+from .models import ProductImage
+
+# Longest edge in pixels for each derivative.
+SIZES = {'thumb': 160, 'small': 480, 'large': 1200}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+DERIVED_DIR = 'product_photos/derived'
+
+
+def file_hash(fh):
+    digest = hashlib.sha256()
+    fh.seek(0)
+    for chunk in iter(lambda: fh.read(64 * 1024), b''):
+        digest.update(chunk)
+    fh.seek(0)
+    return digest.hexdigest()
+
+
+def add_images(product, files):
+    """Store uploaded photos for ``product`` and queue their processing.
+
+    Files identical to a photo the product already has are skipped. Returns
+    the created images.
+    """
+    seen = set(product.images.exclude(sha256='').values_list('sha256', flat=True))
+    created = []
+    for upload in files:
+        digest = file_hash(upload)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        image = ProductImage.objects.create(product=product, image=upload, sha256=digest)
+        enqueue('process_product_image', company=product.company, image_id=image.pk)
+        created.append(image)
+    return created
+
+
+def _derived_name(digest, size, ext):
+    return f'{DERIVED_DIR}/{digest[:2]}/{digest}_{size}.{ext}'
+
+
+def _encode(img, fmt, **options):
+    out = io.BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def _store(name, data):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def decode(data):
+    """Open image bytes, applying the EXIF orientation. Raises on bad data."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as src:
+        src.load()
+        return ImageOps.exif_transpose(src)
+
+
+def render_variants(img, digest):
+    """Write derivatives of the decoded image ``img``; return the variants.
+
+    Sizes at least as large as the original are produced once at the
+    original size.
+    """
+    from PIL import Image
+
+    original = img.size
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    flat = img
+    if img.mode == 'RGBA':
+        flat = Image.new('RGB', img.size, (255, 255, 255))
+        flat.paste(img, mask=img.getchannel('A'))
+    variants = {}
+    done = {}
+    for size, edge in sorted(SIZES.items(), key=lambda item: item[1]):
+        edge = min(edge, max(original))
+        if edge in done:
+            variants[size] = done[edge]
+            continue
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        resized_flat = resized
+        if flat is not img:
+            resized_flat = flat.copy()
+            resized_flat.thumbnail((edge, edge), Image.LANCZOS)
+        variant = {
+            'width': resized.width,
+            'height': resized.height,
+            'jpeg': _store(
+                _derived_name(digest, edge, 'jpg'),
+                _encode(resized_flat, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True),
+            ),
+            'webp': _store(
+                _derived_name(digest, edge, 'webp'),
+                _encode(resized, 'WEBP', quality=WEBP_QUALITY, method=4),
+            ),
+        }
+        variants[size] = done[edge] = variant
+    return variants
+
+
+def process_image(image_id):
+    """Fill in metadata and derivatives for one ``ProductImage``."""
+    from PIL import UnidentifiedImageError
+
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    with image.image.open('rb') as fh:
+        data = fh.read()
+    digest = image.sha256 or hashlib.sha256(data).hexdigest()
+    try:
+        img = decode(data)
+    except (UnidentifiedImageError, OSError, ValueError):
+        # Not a usable picture; keep serving the original file.
+        ProductImage.objects.filter(pk=image.pk).update(sha256=digest, status=ProductImage.FAILED)
+        return
+    width, height = img.size
+    variants = render_variants(img, digest)
+    ProductImage.objects.filter(pk=image.pk).update(
+        sha256=digest, width=width, height=height, variants=variants, status=ProductImage.READY
+    )
+
+
+def delete_image(image):
+    """Delete ``image`` and the derivatives no other photo shares.
+
+    The original upload is reference counted by its storage and removed by
+    ``gc_blobs`` once nothing uses it.
+    """
+    digest = image.sha256
+    variants = image.variants or {}
+    shared = bool(digest) and ProductImage.objects.filter(sha256=digest).exclude(pk=image.pk).exists()
+    names = set() if shared else {v[fmt] for v in variants.values() for fmt in ('jpeg', 'webp')}
+    image.delete()
+
+    def remove():
+        for name in names:
+            default_storage.delete(name)
+
+    transaction.on_commit(remove)
+
+
+def variant(image, size):
+    """Return the variant dict for ``size`` or ``None`` if not processed."""
+    if image.status != ProductImage.READY:
+        return None
+    return (image.variants or {}).get(size)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete stock reservations whose expiry time has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = sweep_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {count} reservations'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import enqueue
+from inventory.images import process_image
+from inventory.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and WebP copies for product images that lack them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess images that are already done')
+        parser.add_argument('--inline', action='store_true', help='Process here instead of queueing jobs')
+
+    def handle(self, *args, **options):
+        qs = ProductImage.objects.all()
+        if not options['all']:
+            qs = qs.filter(status=ProductImage.PENDING)
+        count = 0
+        for pk in qs.values_list('pk', flat=True).iterator():
+            if options['inline']:
+                process_image(pk)
+            else:
+                enqueue('process_product_image', image_id=pk)
+            count += 1
+        verb = 'Processed' if options['inline'] else 'Queued'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} images'))
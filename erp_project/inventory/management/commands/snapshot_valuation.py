@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import Company
+from inventory.valuation import end_of_day, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Store stock valuation snapshots at the end of a day (default: yesterday).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to snapshot as YYYY-MM-DD')
+        parser.add_argument('--company', help='Company code; all companies when omitted')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate() - timedelta(days=1)
+        except ValueError:
+            raise CommandError('Invalid --date, expected YYYY-MM-DD')
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(code=options['company'])
+        as_of = end_of_day(day)
+        total = 0
+        for company in companies:
+            total += take_snapshots(company, as_of)
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} snapshots for {day}'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_migrate_skus'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='transfer_key',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'warehouse'], name='stockmove_prod_wh_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_stockmovement_transfer_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocklot',
+            name='consumed_qty',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='reserved_qty',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['product', 'warehouse', 'expiry_date'], name='stocklot_pick_idx'),
+        ),
+    ]
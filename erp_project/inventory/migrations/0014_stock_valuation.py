@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_add_letterhead_field'),
+        ('inventory', '0013_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocklot',
+            name='received_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.CreateModel(
+            name='StockValuationSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('qty', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('avg_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('avg_value', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('fifo_value', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('layers', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuation_snapshots', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'as_of'], name='valsnap_company_asof_idx')],
+                'unique_together': {('product', 'as_of')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_stock_valuation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reorder_level',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
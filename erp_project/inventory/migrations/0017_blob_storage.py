@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:34
+
+import accounts.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=accounts.storage.get_blob_storage, upload_to='product_photos/'),
+        ),
+    ]
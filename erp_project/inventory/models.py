@@ -1,5 +1,7 @@
 from django.db import models
+from django.utils import timezone
 from accounts.models import Company
+from accounts.storage import get_blob_storage
 
 
 class Warehouse(models.Model):
@@ -93,6 +95,7 @@ class Product(models.Model):
     track_serial = models.BooleanField(default=False)
     vat_rate = models.DecimalField(max_digits=4, decimal_places=2, default=0)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    reorder_level = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     specs = models.JSONField(default=dict, blank=True)
 
     def save(self, *args, **kwargs):
@@ -120,10 +123,29 @@ class Product(models.Model):
 
 
 class ProductImage(models.Model):
-    """Photo attached to a product."""
+    """Photo attached to a product.
+
+    Resized JPEG and WebP copies are produced in the background by
+    ``inventory.images.process_image``; ``variants`` maps each size name to
+    their storage names and dimensions.
+    """
+
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
 
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='product_photos/')
+    image = models.ImageField(upload_to='product_photos/', storage=get_blob_storage)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
 
 
 class StockLot(models.Model):
@@ -131,12 +153,26 @@ class StockLot(models.Model):
     batch_number = models.CharField(max_length=100)
     expiry_date = models.DateField(null=True, blank=True)
     qty = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    received_at = models.DateTimeField(default=timezone.now)
+    reserved_qty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    consumed_qty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'expiry_date'], name='stocklot_pick_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.product} {self.batch_number}"
 
+    @property
+    def available_qty(self):
+        """Quantity that can still be allocated from this lot."""
+        return self.qty - self.reserved_qty - self.consumed_qty
+
 
 class StockMovement(models.Model):
     """Record stock in/out or transfer."""
@@ -156,9 +192,40 @@ class StockMovement(models.Model):
     user = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True)
     batch = models.ForeignKey(StockLot, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
     movement_type = models.CharField(max_length=3, choices=MOVEMENT_CHOICES)
     date = models.DateTimeField(auto_now_add=True)
     reference = models.CharField(max_length=255, blank=True)
+    transfer_key = models.UUIDField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'warehouse'], name='stockmove_prod_wh_idx'),
+        ]
+
+
+class StockReservation(models.Model):
+    """Quantity promised to an open order but not yet shipped.
+
+    Rows only exist while the reservation is active: releasing deletes them
+    and the ``expire_reservations`` command sweeps rows past ``expires_at``.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    reference = models.CharField(max_length=255, blank=True, db_index=True)
+    user = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'expires_at'], name='stockres_atp_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.reference or 'reservation'} {self.product} x{self.quantity}"
 
 
 class InventoryAdjustment(models.Model):
@@ -181,6 +248,33 @@ class InventoryAdjustment(models.Model):
     notes = models.TextField(blank=True)
 
 
+class StockValuationSnapshot(models.Model):
+    """Valuation state of one product at a point in time.
+
+    ``layers`` holds the open FIFO cost layers as ``[[qty, unit_cost], ...]``
+    strings so replay can resume from the snapshot instead of from the start.
+    """
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='valuation_snapshots')
+    as_of = models.DateTimeField()
+    qty = models.DecimalField(max_digits=14, decimal_places=2)
+    avg_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    avg_value = models.DecimalField(max_digits=16, decimal_places=2)
+    fifo_value = models.DecimalField(max_digits=16, decimal_places=2)
+    layers = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('product', 'as_of')
+        indexes = [
+            models.Index(fields=['company', 'as_of'], name='valsnap_company_asof_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product} @ {self.as_of:%Y-%m-%d}"
+
+
 class IdentifierType(models.Model):
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=100)
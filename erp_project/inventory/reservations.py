@@ -0,0 +1,156 @@
+"""Stock reservations and available-to-promise (ATP).
+
+ATP for a (product, warehouse) pair is on-hand stock from
+:mod:`inventory.stock` minus active reservations and minus quantities held
+on lots by :func:`inventory.allocation.reserve_order` (``reserved_qty``). A
+reservation is active while it has no ``expires_at`` or that time is still
+in the future, so expired rows stop counting immediately even before the
+sweeper deletes them.
+
+Reservations are created and released in bulk. Creating them checks ATP for
+every line under a row lock on the products involved, so two concurrent
+orders cannot both promise the last unit.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockLot, StockReservation, Warehouse
+from .stock import QTY_FIELD, ZERO, annotate_stock, stock_levels
+
+
+class ReservationError(ValueError):
+    """Raised when a reservation would exceed available stock."""
+
+
+def active_reservations(now=None):
+    """Return reservations that still hold stock at ``now``."""
+    now = now or timezone.now()
+    return StockReservation.objects.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+
+
+def reserved_levels(company, products=None, warehouses=None, now=None):
+    """Return ``{(product_id, warehouse_id): reserved qty}``, reservations and lots together."""
+    totals = defaultdict(lambda: ZERO)
+    sources = [
+        (active_reservations(now), Sum('quantity')),
+        (StockLot.objects.filter(reserved_qty__gt=0), Sum('reserved_qty')),
+    ]
+    for qs, agg in sources:
+        qs = qs.filter(product__company=company)
+        if products is not None:
+            qs = qs.filter(product__in=products)
+        if warehouses is not None:
+            qs = qs.filter(warehouse__in=warehouses)
+        for row in qs.values('product_id', 'warehouse_id').annotate(q=agg).order_by():
+            totals[(row['product_id'], row['warehouse_id'])] += row['q'] or ZERO
+    return dict(totals)
+
+
+def atp_levels(company, products=None, warehouses=None, now=None):
+    """Return ``{(product_id, warehouse_id): available-to-promise qty}``."""
+    levels = defaultdict(lambda: ZERO, stock_levels(company, products, warehouses))
+    for key, qty in reserved_levels(company, products, warehouses, now).items():
+        levels[key] -= qty
+    return dict(levels)
+
+
+def atp_by_product(company, products=None, warehouses=None, now=None):
+    """Return ``{product_id: qty}`` summed across warehouses."""
+    result = defaultdict(lambda: ZERO)
+    for (pid, _), qty in atp_levels(company, products, warehouses, now).items():
+        result[pid] += qty
+    return dict(result)
+
+
+def _reserved_sum(qs, field):
+    return Coalesce(
+        Subquery(
+            qs.filter(product=OuterRef('pk')).values('product').annotate(q=Sum(field)).values('q')[:1],
+            output_field=QTY_FIELD,
+        ),
+        Value(ZERO),
+        output_field=QTY_FIELD,
+    )
+
+
+def annotate_atp(products_qs, now=None):
+    """Annotate products with ``total_qty``, ``reserved_total`` and ``atp_qty``."""
+    return annotate_stock(products_qs).annotate(
+        reserved_total=(
+            _reserved_sum(active_reservations(now), 'quantity')
+            + _reserved_sum(StockLot.objects.filter(reserved_qty__gt=0), 'reserved_qty')
+        ),
+    ).annotate(
+        atp_qty=F('total_qty') - F('reserved_total'),
+    )
+
+
+def reserve(company, lines, reference='', user=None, ttl=None, now=None):
+    """Reserve ``(product_id, warehouse_id, qty)`` lines, all or nothing.
+
+    ``ttl`` is a ``timedelta`` after which the reservations lapse; ``None``
+    keeps them until released. Returns the created reservations.
+    """
+    now = now or timezone.now()
+    lines = [(int(p), int(w), Decimal(str(q))) for p, w, q in lines]
+    wanted = defaultdict(Decimal)
+    for idx, (pid, wid, qty) in enumerate(lines):
+        if qty <= 0:
+            raise ReservationError(f'Line {idx}: quantity must be positive')
+        wanted[(pid, wid)] += qty
+    product_ids = {pid for pid, _ in wanted}
+    warehouse_ids = {wid for _, wid in wanted}
+    expires_at = now + ttl if ttl else None
+    with transaction.atomic():
+        locked = list(
+            Product.objects.select_for_update()
+            .filter(company=company, pk__in=product_ids)
+            .values_list('pk', flat=True)
+        )
+        known_warehouses = Warehouse.objects.filter(company=company, pk__in=warehouse_ids).count()
+        if len(locked) != len(product_ids) or known_warehouses != len(warehouse_ids):
+            raise ReservationError('Unknown product or warehouse')
+        available = atp_levels(company, product_ids, warehouse_ids, now)
+        for (pid, wid), qty in wanted.items():
+            free = available.get((pid, wid), ZERO)
+            if qty > free:
+                raise ReservationError(f'Product {pid} in warehouse {wid}: only {free} available')
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=pid, warehouse_id=wid, quantity=qty,
+                reference=reference, user=user, expires_at=expires_at,
+            )
+            for pid, wid, qty in lines
+        ])
+
+
+def release(company, reference=None, ids=None):
+    """Delete reservations by reference and/or ids. Returns the count."""
+    if reference is None and not ids:
+        return 0
+    qs = StockReservation.objects.filter(product__company=company)
+    if reference is not None:
+        qs = qs.filter(reference=reference)
+    if ids:
+        qs = qs.filter(pk__in=ids)
+    return qs.delete()[0]
+
+
+def sweep_expired(now=None, batch_size=1000):
+    """Delete lapsed reservations in batches. Returns the count."""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += StockReservation.objects.filter(pk__in=ids).delete()[0]
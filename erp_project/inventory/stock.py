@@ -0,0 +1,148 @@
+"""Stock quantity engine.
+
+On-hand stock for a (product, warehouse) pair is::
+
+    lots + inbound - outbound + transfers in - transfers out + adjustments
+
+Transfers are stored as two paired ``StockMovement`` rows sharing a
+``transfer_key``: the outbound leg has ``warehouse == from_warehouse`` and the
+inbound leg has ``warehouse == to_warehouse``. Every row therefore only
+affects its own ``warehouse`` and company-wide totals net transfers to zero.
+Legacy transfer rows without ``from_warehouse``/``to_warehouse`` carry no
+direction and are ignored.
+
+All helpers issue a fixed number of grouped queries regardless of how many
+products or warehouses are involved.
+"""
+
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import (
+    Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from erp_project import metrics
+
+from .models import InventoryAdjustment, StockLot, StockMovement
+
+QTY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal('0')
+
+
+def signed_quantity():
+    """Expression giving a movement's effect on its own warehouse."""
+    return Case(
+        When(movement_type=StockMovement.IN, then=F('quantity')),
+        When(movement_type=StockMovement.OUT, then=-F('quantity')),
+        When(
+            movement_type=StockMovement.TRANSFER,
+            warehouse=F('to_warehouse'),
+            then=F('quantity'),
+        ),
+        When(
+            movement_type=StockMovement.TRANSFER,
+            warehouse=F('from_warehouse'),
+            then=-F('quantity'),
+        ),
+        default=Value(ZERO),
+        output_field=QTY_FIELD,
+    )
+
+
+def _scope(qs, company, products, warehouses):
+    qs = qs.filter(product__company=company)
+    if products is not None:
+        qs = qs.filter(product__in=products)
+    if warehouses is not None:
+        qs = qs.filter(warehouse__in=warehouses)
+    return qs
+
+
+@metrics.STOCK_SECONDS.time(function='stock_levels')
+def stock_levels(company, products=None, warehouses=None):
+    """Return ``{(product_id, warehouse_id): qty}`` for non-empty pairs."""
+    totals = defaultdict(lambda: ZERO)
+    sources = [
+        (StockLot.objects, Sum('qty')),
+        (StockMovement.objects, Sum(signed_quantity())),
+        (InventoryAdjustment.objects, Sum('qty')),
+    ]
+    for manager, agg in sources:
+        rows = (
+            _scope(manager.all(), company, products, warehouses)
+            .values('product_id', 'warehouse_id')
+            .annotate(q=agg)
+            .order_by()
+        )
+        for row in rows:
+            totals[(row['product_id'], row['warehouse_id'])] += row['q'] or ZERO
+    return dict(totals)
+
+
+def stock_by_product(company, products=None, warehouses=None):
+    """Return ``{product_id: qty}`` summed across warehouses."""
+    result = defaultdict(lambda: ZERO)
+    for (pid, _), qty in stock_levels(company, products, warehouses).items():
+        result[pid] += qty
+    return dict(result)
+
+
+def stock_by_warehouse(company, products=None, warehouses=None):
+    """Return ``{warehouse_id: qty}`` summed across products."""
+    result = defaultdict(lambda: ZERO)
+    for (_, wid), qty in stock_levels(company, products, warehouses).items():
+        result[wid] += qty
+    return dict(result)
+
+
+def _product_sum(manager, expr):
+    return Coalesce(
+        Subquery(
+            manager.filter(product=OuterRef('pk'))
+            .values('product')
+            .annotate(q=Sum(expr))
+            .values('q')[:1],
+            output_field=QTY_FIELD,
+        ),
+        Value(ZERO),
+        output_field=QTY_FIELD,
+    )
+
+
+def annotate_stock(products_qs):
+    """Annotate a product queryset with ``total_qty`` using subqueries.
+
+    Correlated subqueries avoid the row fan-out that joining lots, movements
+    and adjustments in a single ``GROUP BY`` would cause.
+    """
+    return products_qs.annotate(
+        lot_qty=_product_sum(StockLot.objects, 'qty'),
+        move_qty=_product_sum(StockMovement.objects, signed_quantity()),
+        adj_qty=_product_sum(InventoryAdjustment.objects, 'qty'),
+    ).annotate(
+        total_qty=F('lot_qty') + F('move_qty') + F('adj_qty'),
+    )
+
+
+def transfer_legs(product, source, target, quantity, user=None, reference='', batch=None):
+    """Return the two unsaved movement rows that make up a transfer."""
+    key = uuid.uuid4()
+    common = {
+        'product': product,
+        'from_warehouse': source,
+        'to_warehouse': target,
+        'quantity': quantity,
+        'movement_type': StockMovement.TRANSFER,
+        'user': user,
+        'reference': reference,
+        'batch': batch,
+        'transfer_key': key,
+    }
+    return [
+        StockMovement(warehouse=source, **common),
+        StockMovement(warehouse=target, **common),
+    ]
+
@@ -0,0 +1,8 @@
+from accounts.jobs import task
+
+from .images import process_image
+
+
+@task('process_product_image')
+def process_product_image(image_id):
+    process_image(image_id)
@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from inventory.images import SIZES, variant
+
+register = template.Library()
+
+
+def _srcset(image, fmt):
+    seen = {}
+    for size in SIZES:
+        v = variant(image, size)
+        if v and v['width'] not in seen:
+            seen[v['width']] = default_storage.url(v[fmt])
+    return ', '.join(f'{url} {width}w' for width, url in sorted(seen.items()))
+
+
+@register.filter
+def image_url(image, size='thumb'):
+    """URL of the JPEG derivative for ``size``, or of the original upload."""
+    v = variant(image, size)
+    return default_storage.url(v['jpeg']) if v else image.image.url
+
+
+@register.simple_tag
+def product_picture(image, size='large', css_class='', sizes='100vw', alt=''):
+    """Render a ``<picture>`` offering WebP and JPEG at every processed size.
+
+    Browsers pick the smallest candidate that fills ``sizes``; ``size`` is
+    the fallback for browsers without ``srcset`` support. Unprocessed
+    images render the original file.
+    """
+    v = variant(image, size)
+    if v is None:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', image.image.url, css_class, alt)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" width="{}" height="{}" loading="lazy">'
+        '</picture>',
+        _srcset(image, 'webp'), sizes,
+        default_storage.url(v['jpeg']), _srcset(image, 'jpeg'), sizes, css_class, alt,
+        v['width'], v['height'],
+    )
@@ -1,4 +1,6 @@
 from django.urls import reverse
+import json
+from decimal import Decimal
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from accounts.models import Company, Role, UserRole, Permission, AuditLog
@@ -12,6 +14,7 @@ from .models import (
     StockMovement,
     InventoryAdjustment,
     ProductSerial,
+    StockReservation,
 )
 
 User = get_user_model()
@@ -478,3 +481,410 @@ class ProductImagePermissionTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertGreaterEqual(resp.content.decode().count('carousel-item'), 20)
 
+
+
+class ProductImagePipelineTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='PicCo', code='PC1')
+        self.user = User.objects.create_user(username='pic', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        for code in ['can_edit_product_images', 'view_product']:
+            perm, _ = Permission.objects.get_or_create(codename=code)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='pic', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Lamp', sku='L1', unit=unit, company=self.company)
+
+    def _png(self, name='p.png', size=(2000, 1000)):
+        import io
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        out = io.BytesIO()
+        Image.new('RGBA', size, (200, 10, 10, 128)).save(out, 'PNG')
+        return SimpleUploadedFile(name, out.getvalue(), content_type='image/png')
+
+    def test_upload_is_processed_off_request(self):
+        from django.core.files.storage import default_storage
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from accounts.jobs import run_worker
+
+        data = self._png().read()
+        url = reverse('product_image_add', args=[self.product.id])
+        self.client.post(url, {'photos': [SimpleUploadedFile('a.png', data), SimpleUploadedFile('b.png', data)]})
+        image = ProductImage.objects.get()
+        self.assertEqual(image.status, ProductImage.PENDING)
+        self.assertEqual(len(image.sha256), 64)
+        resp = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertContains(resp, image.image.url)
+        self.assertNotContains(resp, '<picture>')
+
+        self.assertEqual(run_worker(once=True), 1)
+        image.refresh_from_db()
+        self.assertEqual(image.status, ProductImage.READY)
+        self.assertEqual((image.width, image.height), (2000, 1000))
+        self.assertEqual((image.variants['thumb']['width'], image.variants['thumb']['height']), (160, 80))
+        self.assertEqual(image.variants['large']['width'], 1200)
+        for v in image.variants.values():
+            self.assertTrue(default_storage.exists(v['webp']))
+        resp = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertContains(resp, 'type="image/webp"')
+        self.assertContains(resp, ' 480w')
+        self.assertContains(resp, default_storage.url(image.variants['thumb']['jpeg']))
+
+        # Re-uploading the same file is skipped.
+        self.client.post(url, {'photos': SimpleUploadedFile('c.png', data)})
+        self.assertEqual(ProductImage.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('product_image_delete', args=[image.id]))
+        self.assertFalse(default_storage.exists(image.variants['thumb']['webp']))
+
+    def test_small_and_invalid_images(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .images import process_image
+
+        small = ProductImage.objects.create(product=self.product, image=self._png(size=(100, 50)))
+        bad = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile('x.jpg', b'abc', content_type='image/jpeg')
+        )
+        process_image(small.pk)
+        process_image(bad.pk)
+        small.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(small.variants['thumb'], small.variants['large'])
+        self.assertEqual(small.variants['large']['width'], 100)
+        self.assertEqual(bad.status, ProductImage.FAILED)
+        resp = self.client.get(reverse('product_quick_view', args=[self.product.id]))
+        self.assertContains(resp, bad.image.url)
+
+
+class ListExportTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='ExpCo', code='EXP')
+        self.user = User.objects.create_user(username='exp', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        for codename in ['view_product', 'view_stockmovement', 'view_inventoryadjustment']:
+            perm, _ = Permission.objects.get_or_create(codename=codename)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='exp', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.hammer = Product.objects.create(name='Hammer', sku='H1', unit=unit, company=self.company)
+        Product.objects.create(name='Drill', sku='D1', unit=unit, company=self.company)
+        self.wh = Warehouse.objects.create(name='Main', location='A', company=self.company)
+
+    def test_csv_export_honours_search_and_sort(self):
+        resp = self.client.get(reverse('product_list'), {'q': 'Ham', 'export': 'csv'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        body = b''.join(resp.streaming_content).decode()
+        lines = body.strip().splitlines()
+        self.assertTrue(lines[0].startswith('sku,name'))
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Hammer', lines[1])
+        resp = self.client.get(reverse('product_list'), {'sort': '-name', 'export': 'csv'})
+        lines = b''.join(resp.streaming_content).decode().strip().splitlines()
+        self.assertIn('Hammer', lines[1])
+        self.assertIn('Drill', lines[2])
+
+    def test_jsonl_and_columnar_exports(self):
+        StockMovement.objects.create(product=self.hammer, warehouse=self.wh, quantity=3, movement_type=StockMovement.IN, reference='R1')
+        resp = self.client.get(reverse('stock_movement_list'), {'export': 'jsonl'})
+        rows = [json.loads(l) for l in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[0]['product__sku'], 'H1')
+        self.assertEqual(rows[0]['quantity'], '3.00')
+        from accounts.exports import read_columnar
+        resp = self.client.get(reverse('product_list'), {'export': 'columnar'})
+        rows = read_columnar(b''.join(resp.streaming_content))
+        self.assertEqual({r['sku'] for r in rows}, {'H1', 'D1'})
+        self.assertTrue(AuditLog.objects.filter(action='export', actor=self.user).exists())
+
+    def test_unknown_format_rejected(self):
+        resp = self.client.get(reverse('inventory_adjustment_list'), {'export': 'xml'})
+        self.assertEqual(resp.status_code, 400)
+
+
+class StockTransferTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='MoveCo', code='MV')
+        self.user = User.objects.create_user(username='mover', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        for codename in ['add_stockmovement', 'view_stock_on_hand', 'view_product']:
+            perm, _ = Permission.objects.get_or_create(codename=codename)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='mover', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Bolt', sku='B1', unit=unit, company=self.company)
+        self.src = Warehouse.objects.create(name='Src', location='A', company=self.company)
+        self.dst = Warehouse.objects.create(name='Dst', location='B', company=self.company)
+        StockLot.objects.create(product=self.product, warehouse=self.src, batch_number='L1', qty=10)
+
+    def test_transfer_moves_stock_between_warehouses(self):
+        from .stock import stock_levels, stock_by_product
+        resp = self.client.post(reverse('stock_movement_add'), {
+            'product': self.product.id, 'warehouse': self.src.id, 'to_warehouse': self.dst.id,
+            'qty': '4', 'movement_type': StockMovement.TRANSFER,
+        })
+        self.assertEqual(resp.status_code, 302)
+        legs = StockMovement.objects.filter(movement_type=StockMovement.TRANSFER)
+        self.assertEqual(legs.count(), 2)
+        self.assertEqual(len({m.transfer_key for m in legs}), 1)
+        levels = stock_levels(self.company)
+        self.assertEqual(levels[(self.product.id, self.src.id)], 6)
+        self.assertEqual(levels[(self.product.id, self.dst.id)], 4)
+        self.assertEqual(stock_by_product(self.company)[self.product.id], 10)
+
+    def test_bulk_endpoint_is_atomic(self):
+        url = reverse('stock_movement_bulk')
+        lines = [
+            {'product': self.product.id, 'warehouse': self.src.id, 'quantity': '2', 'movement_type': 'IN'},
+            {'product': self.product.id, 'warehouse': self.src.id, 'quantity': '3', 'movement_type': 'TR', 'to_warehouse': self.dst.id},
+            {'product': self.product.id, 'warehouse': self.src.id, 'quantity': '1', 'movement_type': 'TR', 'to_warehouse': self.src.id},
+        ]
+        resp = self.client.post(url, json.dumps({'lines': lines}), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('2', resp.json()['errors'])
+        self.assertFalse(StockMovement.objects.exists())
+        for bad in ('NaN', 'Infinity', '-inf'):
+            resp = self.client.post(url, json.dumps({'lines': [dict(lines[0], quantity=bad)]}),
+                                    content_type='application/json')
+            self.assertEqual(resp.json(), {'errors': {'0': 'Quantity must be positive'}})
+        resp = self.client.post(url, json.dumps({'lines': lines[:2]}), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json(), {'created': 3, 'transfers': 1})
+        from .stock import stock_by_warehouse
+        levels = stock_by_warehouse(self.company)
+        self.assertEqual(levels[self.src.id], 9)
+        self.assertEqual(levels[self.dst.id], 3)
+
+    def test_product_list_stock_not_inflated_by_joins(self):
+        StockLot.objects.create(product=self.product, warehouse=self.src, batch_number='L2', qty=5)
+        StockMovement.objects.create(product=self.product, warehouse=self.src, quantity=1, movement_type=StockMovement.OUT)
+        StockMovement.objects.create(product=self.product, warehouse=self.src, quantity=2, movement_type=StockMovement.IN)
+        resp = self.client.get(reverse('product_list'))
+        self.assertEqual(resp.context['page_obj'][0].total_qty, 16)
+
+
+class LotAllocationTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.company = Company.objects.create(name='PickCo', code='PK')
+        self.user = User.objects.create_user(username='picker', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        perm, _ = Permission.objects.get_or_create(codename='add_stockmovement')
+        role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='picker', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Milk', sku='M1', unit=unit, company=self.company)
+        self.wh = Warehouse.objects.create(name='Cold', location='C', company=self.company)
+        self.today = timezone.localdate()
+        lot = lambda n, q, days: StockLot.objects.create(
+            product=self.product, warehouse=self.wh, batch_number=n, qty=q,
+            expiry_date=self.today + timedelta(days=days) if days is not None else None,
+        )
+        self.expired = lot('OLD', 5, -30)
+        self.late = lot('LATE', 4, 90)
+        self.early = lot('EARLY', 3, 30)
+        self.undated = lot('NODATE', 10, None)
+
+    def test_fefo_picks_earliest_expiry_and_skips_expired(self):
+        from .allocation import pick_order
+        from .stock import stock_levels
+        [picks] = pick_order([(self.product.id, self.wh.id, 5)], 'fefo', self.user, 'SO-1', as_of=self.today)
+        self.assertEqual([(lot.batch_number, qty) for lot, qty in picks], [('EARLY', 3), ('LATE', 2)])
+        self.early.refresh_from_db()
+        self.assertEqual(self.early.available_qty, 0)
+        moves = StockMovement.objects.filter(movement_type=StockMovement.OUT, reference='SO-1')
+        self.assertEqual({m.batch_id for m in moves}, {self.early.id, self.late.id})
+        self.assertEqual(stock_levels(self.company)[(self.product.id, self.wh.id)], 17)
+
+    def test_fifo_picks_oldest_lot(self):
+        from .allocation import pick_order
+        [picks] = pick_order([(self.product.id, self.wh.id, 6)], 'fifo', as_of=self.today)
+        self.assertEqual([(lot.batch_number, qty) for lot, qty in picks], [('LATE', 4), ('EARLY', 2)])
+
+    def test_shortfall_reserves_nothing(self):
+        from .allocation import AllocationError, reserve_order
+        with self.assertRaises(AllocationError):
+            reserve_order([(self.product.id, self.wh.id, 2), (self.product.id, self.wh.id, 16)], as_of=self.today)
+        self.assertFalse(StockLot.objects.filter(reserved_qty__gt=0).exists())
+
+    def test_reserve_then_release_and_consume(self):
+        from .allocation import consume, release, reserve_order
+        first = reserve_order([(self.product.id, self.wh.id, 2)], as_of=self.today)
+        self.early.refresh_from_db()
+        self.assertEqual(self.early.reserved_qty, 2)
+        second = reserve_order([(self.product.id, self.wh.id, 2)], as_of=self.today)
+        self.assertEqual([lot.batch_number for lot, _ in second[0]], ['EARLY', 'LATE'])
+        release(first)
+        consume(second, reference='SO-2')
+        self.early.refresh_from_db()
+        self.assertEqual((self.early.reserved_qty, self.early.consumed_qty), (0, 1))
+        self.assertEqual(StockMovement.objects.filter(reference='SO-2').count(), 2)
+
+    def test_bulk_endpoint_allocates_outbound_lines(self):
+        url = reverse('stock_movement_bulk')
+        lines = [{'product': self.product.id, 'warehouse': self.wh.id, 'quantity': '25',
+                  'movement_type': 'OUT', 'allocate': 'fifo'}]
+        inbound = {'product': self.product.id, 'warehouse': self.wh.id, 'quantity': '1', 'movement_type': 'IN'}
+        resp = self.client.post(url, json.dumps({'lines': [inbound] + lines}), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {'errors': {'1': 'Cannot allocate: short by 8.00'}})
+        self.assertFalse(StockMovement.objects.exists())
+        lines[0]['quantity'] = '12'
+        resp = self.client.post(url, json.dumps({'lines': lines}), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(StockMovement.objects.filter(batch__isnull=False).count(), 3)
+
+    def test_form_rejects_invalid_quantities(self):
+        url = reverse('stock_movement_add')
+        data = {'product': self.product.id, 'warehouse': self.wh.id, 'movement_type': 'OUT', 'allocate': 'fefo'}
+        for bad in ('abc', 'NaN', '-2', '0'):
+            resp = self.client.post(url, dict(data, qty=bad))
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.context['error'], 'Quantity must be positive')
+        resp = self.client.post(url, dict(data, qty='-1', movement_type='IN'))
+        self.assertEqual(resp.context['error'], 'Quantity must be positive')
+        self.assertFalse(StockMovement.objects.exists())
+        resp = self.client.post(url, dict(data, qty='2'))
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(StockMovement.objects.get().batch_id, self.early.id)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='ResCo', code='RS')
+        self.user = User.objects.create_user(username='reserver', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        for codename in ['add_stockmovement', 'view_product']:
+            perm, _ = Permission.objects.get_or_create(codename=codename)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='reserver', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Chair', sku='CH1', unit=unit, company=self.company, barcode='1234567890123')
+        self.wh = Warehouse.objects.create(name='Main', location='M', company=self.company)
+        StockLot.objects.create(product=self.product, warehouse=self.wh, batch_number='C1', qty=10)
+
+    def reserve(self, qty, reference='SO-1', **extra):
+        lines = [{'product': self.product.id, 'warehouse': self.wh.id, 'quantity': str(qty)}]
+        return self.client.post(
+            reverse('stock_reservation_create'),
+            json.dumps({'reference': reference, 'lines': lines, **extra}),
+            content_type='application/json',
+        )
+
+    def test_reservations_reduce_atp_and_block_oversell(self):
+        from .reservations import atp_levels
+        self.assertEqual(self.reserve(7).status_code, 201)
+        self.assertEqual(atp_levels(self.company)[(self.product.id, self.wh.id)], 3)
+        resp = self.reserve(4, 'SO-2')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(StockReservation.objects.count(), 1)
+        resp = self.client.get(reverse('product_list'))
+        row = resp.context['page_obj'][0]
+        self.assertEqual((row.total_qty, row.atp_qty), (10, 3))
+
+    def test_lot_reservations_reduce_atp(self):
+        from .allocation import reserve_order
+        from .reservations import atp_by_product
+        reserve_order([(self.product.id, self.wh.id, 6)])
+        self.assertEqual(atp_by_product(self.company)[self.product.id], 4)
+        self.assertEqual(self.reserve(5).status_code, 409)
+        self.assertEqual(self.reserve(3).status_code, 201)
+        row = self.client.get(reverse('product_list')).context['page_obj'][0]
+        self.assertEqual((row.total_qty, row.reserved_total, row.atp_qty), (10, 9, 1))
+
+    def test_release_by_reference(self):
+        self.reserve(5, 'SO-9')
+        self.reserve(2, 'SO-10')
+        resp = self.client.post(
+            reverse('stock_reservation_release'), json.dumps({'reference': 'SO-9'}),
+            content_type='application/json',
+        )
+        self.assertEqual(resp.json()['released'], 1)
+        self.assertEqual(list(StockReservation.objects.values_list('reference', flat=True)), ['SO-10'])
+
+    def test_expired_reservations_stop_counting_and_are_swept(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .reservations import atp_by_product, reserve
+        reserve(self.company, [(self.product.id, self.wh.id, 6)], 'SO-3', ttl=timedelta(minutes=5))
+        later = timezone.now() + timedelta(minutes=10)
+        self.assertEqual(atp_by_product(self.company, now=later)[self.product.id], 10)
+        self.assertEqual(atp_by_product(self.company)[self.product.id], 4)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('expire_reservations', stdout=out)
+        self.assertIn('Expired 1', out.getvalue())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_pos_scan_shows_atp(self):
+        self.reserve(4)
+        resp = self.client.post(reverse('pos_scan'), {'code': '1234567890123'})
+        self.assertEqual(resp.context['atp'], 6)
+        self.assertContains(resp, 'Available: 6')
+
+
+class StockValuationTests(TestCase):
+    def setUp(self):
+        from datetime import datetime
+        from django.utils import timezone
+        self.company = Company.objects.create(name='ValCo', code='VL')
+        self.user = User.objects.create_user(username='valuer', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        perm, _ = Permission.objects.get_or_create(codename='view_stock_on_hand')
+        role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='valuer', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Desk', sku='D1', unit=unit, company=self.company, sale_price=500)
+        self.wh = Warehouse.objects.create(name='Main', location='M', company=self.company)
+        self.at = lambda day: timezone.make_aware(datetime(2026, 1, day, 12))
+        self.move('IN', 10, 5, day=1)
+        self.move('IN', 10, 8, day=5)
+        self.move('OUT', 15, None, day=10)
+        self.move('IN', 5, 10, day=20)
+
+    def move(self, mtype, qty, cost, day):
+        m = StockMovement.objects.create(
+            product=self.product, warehouse=self.wh, quantity=qty, unit_cost=cost, movement_type=mtype
+        )
+        StockMovement.objects.filter(pk=m.pk).update(date=self.at(day))
+
+    def test_fifo_and_moving_average_as_of(self):
+        from .valuation import stock_as_of, valuation_as_of
+        val = valuation_as_of(self.company, self.at(12))[self.product.id]
+        # FIFO: 5 left from the 8.00 layer. Average: 6.50 for the remaining 5.
+        self.assertEqual(val['qty'], 5)
+        self.assertEqual(val['fifo_value'], 40)
+        self.assertEqual(val['avg_value'], Decimal('32.50'))
+        val = valuation_as_of(self.company, self.at(25))[self.product.id]
+        self.assertEqual(val['fifo_value'], 90)
+        self.assertEqual(val['avg_cost'], Decimal('8.25'))
+        self.assertEqual(stock_as_of(self.company, self.at(3))[self.product.id], 10)
+
+    def test_snapshot_plus_delta_matches_full_replay(self):
+        from .valuation import take_snapshots, valuation_as_of
+        full = valuation_as_of(self.company, self.at(25))
+        self.assertEqual(take_snapshots(self.company, self.at(12)), 1)
+        # Events before the snapshot no longer matter once it exists.
+        StockMovement.objects.filter(date__lte=self.at(12)).delete()
+        self.assertEqual(valuation_as_of(self.company, self.at(25)), full)
+
+    def test_snapshot_command_and_report(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('snapshot_valuation', date='2026-01-15', company='VL', stdout=out)
+        self.assertIn('Stored 1 snapshots', out.getvalue())
+        resp = self.client.get(reverse('stock_valuation'), {'as_of': '2026-01-12'})
+        self.assertEqual(resp.context['totals']['fifo_value'], 40)
+        self.assertContains(resp, 'Desk')
@@ -7,9 +7,10 @@ from .views import (
     ProductListView, ProductCreateView, ProductDetailView, ProductUpdateView, ProductQuickView,
     ProductImageAddView, ProductImageDeleteView,
     StockLotListView, StockLotCreateView,
-    StockMovementListView, StockMovementCreateView,
+    StockMovementListView, StockMovementCreateView, StockMovementBulkView,
+    StockReservationView, StockReservationReleaseView,
     InventoryAdjustmentListView, InventoryAdjustmentCreateView,
-    stock_on_hand,
+    stock_on_hand, stock_valuation,
     ProductSearchView,
 )
 
@@ -38,7 +39,11 @@ urlpatterns = [
     path('stock-lots/add/', StockLotCreateView.as_view(), name='stock_lot_add'),
     path('stock-movements/', StockMovementListView.as_view(), name='stock_movement_list'),
     path('stock-movements/add/', StockMovementCreateView.as_view(), name='stock_movement_add'),
+    path('stock-movements/bulk/', StockMovementBulkView.as_view(), name='stock_movement_bulk'),
+    path('stock-reservations/', StockReservationView.as_view(), name='stock_reservation_create'),
+    path('stock-reservations/release/', StockReservationReleaseView.as_view(), name='stock_reservation_release'),
     path('inventory-adjustments/', InventoryAdjustmentListView.as_view(), name='inventory_adjustment_list'),
     path('inventory-adjustments/add/', InventoryAdjustmentCreateView.as_view(), name='inventory_adjustment_add'),
     path('stock-on-hand/', stock_on_hand, name='stock_on_hand'),
+    path('stock-valuation/', stock_valuation, name='stock_valuation'),
 ]
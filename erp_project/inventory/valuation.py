@@ -0,0 +1,196 @@
+"""Inventory valuation and point-in-time stock queries.
+
+Valuation is per product across all warehouses; transfers move stock between
+warehouses without changing its value and are ignored. Inbound events are
+lots and ``IN`` movements (including goods receipts) at their ``unit_cost``,
+falling back to the running average when no cost was recorded. Outbound
+events are ``OUT`` movements and negative adjustments.
+
+Two methods are tracked side by side:
+
+* moving average: each receipt re-prices the whole quantity on hand;
+* FIFO: receipts open cost layers that issues consume oldest first.
+
+Replaying every event since the beginning gets slower as history grows, so
+:func:`take_snapshots` stores the state periodically (typically at month
+end). :func:`valuation_as_of` starts from the latest snapshot at or before
+the requested time and only replays the events after it.
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from erp_project import metrics
+
+from .models import InventoryAdjustment, StockLot, StockMovement, StockValuationSnapshot
+from .stock import ZERO
+
+COST_PLACES = Decimal('0.0001')
+VALUE_PLACES = Decimal('0.01')
+
+
+@dataclass
+class Valuation:
+    """Running valuation state of one product."""
+
+    qty: Decimal = ZERO
+    avg_cost: Decimal = ZERO
+    avg_value: Decimal = ZERO
+    layers: deque = field(default_factory=deque)
+
+    @property
+    def fifo_value(self):
+        return sum((q * c for q, c in self.layers), ZERO)
+
+    def receive(self, qty, unit_cost=None):
+        cost = self.avg_cost if unit_cost is None else Decimal(unit_cost)
+        self.qty += qty
+        self.avg_value += qty * cost
+        self.avg_cost = self.avg_value / self.qty if self.qty > 0 else cost
+        remaining = qty
+        # Fill any deficit left by issues made while stock was negative.
+        while remaining and self.layers and self.layers[0][0] < 0:
+            used = min(remaining, -self.layers[0][0])
+            self.layers[0][0] += used
+            remaining -= used
+            if not self.layers[0][0]:
+                self.layers.popleft()
+        if remaining:
+            self.layers.append([remaining, cost])
+
+    def issue(self, qty):
+        self.qty -= qty
+        self.avg_value -= qty * self.avg_cost
+        remaining = qty
+        while remaining and self.layers and self.layers[0][0] > 0:
+            layer = self.layers[0]
+            used = min(remaining, layer[0])
+            layer[0] -= used
+            remaining -= used
+            if not layer[0]:
+                self.layers.popleft()
+        if remaining:
+            # Issue beyond what is on hand: carry it as a negative layer.
+            self.layers.appendleft([-remaining, self.avg_cost])
+
+    def as_dict(self):
+        return {
+            'qty': self.qty,
+            'avg_cost': self.avg_cost.quantize(COST_PLACES),
+            'avg_value': self.avg_value.quantize(VALUE_PLACES),
+            'fifo_value': self.fifo_value.quantize(VALUE_PLACES),
+        }
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        return cls(
+            qty=snap.qty,
+            avg_cost=snap.avg_cost,
+            avg_value=snap.avg_value,
+            layers=deque([Decimal(q), Decimal(c)] for q, c in snap.layers),
+        )
+
+
+def end_of_day(day):
+    """Return the last instant of ``day`` in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, time.max))
+
+
+def _events(company, products, start, end):
+    """Yield ``(timestamp, product_id, qty, unit_cost)`` in chronological order.
+
+    Positive quantities are receipts and negative ones issues.
+    """
+    def scoped(qs, stamp):
+        qs = qs.filter(product__company=company, **{f'{stamp}__lte': end})
+        if start is not None:
+            qs = qs.filter(**{f'{stamp}__gt': start})
+        if products is not None:
+            qs = qs.filter(product__in=products)
+        return qs
+
+    rows = []
+    lots = scoped(StockLot.objects, 'received_at').values_list(
+        'received_at', 'id', 'product_id', 'qty', 'unit_cost'
+    )
+    rows.extend((ts, 0, pk, pid, qty, cost) for ts, pk, pid, qty, cost in lots)
+    moves = scoped(
+        StockMovement.objects.filter(movement_type__in=[StockMovement.IN, StockMovement.OUT]), 'date'
+    ).values_list('date', 'id', 'product_id', 'quantity', 'unit_cost', 'movement_type')
+    rows.extend(
+        (ts, 1, pk, pid, qty if mtype == StockMovement.IN else -qty, cost)
+        for ts, pk, pid, qty, cost, mtype in moves
+    )
+    adjustments = scoped(InventoryAdjustment.objects, 'date').values_list('date', 'id', 'product_id', 'qty')
+    rows.extend((ts, 2, pk, pid, qty, None) for ts, pk, pid, qty in adjustments)
+    rows.sort(key=lambda r: r[:3])
+    for ts, _, _, pid, qty, cost in rows:
+        yield ts, pid, qty, cost
+
+
+def _latest_snapshots(company, products, as_of):
+    qs = StockValuationSnapshot.objects.filter(company=company, as_of__lte=as_of)
+    if products is not None:
+        qs = qs.filter(product__in=products)
+    latest = qs.values('product_id').annotate(last=Max('as_of')).order_by()
+    wanted = {(row['product_id'], row['last']) for row in latest}
+    if not wanted:
+        return {}
+    snaps = qs.filter(as_of__in={last for _, last in wanted})
+    return {s.product_id: s for s in snaps if (s.product_id, s.as_of) in wanted}
+
+
+@metrics.STOCK_SECONDS.time(function='valuation_replay')
+def _replay(company, as_of, products=None):
+    snapshots = _latest_snapshots(company, products, as_of)
+    state = defaultdict(Valuation)
+    for pid, snap in snapshots.items():
+        state[pid] = Valuation.from_snapshot(snap)
+    # Snapshots cover every product with history at that time, so products
+    # without one have no events before the earliest snapshot either.
+    start = min((s.as_of for s in snapshots.values()), default=None)
+    for ts, pid, qty, cost in _events(company, products, start, as_of):
+        snap = snapshots.get(pid)
+        if snap is not None and ts <= snap.as_of:
+            continue
+        if qty >= 0:
+            state[pid].receive(qty, cost)
+        else:
+            state[pid].issue(-qty)
+    return state
+
+
+def valuation_as_of(company, as_of, products=None):
+    """Return ``{product_id: {qty, avg_cost, avg_value, fifo_value}}``."""
+    return {pid: v.as_dict() for pid, v in _replay(company, as_of, products).items()}
+
+
+def stock_as_of(company, as_of, products=None):
+    """Return ``{product_id: qty}`` across warehouses at ``as_of``."""
+    return {pid: v.qty for pid, v in _replay(company, as_of, products).items()}
+
+
+@metrics.STOCK_SECONDS.time(function='take_snapshots')
+def take_snapshots(company, as_of):
+    """Store the valuation of every product at ``as_of``. Returns the count."""
+    state = _replay(company, as_of)
+    rows = [
+        StockValuationSnapshot(
+            company=company,
+            product_id=pid,
+            as_of=as_of,
+            layers=[[str(q), str(c)] for q, c in v.layers],
+            **v.as_dict(),
+        )
+        for pid, v in state.items()
+    ]
+    with transaction.atomic():
+        StockValuationSnapshot.objects.filter(company=company, as_of=as_of).delete()
+        StockValuationSnapshot.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
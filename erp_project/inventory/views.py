@@ -2,16 +2,20 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 
 from django.views.generic import TemplateView, View
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils import timezone
 from django.utils.decorators import method_decorator
-from django.db.models import Sum, F, Q, DecimalField, ExpressionWrapper, Value
-from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.db.models import Exists, OuterRef, prefetch_related_objects
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
 import json
 from accounts.utils import user_has_permission
 
 from accounts.models import UserRole
 
-from accounts.utils import AdvancedListMixin, require_permission, log_action
+from accounts.utils import AdvancedListMixin, AsyncLoginRequiredMixin, require_permission, log_action
+from erp_project.routers import read_replica
 from .models import (
     Warehouse,
     ProductCategory,
@@ -23,6 +27,11 @@ from .models import (
     InventoryAdjustment,
     IdentifierType,
 )
+from .images import add_images, delete_image
+from .allocation import STRATEGIES, AllocationError, pick_order
+from .reservations import ReservationError, annotate_atp, release, reserve
+from .stock import stock_by_product, stock_by_warehouse, transfer_legs
+from .valuation import end_of_day, valuation_as_of
 
 
 @method_decorator(require_permission('view_warehouse'), name='dispatch')
@@ -40,13 +49,7 @@ class WarehouseListView(AdvancedListMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         page = self.get_queryset()
-        inv = {}
-        for wh in page:
-            qty_lot = StockLot.objects.filter(warehouse=wh).aggregate(q=Sum('qty'))['q'] or 0
-            qty_in = StockMovement.objects.filter(warehouse=wh, movement_type=StockMovement.IN).aggregate(q=Sum('quantity'))['q'] or 0
-            qty_out = StockMovement.objects.filter(warehouse=wh, movement_type=StockMovement.OUT).aggregate(q=Sum('quantity'))['q'] or 0
-            qty_adj = InventoryAdjustment.objects.filter(warehouse=wh).aggregate(q=Sum('qty'))['q'] or 0
-            inv[wh.id] = qty_lot + qty_in - qty_out + qty_adj
+        inv = stock_by_warehouse(self.request.user.company, warehouses=[wh.id for wh in page])
         context['page_obj'] = page
         context['inventory'] = inv
         context['search'] = True
@@ -335,10 +338,13 @@ def category_children(request):
     cats = ProductCategory.objects.filter(parent=parent, company=request.user.company).order_by('name')
     if request.GET.get('show') != 'all':
         cats = cats.filter(is_discontinued=False)
-    data = []
-    for c in cats:
-        has_children = ProductCategory.objects.filter(parent=c, is_discontinued=False).exists()
-        data.append({'id': c.id, 'name': c.name, 'has_children': has_children, 'is_discontinued': c.is_discontinued})
+    cats = cats.annotate(
+        has_children=Exists(ProductCategory.objects.filter(parent=OuterRef('pk'), is_discontinued=False))
+    )
+    data = [
+        {'id': c.id, 'name': c.name, 'has_children': c.has_children, 'is_discontinued': c.is_discontinued}
+        for c in cats
+    ]
     return JsonResponse(data, safe=False)
 
 
@@ -372,13 +378,15 @@ def unit_quick_add(request):
     return render(request, 'includes/unit_option.html', {'unit': unit}, status=201)
 
 
-class ProductSearchView(LoginRequiredMixin, View):
+class ProductSearchView(AsyncLoginRequiredMixin, View):
     """Return products matching query for Select2 search."""
 
-    def get(self, request):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        products = Product.objects.filter(company=request.user.company, name__icontains=q)[:10]
-        data = [{'id': p.id, 'text': p.name, 'description': p.description, 'unit': p.unit.name} for p in products]
+        products = Product.objects.filter(
+            company_id=request.user.company_id, name__icontains=q
+        ).select_related('unit')[:10]
+        data = [{'id': p.id, 'text': p.name, 'description': p.description, 'unit': p.unit.name} async for p in products]
         return JsonResponse({'results': data})
 
 
@@ -391,21 +399,17 @@ class ProductListView(AdvancedListMixin, TemplateView):
     search_fields = ['name', 'sku', 'brand', 'specs']
     filter_fields = ['category']
     default_sort = 'name'
+    export_fields = [
+        'sku', 'name', 'barcode', 'unit__code', 'brand', 'category__name',
+        'sale_price', 'vat_rate', 'is_discontinued', 'total_qty', 'reserved_total', 'atp_qty',
+    ]
 
     def base_queryset(self):
-        qs = Product.objects.filter(company=self.request.user.company)
+        qs = Product.objects.filter(company=self.request.user.company).select_related('unit')
         if self.request.GET.get('show') != 'all':
             qs = qs.filter(is_discontinued=False)
         stock = self.request.GET.get('stock')
-        qs = qs.annotate(
-            lot_qty=Coalesce(Sum('stocklot__qty'), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)),
-            in_qty=Coalesce(Sum('stockmovement__quantity', filter=Q(stockmovement__movement_type=StockMovement.IN)), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)),
-            out_qty=Coalesce(Sum('stockmovement__quantity', filter=Q(stockmovement__movement_type=StockMovement.OUT)), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)),
-            adj_qty=Coalesce(Sum('inventoryadjustment__qty'), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)),
-        ).annotate(total_qty=ExpressionWrapper(
-            F('lot_qty') + F('in_qty') - F('out_qty') + F('adj_qty'),
-            output_field=DecimalField(max_digits=10, decimal_places=2)
-        ))
+        qs = annotate_atp(qs)
         if stock == 'in':
             qs = qs.filter(total_qty__gt=0)
         elif stock == 'out':
@@ -415,9 +419,16 @@ class ProductListView(AdvancedListMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         page = self.get_queryset()
+        page.object_list = list(page.object_list)
+        prefetch_related_objects(page.object_list, 'images')
         context['page_obj'] = page
         context['search'] = True
-        cats = ProductCategory.objects.filter(company=self.request.user.company)
+        cats = list(ProductCategory.objects.filter(company=self.request.user.company))
+        by_id = {c.pk: c for c in cats}
+        for c in cats:
+            # Attach loaded parents so ``full_path`` does not query per level.
+            if c.parent_id in by_id:
+                c.parent = by_id[c.parent_id]
         context['filters'] = [
             {
                 'name': 'category',
@@ -453,13 +464,10 @@ class ProductDetailView(TemplateView):
         product = get_object_or_404(Product, pk=self.kwargs['pk'], company=self.request.user.company)
         total = 0
         per_wh = []
+        levels = stock_by_warehouse(self.request.user.company, products=[product.id])
         warehouses = Warehouse.objects.filter(company=self.request.user.company)
         for wh in warehouses:
-            qty_lot = StockLot.objects.filter(product=product, warehouse=wh).aggregate(q=Sum('qty'))['q'] or 0
-            qty_in = StockMovement.objects.filter(product=product, warehouse=wh, movement_type=StockMovement.IN).aggregate(q=Sum('quantity'))['q'] or 0
-            qty_out = StockMovement.objects.filter(product=product, warehouse=wh, movement_type=StockMovement.OUT).aggregate(q=Sum('quantity'))['q'] or 0
-            qty_adj = InventoryAdjustment.objects.filter(product=product, warehouse=wh).aggregate(q=Sum('qty'))['q'] or 0
-            qty = qty_lot + qty_in - qty_out + qty_adj
+            qty = levels.get(wh.id, 0)
             if qty:
                 per_wh.append({'warehouse': wh, 'qty': qty})
             total += qty
@@ -514,6 +522,7 @@ class ProductCreateView(View):
                 'barcode': '',
                 'vat_rate': '',
                 'sale_price': '',
+                'reorder_level': '',
                 'description': '',
                 'specs_json': '{}',
                 'track_serial': False,
@@ -538,6 +547,7 @@ class ProductCreateView(View):
                 'barcode': request.POST.get('barcode', '').strip(),
                 'vat_rate': request.POST.get('vat_rate'),
                 'sale_price': request.POST.get('sale_price'),
+                'reorder_level': request.POST.get('reorder_level'),
                 'description': request.POST.get('description', ''),
                 'specs_json': request.POST.get('specs_json', '{}'),
                 'track_serial': bool(request.POST.get('track_serial')),
@@ -572,6 +582,7 @@ class ProductCreateView(View):
                 'barcode': request.POST.get('barcode', '').strip(),
                 'vat_rate': request.POST.get('vat_rate'),
                 'sale_price': request.POST.get('sale_price'),
+                'reorder_level': request.POST.get('reorder_level'),
                 'description': request.POST.get('description', ''),
                 'specs_json': specs_raw,
                 'track_serial': bool(request.POST.get('track_serial')),
@@ -593,6 +604,7 @@ class ProductCreateView(View):
                 'barcode': request.POST.get('barcode', '').strip(),
                 'vat_rate': request.POST.get('vat_rate'),
                 'sale_price': request.POST.get('sale_price'),
+                'reorder_level': request.POST.get('reorder_level'),
                 'description': request.POST.get('description', ''),
                 'specs_json': specs_raw,
                 'track_serial': bool(request.POST.get('track_serial')),
@@ -610,6 +622,7 @@ class ProductCreateView(View):
             barcode=request.POST.get('barcode', '').strip(),
             vat_rate=request.POST.get('vat_rate') or 0,
             sale_price=request.POST.get('sale_price') or 0,
+            reorder_level=request.POST.get('reorder_level') or 0,
             description=request.POST.get('description', '').strip(),
             track_serial=bool(request.POST.get('track_serial')),
             specs=specs
@@ -620,8 +633,7 @@ class ProductCreateView(View):
             if wid and qty:
                 warehouse = get_object_or_404(Warehouse, pk=wid, company=request.user.company)
                 StockLot.objects.create(product=product, warehouse=warehouse, batch_number='INIT', qty=qty)
-        for img in request.FILES.getlist('photos'):
-            ProductImage.objects.create(product=product, image=img)
+        add_images(product, request.FILES.getlist('photos'))
         log_action(request.user, 'create_product', details={'sku': product.sku}, company=request.user.company)
         return redirect('product_list')
 
@@ -647,6 +659,7 @@ class ProductUpdateView(View):
             'barcode': product.barcode,
             'vat_rate': product.vat_rate,
             'sale_price': product.sale_price,
+            'reorder_level': product.reorder_level,
             'description': product.description,
             'specs_json': json.dumps(product.specs, indent=2),
             'track_serial': product.track_serial,
@@ -672,6 +685,7 @@ class ProductUpdateView(View):
                 'barcode': request.POST.get('barcode', '').strip(),
                 'vat_rate': request.POST.get('vat_rate'),
                 'sale_price': request.POST.get('sale_price'),
+                'reorder_level': request.POST.get('reorder_level'),
                 'description': request.POST.get('description', ''),
                 'specs_json': request.POST.get('specs_json', '{}'),
                 'track_serial': bool(request.POST.get('track_serial')),
@@ -697,6 +711,7 @@ class ProductUpdateView(View):
                 'barcode': request.POST.get('barcode', '').strip(),
                 'vat_rate': request.POST.get('vat_rate'),
                 'sale_price': request.POST.get('sale_price'),
+                'reorder_level': request.POST.get('reorder_level'),
                 'description': request.POST.get('description', ''),
                 'specs_json': specs_raw,
                 'track_serial': bool(request.POST.get('track_serial')),
@@ -719,6 +734,7 @@ class ProductUpdateView(View):
         product.barcode = request.POST.get('barcode', '').strip()
         product.vat_rate = request.POST.get('vat_rate') or 0
         product.sale_price = request.POST.get('sale_price') or 0
+        product.reorder_level = request.POST.get('reorder_level') or 0
         product.description = request.POST.get('description', '').strip()
         product.track_serial = bool(request.POST.get('track_serial'))
         product.specs = specs
@@ -729,8 +745,7 @@ class ProductUpdateView(View):
             if wid and qty:
                 warehouse = get_object_or_404(Warehouse, pk=wid, company=request.user.company)
                 StockLot.objects.create(product=product, warehouse=warehouse, batch_number='INIT', qty=qty)
-        for img in request.FILES.getlist('photos'):
-            ProductImage.objects.create(product=product, image=img)
+        add_images(product, request.FILES.getlist('photos'))
         log_action(request.user, 'update_product', details={'id': product.id}, company=request.user.company)
         return redirect('product_detail', pk=product.id)
 
@@ -739,8 +754,7 @@ class ProductUpdateView(View):
 class ProductImageAddView(View):
     def post(self, request, pk):
         product = get_object_or_404(Product, pk=pk, company=request.user.company)
-        for img in request.FILES.getlist('photos'):
-            ProductImage.objects.create(product=product, image=img)
+        add_images(product, request.FILES.getlist('photos'))
         return redirect('product_detail', pk=pk)
 
 
@@ -749,7 +763,7 @@ class ProductImageDeleteView(View):
     def post(self, request, pk):
         image = get_object_or_404(ProductImage, pk=pk, product__company=request.user.company)
         prod_id = image.product_id
-        image.delete()
+        delete_image(image)
         return redirect('product_detail', pk=prod_id)
 
 
@@ -761,7 +775,7 @@ class StockLotListView(AdvancedListMixin, TemplateView):
     default_sort = 'batch_number'
 
     def base_queryset(self):
-        return StockLot.objects.filter(product__company=self.request.user.company)
+        return StockLot.objects.filter(product__company=self.request.user.company).select_related('product', 'warehouse')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -809,9 +823,14 @@ class StockMovementListView(AdvancedListMixin, TemplateView):
     model = StockMovement
     search_fields = ['reference']
     default_sort = '-date'
+    export_fields = [
+        'date', 'product__sku', 'product__name', 'warehouse__name',
+        'from_warehouse__name', 'to_warehouse__name', 'movement_type',
+        'quantity', 'batch__batch_number', 'reference', 'user__username',
+    ]
 
     def base_queryset(self):
-        return StockMovement.objects.filter(product__company=self.request.user.company)
+        return StockMovement.objects.filter(product__company=self.request.user.company).select_related('product', 'warehouse')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -839,34 +858,238 @@ class StockMovementCreateView(View):
     def post(self, request):
         product = get_object_or_404(Product, pk=request.POST.get('product'), company=request.user.company)
         warehouse = get_object_or_404(Warehouse, pk=request.POST.get('warehouse'), company=request.user.company)
-        qty = request.POST.get('qty', '0').strip()
+        raw_qty = request.POST.get('qty', '0').strip()
         mtype = request.POST.get('movement_type')
-        if qty == '' or mtype not in [StockMovement.IN, StockMovement.OUT, StockMovement.TRANSFER]:
+        target_id = request.POST.get('to_warehouse')
+        error = None
+        try:
+            qty = Decimal(raw_qty)
+        except InvalidOperation:
+            qty = None
+        if raw_qty == '' or mtype not in [StockMovement.IN, StockMovement.OUT, StockMovement.TRANSFER]:
+            error = 'All fields required'
+        elif qty is None or not qty.is_finite() or qty <= 0:
+            error = 'Quantity must be positive'
+        elif mtype == StockMovement.TRANSFER and (not target_id or str(target_id) == str(warehouse.id)):
+            error = 'Transfers need a different target warehouse'
+        if error:
             products = Product.objects.filter(company=request.user.company)
             warehouses = Warehouse.objects.filter(company=request.user.company)
             return render(request, 'stock_movement_form.html', {
-                'error': 'All fields required',
+                'error': error,
                 'products': products,
                 'warehouses': warehouses
             })
-        StockMovement.objects.create(
-            product=product,
-            warehouse=warehouse,
-            quantity=qty,
-            movement_type=mtype,
-            user=request.user,
-            reference=request.POST.get('reference', '').strip()
-        )
+        reference = request.POST.get('reference', '').strip()
+        strategy = request.POST.get('allocate')
+        if mtype == StockMovement.OUT and strategy in STRATEGIES:
+            try:
+                pick_order([(product.id, warehouse.id, qty)], strategy, request.user, reference)
+            except AllocationError as exc:
+                products = Product.objects.filter(company=request.user.company)
+                warehouses = Warehouse.objects.filter(company=request.user.company)
+                return render(request, 'stock_movement_form.html', {
+                    'error': f'Not enough lot stock: {exc}',
+                    'products': products,
+                    'warehouses': warehouses
+                })
+        elif mtype == StockMovement.TRANSFER:
+            target = get_object_or_404(Warehouse, pk=target_id, company=request.user.company)
+            with transaction.atomic():
+                StockMovement.objects.bulk_create(
+                    transfer_legs(product, warehouse, target, qty, request.user, reference)
+                )
+        else:
+            StockMovement.objects.create(
+                product=product,
+                warehouse=warehouse,
+                quantity=qty,
+                movement_type=mtype,
+                user=request.user,
+                reference=reference
+            )
         log_action(request.user, 'stock_move', company=request.user.company)
         return redirect('stock_movement_list')
 
 
+@method_decorator(require_permission('add_stockmovement'), name='dispatch')
+class StockMovementBulkView(View):
+    """Record many movements and transfers atomically in one request.
+
+    Accepts a JSON body (or a ``lines_json`` form field) of the form
+    ``{"lines": [{"product", "warehouse", "quantity", "movement_type",
+    "to_warehouse", "reference", "allocate"}, ...]}``. Outbound lines with
+    ``allocate`` set to ``fefo`` or ``fifo`` are split across lots in a single
+    allocation pass. Nothing is written unless every line validates.
+    """
+
+    batch_size = 1000
+
+    def post(self, request):
+        raw = request.body if request.content_type == 'application/json' else request.POST.get('lines_json', '')
+        try:
+            payload = json.loads(raw or '{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        lines = payload.get('lines') if isinstance(payload, dict) else payload
+        if not isinstance(lines, list) or not lines:
+            return JsonResponse({'error': 'No lines supplied'}, status=400)
+        company = request.user.company
+        product_ids = {str(l.get('product')) for l in lines if isinstance(l, dict)}
+        wh_ids = {str(l.get(k)) for l in lines if isinstance(l, dict) for k in ('warehouse', 'to_warehouse') if l.get(k)}
+        products = {
+            str(p.pk): p for p in Product.objects.filter(company=company, pk__in=[i for i in product_ids if i.isdigit()])
+        }
+        warehouses = {
+            str(w.pk): w for w in Warehouse.objects.filter(company=company, pk__in=[i for i in wh_ids if i.isdigit()])
+        }
+        errors = {}
+        rows = []
+        picks = defaultdict(list)
+        transfers = 0
+        for idx, line in enumerate(lines):
+            if not isinstance(line, dict):
+                errors[idx] = 'Line must be an object'
+                continue
+            product = products.get(str(line.get('product')))
+            warehouse = warehouses.get(str(line.get('warehouse')))
+            mtype = line.get('movement_type')
+            try:
+                qty = Decimal(str(line.get('quantity')))
+            except InvalidOperation:
+                qty = None
+            if not product or not warehouse:
+                errors[idx] = 'Unknown product or warehouse'
+            elif qty is None or not qty.is_finite() or qty <= 0:
+                errors[idx] = 'Quantity must be positive'
+            elif mtype not in (StockMovement.IN, StockMovement.OUT, StockMovement.TRANSFER):
+                errors[idx] = 'Invalid movement type'
+            elif mtype == StockMovement.TRANSFER:
+                target = warehouses.get(str(line.get('to_warehouse')))
+                if not target or target.pk == warehouse.pk:
+                    errors[idx] = 'Transfers need a different target warehouse'
+                else:
+                    rows.extend(transfer_legs(product, warehouse, target, qty, request.user, line.get('reference', '')))
+                    transfers += 1
+            elif mtype == StockMovement.OUT and line.get('allocate'):
+                if line['allocate'] not in STRATEGIES:
+                    errors[idx] = 'Invalid allocation strategy'
+                else:
+                    picks[(line['allocate'], line.get('reference', ''))].append((idx, (product.pk, warehouse.pk, qty)))
+            else:
+                rows.append(StockMovement(
+                    product=product,
+                    warehouse=warehouse,
+                    quantity=qty,
+                    movement_type=mtype,
+                    user=request.user,
+                    reference=line.get('reference', ''),
+                ))
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+        picked = 0
+        try:
+            with transaction.atomic():
+                StockMovement.objects.bulk_create(rows, batch_size=self.batch_size)
+                for (strategy, reference), group in picks.items():
+                    origins = [idx for idx, _ in group]
+                    try:
+                        allocations = pick_order([l for _, l in group], strategy, request.user, reference)
+                    except AllocationError as exc:
+                        if exc.line is None:
+                            raise
+                        # Report against the request line, not its index in the pick group.
+                        raise AllocationError(exc.reason, line=origins[exc.line]) from exc
+                    picked += sum(len(a) for a in allocations)
+        except AllocationError as exc:
+            if exc.line is not None:
+                return JsonResponse({'errors': {exc.line: f'Cannot allocate: {exc.reason}'}}, status=400)
+            return JsonResponse({'error': str(exc)}, status=400)
+        created = len(rows) + picked
+        log_action(
+            request.user,
+            'stock_move_bulk',
+            details={'lines': len(lines), 'rows': created, 'transfers': transfers},
+            company=company,
+        )
+        return JsonResponse({'created': created, 'transfers': transfers}, status=201)
+
+
+def _json_payload(request):
+    try:
+        payload = json.loads(request.body or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+@method_decorator(require_permission('add_stockmovement'), name='dispatch')
+class StockReservationView(View):
+    """Reserve stock for an open order in one all-or-nothing call.
+
+    Payload: ``{"reference", "ttl_minutes", "lines": [{"product",
+    "warehouse", "quantity"}, ...]}``. Fails with 409 when any line exceeds
+    available-to-promise stock.
+    """
+
+    def post(self, request):
+        payload = _json_payload(request)
+        if payload is None:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        lines = payload.get('lines')
+        if not isinstance(lines, list) or not lines:
+            return JsonResponse({'error': 'No lines supplied'}, status=400)
+        try:
+            parsed = [(l['product'], l['warehouse'], l['quantity']) for l in lines]
+            ttl = payload.get('ttl_minutes')
+            ttl = timedelta(minutes=int(ttl)) if ttl else None
+            created = reserve(
+                request.user.company, parsed, payload.get('reference', ''), request.user, ttl
+            )
+        except ReservationError as exc:
+            return JsonResponse({'error': str(exc)}, status=409)
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            return JsonResponse({'error': 'Invalid line'}, status=400)
+        log_action(
+            request.user,
+            'stock_reserve',
+            details={'reference': payload.get('reference', ''), 'lines': len(created)},
+            company=request.user.company,
+        )
+        return JsonResponse({'reserved': [r.pk for r in created]}, status=201)
+
+
+@method_decorator(require_permission('add_stockmovement'), name='dispatch')
+class StockReservationReleaseView(View):
+    """Release reservations by ``reference`` and/or a list of ``ids``."""
+
+    def post(self, request):
+        payload = _json_payload(request)
+        if payload is None:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        ids = payload.get('ids') or []
+        if not isinstance(ids, list):
+            return JsonResponse({'error': 'ids must be a list'}, status=400)
+        count = release(request.user.company, payload.get('reference'), ids)
+        log_action(
+            request.user,
+            'stock_release',
+            details={'reference': payload.get('reference'), 'released': count},
+            company=request.user.company,
+        )
+        return JsonResponse({'released': count})
+
+
 @method_decorator(require_permission('view_inventoryadjustment'), name='dispatch')
 class InventoryAdjustmentListView(AdvancedListMixin, TemplateView):
     template_name = 'inventory_adjustment_list.html'
     model = InventoryAdjustment
     search_fields = []
     default_sort = '-date'
+    export_fields = [
+        'date', 'product__sku', 'product__name', 'warehouse__name',
+        'reason', 'qty', 'notes', 'user__username',
+    ]
 
     def base_queryset(self):
         return InventoryAdjustment.objects.filter(product__company=self.request.user.company)
@@ -921,15 +1144,36 @@ class InventoryAdjustmentCreateView(View):
         return redirect('inventory_adjustment_list')
 
 
+@read_replica
 @require_permission('view_stock_on_hand')
 def stock_on_hand(request):
     products = Product.objects.filter(company=request.user.company)
+    levels = stock_by_product(request.user.company)
     data = []
     for prod in products:
-        qty_lots = StockLot.objects.filter(product=prod).aggregate(q=Sum('qty'))['q'] or 0
-        qty_moves_in = StockMovement.objects.filter(product=prod, movement_type=StockMovement.IN).aggregate(q=Sum('quantity'))['q'] or 0
-        qty_moves_out = StockMovement.objects.filter(product=prod, movement_type=StockMovement.OUT).aggregate(q=Sum('quantity'))['q'] or 0
-        qty_adj = InventoryAdjustment.objects.filter(product=prod).aggregate(q=Sum('qty'))['q'] or 0
-        total = qty_lots + qty_moves_in - qty_moves_out + qty_adj
-        data.append({'product': prod, 'qty': total})
+        data.append({'product': prod, 'qty': levels.get(prod.id, 0)})
     return render(request, 'stock_on_hand.html', {'data': data})
+
+
+@read_replica
+@require_permission('view_stock_on_hand')
+def stock_valuation(request):
+    """Quantity and value per product at the end of a chosen day."""
+    as_of_param = request.GET.get('as_of', '')
+    error = None
+    try:
+        day = date.fromisoformat(as_of_param) if as_of_param else timezone.localdate()
+    except ValueError:
+        day = timezone.localdate()
+        error = 'Invalid date, showing today'
+    as_of = end_of_day(day)
+    values = valuation_as_of(request.user.company, as_of)
+    products = Product.objects.filter(company=request.user.company, pk__in=values).order_by('name')
+    data = [{'product': prod, **values[prod.id]} for prod in products]
+    totals = {
+        'avg_value': sum((row['avg_value'] for row in data), Decimal('0')),
+        'fifo_value': sum((row['fifo_value'] for row in data), Decimal('0')),
+    }
+    return render(request, 'stock_valuation.html', {
+        'data': data, 'totals': totals, 'as_of': day.isoformat(), 'error': error,
+    })
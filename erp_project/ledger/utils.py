@@ -1,5 +1,6 @@
 from decimal import Decimal
 from django.db.models import Sum
+from erp_project import metrics
 from .models import LedgerEntry, LedgerLine, LedgerAccount
 
 
@@ -30,4 +31,6 @@ def post_entry(company, description, lines, ensure_funds=True):
             if bal < 0:
                 raise ValueError(f"{code} balance negative")
 
+    metrics.LEDGER_POSTINGS.inc()
+    metrics.LEDGER_LINES.inc(len(lines))
     return entry
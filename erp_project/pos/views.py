@@ -1,25 +1,31 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from accounts.utils import require_permission
 from inventory.models import Product, ProductSerial
+from inventory.reservations import atp_by_product
 
 
 @login_required
 @require_permission('view_product')
-def pos_scan(request):
+async def pos_scan(request):
     """Scan EAN or serial to identify a product."""
     context = {}
     if request.method == 'POST':
         code = request.POST.get('code', '').strip()
-        product = None
-        if Product.objects.filter(barcode=code, company=request.user.company).exists():
-            product = Product.objects.get(barcode=code, company=request.user.company)
-        else:
-            serial_obj = ProductSerial.objects.filter(serial=code, product__company=request.user.company).first()
+        company_id = request.user.company_id
+        product = await Product.objects.filter(barcode=code, company_id=company_id).afirst()
+        if product is None:
+            serial_obj = await ProductSerial.objects.select_related('product').filter(
+                serial=code, product__company_id=company_id
+            ).afirst()
             if serial_obj:
                 product = serial_obj.product
         if product:
             context['product'] = product
+            atp = await sync_to_async(atp_by_product)(company_id, products=[product.pk])
+            context['atp'] = atp.get(product.pk, 0)
         else:
             context['error'] = 'Not found'
-    return render(request, 'pos_scan.html', context)
+    # Context processors and templates query synchronously.
+    return await sync_to_async(render)(request, 'pos_scan.html', context)
@@ -0,0 +1,313 @@
+"""Multi-level approval workflows.
+
+The ``APPROVAL_WORKFLOWS`` setting lists the approval levels of each document
+kind. :func:`start` writes one :class:`~purchasing.models.ApprovalTask` per
+level that applies to a requisition or payment. Level 1 is pending and the
+rest wait. Approving a task makes the next level pending. The last approval,
+or any rejection, decides the document.
+
+An approver's queue is the pending tasks whose permission they hold, read
+through the ``approvaltask_queue_idx`` index.
+:class:`~purchasing.models.ApprovalQueueCount` keeps the number of pending
+tasks per permission, so the nav bar count is one small query however long
+the queues are. The ``rollup_approvals`` command rebuilds the counts.
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.utils import timezone
+
+from accounts.models import Permission
+
+from .models import (
+    ApprovalQueueCount,
+    ApprovalTask,
+    Payment,
+    PaymentApproval,
+    PurchaseRequisition,
+    PurchaseRequisitionApproval,
+)
+from .requisitions import decide_lines
+
+KIND_REQUISITION = ApprovalTask.KIND_REQUISITION
+KIND_PAYMENT = ApprovalTask.KIND_PAYMENT
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+ZERO = Decimal('0')
+
+DEFAULTS = {
+    KIND_REQUISITION: [{'permission': 'approve_purchaserequisition'}],
+    KIND_PAYMENT: [{'permission': 'approve_payment'}],
+}
+
+
+class ApprovalError(ValueError):
+    pass
+
+
+class NotAllowed(ApprovalError):
+    """The user lacks the permission of the task's level."""
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'APPROVAL_WORKFLOWS', {})}
+
+
+def _requisition_amount(pr):
+    # Requisitions carry no prices; product lines are valued at sale price.
+    total = pr.lines.filter(product__isnull=False).aggregate(
+        total=Sum(F('quantity') * F('product__sale_price'), output_field=MONEY)
+    )['total']
+    return total or ZERO
+
+
+def _apply_requisition(pr, user, approved, final, quantities=None):
+    decide_lines(pr, approved, quantities)
+    if final:
+        pr.status = PurchaseRequisition.APPROVED if approved else PurchaseRequisition.REJECTED
+        pr.approver = user
+        pr.approved_at = timezone.now()
+        pr.save()
+
+
+def _apply_payment(payment, user, approved, final, **options):
+    if final:
+        payment.status = Payment.STATUS_APPROVED if approved else Payment.STATUS_REJECTED
+        payment.save()
+        if approved:
+            payment.post_ledger_entry()
+
+
+def _record_requisition(pr, task):
+    PurchaseRequisitionApproval.objects.create(
+        requisition=pr, approver=task.decided_by, approved=task.status == ApprovalTask.APPROVED,
+        comment=task.comment, level=task.level, approved_at=task.decided_at,
+    )
+
+
+def _record_payment(payment, task):
+    PaymentApproval.objects.create(
+        payment=payment, approver=task.decided_by, approved=task.status == ApprovalTask.APPROVED,
+        comment=task.comment, level=task.level,
+    )
+
+
+@dataclass(frozen=True)
+class Workflow:
+    model: type
+    amount: Callable
+    item_type: Callable  # matched against a level's ``types``
+    title: Callable
+    requester: Callable
+    apply: Callable  # (document, user, approved, final, **options)
+    record: Callable  # (document, decided task)
+    self_approval: bool = True
+
+
+WORKFLOWS = {
+    KIND_REQUISITION: Workflow(
+        model=PurchaseRequisition,
+        amount=_requisition_amount,
+        item_type=lambda pr: pr.request_type,
+        title=lambda pr: pr.number,
+        requester=lambda pr: pr.requester_id,
+        apply=_apply_requisition,
+        record=_record_requisition,
+        self_approval=False,
+    ),
+    KIND_PAYMENT: Workflow(
+        model=Payment,
+        amount=lambda payment: payment.amount,
+        item_type=lambda payment: payment.method,
+        title=lambda payment: f'Payment #{payment.pk}',
+        requester=lambda payment: None,
+        apply=_apply_payment,
+        record=_record_payment,
+    ),
+}
+
+
+def levels_for(kind, amount, item_type=None):
+    """Permissions of the levels that apply to a document, in order.
+
+    A level applies when ``amount`` is at least its ``min_amount`` and, if it
+    lists ``types``, ``item_type`` is one of them. When none applies the
+    first level is used so nothing is approved unseen.
+    """
+    levels = _config()[kind]
+    permissions = [
+        level['permission'] for level in levels
+        if Decimal(amount) >= Decimal(str(level.get('min_amount', 0)))
+        and (not level.get('types') or item_type in level['types'])
+    ]
+    return permissions or [levels[0]['permission']]
+
+
+def _adjust(company_id, permission, delta):
+    counts = ApprovalQueueCount.objects.filter(company_id=company_id, permission=permission)
+    if not counts.update(pending=F('pending') + delta):
+        ApprovalQueueCount.objects.get_or_create(company_id=company_id, permission=permission)
+        counts.update(pending=F('pending') + delta)
+
+
+def start(kind, document, requested_by=None):
+    """Open the approval chain of ``document``; returns its tasks."""
+    workflow = WORKFLOWS[kind]
+    amount = workflow.amount(document)
+    permissions = levels_for(kind, amount, workflow.item_type(document))
+    requested_by_id = getattr(requested_by, 'pk', None) or workflow.requester(document)
+    with transaction.atomic():
+        tasks = ApprovalTask.objects.bulk_create([
+            ApprovalTask(
+                company_id=document.company_id,
+                kind=kind,
+                object_id=document.pk,
+                level=level,
+                permission=permission,
+                status=ApprovalTask.PENDING if level == 1 else ApprovalTask.WAITING,
+                title=workflow.title(document)[:255],
+                amount=amount,
+                requested_by_id=requested_by_id,
+            )
+            for level, permission in enumerate(permissions, start=1)
+        ])
+        _adjust(document.company_id, permissions[0], 1)
+    return tasks
+
+
+def tasks_for(kind, document):
+    return ApprovalTask.objects.filter(kind=kind, object_id=document.pk).order_by('level')
+
+
+def current_task(kind, document):
+    """The pending task of ``document``.
+
+    Documents submitted before their chain existed get one started here.
+    Returns ``None`` once the document is decided.
+    """
+    tasks = list(tasks_for(kind, document))
+    if not tasks:
+        tasks = start(kind, document)
+    return next((t for t in tasks if t.status == ApprovalTask.PENDING), None)
+
+
+def _codes(user):
+    return Permission.objects.filter(
+        role__userrole__user=user, role__userrole__company=user.company
+    ).values('codename')
+
+
+def permission_codes(user):
+    return set(_codes(user).values_list('codename', flat=True))
+
+
+def can_decide(user, task, codes=None):
+    if user.is_superuser:
+        return True
+    if codes is None:
+        codes = permission_codes(user)
+    return task.permission in codes
+
+
+def decide(task, user, approved, comment='', codes=None, **options):
+    """Approve or reject ``task`` as ``user``.
+
+    Returns ``True`` when this decided the document. ``options`` go to the
+    kind's apply step, e.g. ``quantities`` for requisition lines. Raises
+    :class:`NotAllowed` without the level's permission and
+    :class:`ApprovalError` for other refusals.
+    """
+    workflow = WORKFLOWS[task.kind]
+    with transaction.atomic():
+        task = ApprovalTask.objects.select_for_update().get(pk=task.pk)
+        if task.status != ApprovalTask.PENDING:
+            raise ApprovalError(f'{task.title} is not awaiting approval')
+        if not can_decide(user, task, codes):
+            raise NotAllowed(f'{task.title} needs {task.permission}')
+        if not workflow.self_approval and task.requested_by_id == user.pk:
+            raise ApprovalError(f'Creator cannot approve their own {task.kind}')
+        chain = ApprovalTask.objects.filter(kind=task.kind, object_id=task.object_id)
+        if chain.filter(decided_by=user).exists():
+            raise ApprovalError(f'{task.title} was already decided by you at another level')
+        task.status = ApprovalTask.APPROVED if approved else ApprovalTask.REJECTED
+        task.decided_by = user
+        task.decided_at = timezone.now()
+        task.comment = comment
+        task.save(update_fields=['status', 'decided_by', 'decided_at', 'comment'])
+        _adjust(task.company_id, task.permission, -1)
+        document = workflow.model.objects.get(pk=task.object_id)
+        waiting = chain.filter(level__gt=task.level, status=ApprovalTask.WAITING)
+        following = waiting.order_by('level').first() if approved else None
+        workflow.apply(document, user, approved, following is None, **options)
+        workflow.record(document, task)
+        if following is not None:
+            waiting.filter(pk=following.pk).update(status=ApprovalTask.PENDING)
+            _adjust(task.company_id, following.permission, 1)
+        elif not approved:
+            waiting.update(status=ApprovalTask.CANCELLED)
+    return following is None
+
+
+def queue(user, kind=None):
+    """Pending tasks ``user`` may decide, oldest first."""
+    tasks = ApprovalTask.objects.filter(company=user.company, status=ApprovalTask.PENDING)
+    if not user.is_superuser:
+        tasks = tasks.filter(permission__in=_codes(user))
+    if kind:
+        tasks = tasks.filter(kind=kind)
+    own = [k for k, w in WORKFLOWS.items() if not w.self_approval]
+    return tasks.exclude(kind__in=own, requested_by=user).order_by('created_at', 'pk')
+
+
+def queue_count(user):
+    """Pending tasks at the levels ``user`` can approve, in one query.
+
+    Read from the per-permission counts. Unlike :func:`queue` it includes
+    the user's own requisitions.
+    """
+    counts = ApprovalQueueCount.objects.filter(company=user.company)
+    if not user.is_superuser:
+        counts = counts.filter(permission__in=_codes(user))
+    return counts.aggregate(n=Sum('pending'))['n'] or 0
+
+
+def decide_many(user, task_ids, approved, comment=''):
+    """Decide several tasks from ``user``'s queue.
+
+    Returns ``(decided, errors)``: ``decided`` lists ``(task, final)`` pairs
+    and ``errors`` maps task ids to messages. Each task commits on its own,
+    so one refusal does not undo the rest.
+    """
+    codes = permission_codes(user)
+    decided, errors = [], {}
+    for task in queue(user).filter(pk__in=task_ids):
+        try:
+            decided.append((task, decide(task, user, approved, comment, codes=codes)))
+        except ApprovalError as exc:
+            errors[task.pk] = str(exc)
+    return decided, errors
+
+
+def rebuild_counts(company):
+    """Recount pending tasks per permission; returns the total."""
+    company_id = getattr(company, 'pk', company)
+    pending = dict(
+        ApprovalTask.objects.filter(company_id=company_id, status=ApprovalTask.PENDING)
+        .values('permission')
+        .annotate(n=Count('id'))
+        .order_by()
+        .values_list('permission', 'n')
+    )
+    with transaction.atomic():
+        ApprovalQueueCount.objects.filter(company_id=company_id).exclude(permission__in=pending).update(pending=0)
+        ApprovalQueueCount.objects.bulk_create(
+            [ApprovalQueueCount(company_id=company_id, permission=p, pending=n) for p, n in pending.items()],
+            update_conflicts=True,
+            unique_fields=['company', 'permission'],
+            update_fields=['pending'],
+        )
+    return sum(pending.values())
@@ -0,0 +1,8 @@
+from .approvals import queue_count
+
+
+def approval_queue(request):
+    """Number of pending approvals for the nav bar."""
+    if not request.user.is_authenticated or not getattr(request.user, 'company', None):
+        return {}
+    return {'approval_queue_count': queue_count(request.user)}
@@ -0,0 +1,76 @@
+"""Printable documents for purchasing records.
+
+Builders turn model instances into :class:`accounts.documents.Document`
+descriptions that the shared renderer lays out and caches.
+"""
+
+from accounts.documents import Document
+
+from .models import PurchaseRequisition
+
+
+def requisition_document(pr):
+    meta = [
+        ('Status', pr.get_status_display()),
+        ('Type', pr.request_type),
+        ('Requester', pr.requester.username),
+        ('Created', pr.created_at),
+    ]
+    if pr.approver:
+        meta.append(('Approver', pr.approver.username))
+    lines = list(pr.lines.all())
+    decided = any(line.approved_quantity is not None for line in lines)
+    headers = ['Item', 'Description', 'Quantity', 'Unit']
+    rows = [[line.name, line.description, line.quantity, line.unit] for line in lines]
+    if decided:
+        headers.insert(3, 'Approved')
+        for row, line in zip(rows, lines):
+            row.insert(3, line.approved_quantity)
+    notes = [f'Justification: {pr.justification}'] if pr.justification else []
+    return Document(
+        title=f'Purchase Requisition {pr.number}',
+        filename=f'{pr.number}.pdf',
+        meta=meta,
+        headers=headers,
+        rows=rows,
+        notes=notes,
+    )
+
+
+def is_final(pr):
+    """Approved and rejected requisitions no longer change."""
+    return pr.status in (PurchaseRequisition.APPROVED, PurchaseRequisition.REJECTED)
+
+
+def purchase_order_document(po):
+    lines = list(po.lines.select_related('product'))
+    rows = [
+        [l.product.name, l.quantity, l.unit_price, l.quantity * l.unit_price]
+        for l in lines
+    ]
+    total = sum((l.quantity * l.unit_price for l in lines), 0)
+    return Document(
+        title=f'Purchase Order {po.order_number}',
+        filename=f'{po.order_number}.pdf',
+        meta=[
+            ('Supplier', po.supplier.name),
+            ('Date', po.date),
+            ('Status', po.get_status_display()),
+        ],
+        headers=['Product', 'Quantity', 'Unit Price', 'Total'],
+        rows=rows,
+        notes=[f'Order total: {total}'],
+    )
+
+
+def invoice_document(invoice):
+    return Document(
+        title=f'Supplier Invoice {invoice.number}',
+        filename=f'{invoice.number}.pdf',
+        meta=[
+            ('Purchase Order', invoice.purchase_order.order_number),
+            ('Supplier', invoice.purchase_order.supplier.name),
+            ('Amount', invoice.amount),
+            ('Status', invoice.get_status_display()),
+        ],
+    )
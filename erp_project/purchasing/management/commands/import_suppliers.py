@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from purchasing.supplier_import import import_suppliers, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import suppliers from a CSV file with the supplier form field names as headers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--company', required=True, help='Company code')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving')
+        parser.add_argument('--workers', type=int, default=None, help='Validation processes')
+        parser.add_argument('--no-otp', action='store_true', help='Do not send verification codes')
+
+    def handle(self, *args, **options):
+        company = Company.objects.filter(code=options['company']).first()
+        if company is None:
+            raise CommandError(f"Unknown company {options['company']}")
+        with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+            rows = read_rows(fh)
+        report = import_suppliers(
+            company, rows, dry_run=options['dry_run'], workers=options['workers'],
+            send_otp=not options['no_otp'],
+        )
+        for line, errors in report.errors:
+            details = '; '.join(f'{f}: {m}' for f, m in errors.items())
+            self.stdout.write(f'line {line}: {details}')
+        verb = 'would be created' if report.dry_run else 'created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.total} rows, {report.valid} valid, {len(report.errors)} rejected, '
+            f'{report.valid if report.dry_run else report.created} {verb}'
+        ))
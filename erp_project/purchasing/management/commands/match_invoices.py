@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from purchasing.matching import match_pending
+from purchasing.pipeline import UNMATCHED_INVOICES, refresh_metrics
+
+
+class Command(BaseCommand):
+    help = 'Three-way match pending supplier invoices and update their status.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Company code; all companies when omitted')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            company = Company.objects.filter(code=options['company']).first()
+            if company is None:
+                raise CommandError(f"Unknown company {options['company']}")
+        matched, exceptions = match_pending(company, options['batch_size'])
+        # Status changes are bulk updates, which do not fire signals.
+        for target in [company] if company else Company.objects.all():
+            refresh_metrics(target, [UNMATCHED_INVOICES])
+        self.stdout.write(self.style.SUCCESS(f'{matched} matched, {exceptions} exceptions'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from purchasing.otp import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired supplier verification codes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} codes'))
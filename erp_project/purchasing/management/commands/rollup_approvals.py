@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Company
+from purchasing.approvals import rebuild_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount pending approval tasks per permission for every company.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Company code; all companies when omitted')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(code=options['company'])
+        count = 0
+        for company in companies.iterator():
+            count += rebuild_counts(company)
+        self.stdout.write(self.style.SUCCESS(f'Counted {count} pending approvals'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Company
+from purchasing.pipeline import refresh_metrics
+
+
+class Command(BaseCommand):
+    help = 'Recompute procure-to-pay dashboard metrics for every company.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Company code; all companies when omitted')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(code=options['company'])
+        count = 0
+        for company in companies.iterator():
+            refresh_metrics(company)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Refreshed metrics for {count} companies'))
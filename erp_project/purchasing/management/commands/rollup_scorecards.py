@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Company
+from purchasing.scorecards import refresh_scorecards
+
+
+class Command(BaseCommand):
+    help = 'Recompute supplier scorecards for every company.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Company code; all companies when omitted')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(code=options['company'])
+        count = 0
+        for company in companies.iterator():
+            count += refresh_scorecards(company)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {count} supplier scorecards'))
@@ -0,0 +1,27 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from purchasing.suppliers import duplicate_report
+
+
+class Command(BaseCommand):
+    help = 'List suppliers sharing a phone, email, IBAN, TRN, trade license or name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Company code to limit the report to')
+
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            company = Company.objects.filter(code=options['company']).first()
+            if company is None:
+                raise CommandError(f"Unknown company {options['company']}")
+        writer = csv.writer(self.stdout)
+        writer.writerow(['field', 'value', 'supplier_id', 'supplier_name', 'company_id'])
+        groups = duplicate_report(company)
+        for group in groups:
+            for pk, name, company_id in group['suppliers']:
+                writer.writerow([group['field'], group['value'], pk, name, company_id])
+        self.stderr.write(f'{len(groups)} duplicate groups')
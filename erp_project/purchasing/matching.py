@@ -0,0 +1,203 @@
+"""Three-way matching of supplier invoices against POs and goods receipts.
+
+For every purchase order involved, ordered and received quantities and
+values are computed per product with grouped SQL. The invoiced total is
+the sum of the PO's invoices. Then:
+
+* no product may be received beyond its ordered quantity (plus
+  ``qty_percent``);
+* the invoiced total must equal the received value within tolerance.
+
+Receipts are valued at their recorded ``unit_cost``, or at the PO line price
+for older receipts without one. The number of queries is fixed however many
+invoices are matched, so period-end runs over thousands of invoices stay
+cheap.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.jobs import enqueue_on_commit
+
+from .models import GoodsReceipt, PurchaseOrderLine, SupplierInvoice
+
+ZERO = Decimal('0')
+MONEY = DecimalField(max_digits=16, decimal_places=4)
+CENT = Decimal('0.01')
+
+
+@dataclass(frozen=True)
+class Tolerance:
+    percent: Decimal = Decimal('0.5')
+    amount: Decimal = Decimal('1.00')
+    qty_percent: Decimal = ZERO
+
+    @classmethod
+    def from_settings(cls):
+        conf = getattr(settings, 'INVOICE_MATCH_TOLERANCE', {})
+        return cls(**{k: Decimal(str(v)) for k, v in conf.items()})
+
+    def allowed(self, base):
+        return max(abs(base) * self.percent / 100, self.amount)
+
+
+@dataclass
+class LineMatch:
+    product_id: int
+    ordered_qty: Decimal = ZERO
+    ordered_value: Decimal = ZERO
+    received_qty: Decimal = ZERO
+    received_value: Decimal = ZERO
+
+
+@dataclass
+class MatchResult:
+    invoice_id: int
+    po_total: Decimal = ZERO
+    received_total: Decimal = ZERO
+    invoiced_total: Decimal = ZERO
+    lines: list = field(default_factory=list)
+    issues: list = field(default_factory=list)
+
+    @property
+    def matched(self):
+        return not self.issues
+
+
+def line_totals(po_ids):
+    """Return ``{(po_id, product_id): (ordered qty, ordered value)}``."""
+    rows = (
+        PurchaseOrderLine.objects.filter(purchase_order_id__in=po_ids)
+        .values('purchase_order_id', 'product_id')
+        .annotate(
+            qty=Sum('quantity'),
+            value=Sum(ExpressionWrapper(F('quantity') * F('unit_price'), output_field=MONEY)),
+        )
+        .order_by()
+    )
+    return {(r['purchase_order_id'], r['product_id']): (r['qty'], r['value']) for r in rows}
+
+
+def receipt_totals(po_ids):
+    """Return ``{(po_id, product_id): (received qty, received value)}``."""
+    line_price = Subquery(
+        PurchaseOrderLine.objects.filter(
+            purchase_order_id=OuterRef('purchase_order_id'), product_id=OuterRef('product_id')
+        ).order_by('id').values('unit_price')[:1],
+        output_field=MONEY,
+    )
+    rows = (
+        GoodsReceipt.objects.filter(purchase_order_id__in=po_ids)
+        .annotate(cost=Coalesce(F('unit_cost'), line_price, output_field=MONEY))
+        .values('purchase_order_id', 'product_id')
+        .annotate(
+            qty=Sum('qty_received'),
+            value=Sum(ExpressionWrapper(F('qty_received') * F('cost'), output_field=MONEY)),
+        )
+        .order_by()
+    )
+    return {(r['purchase_order_id'], r['product_id']): (r['qty'], r['value']) for r in rows}
+
+
+def _invoiced_totals(po_ids):
+    rows = (
+        SupplierInvoice.objects.filter(purchase_order_id__in=po_ids)
+        .values('purchase_order_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    return {r['purchase_order_id']: r['total'] for r in rows}
+
+
+def match_invoices(invoices, tolerance=None):
+    """Return ``{invoice_id: MatchResult}`` for an iterable of invoices."""
+    tolerance = tolerance or Tolerance.from_settings()
+    invoices = list(invoices)
+    po_ids = {inv.purchase_order_id for inv in invoices}
+    ordered = line_totals(po_ids)
+    received = receipt_totals(po_ids)
+    invoiced = _invoiced_totals(po_ids)
+    per_po = defaultdict(dict)
+    for (po_id, pid), (qty, value) in ordered.items():
+        per_po[po_id][pid] = LineMatch(pid, ordered_qty=qty, ordered_value=value)
+    for (po_id, pid), (qty, value) in received.items():
+        line = per_po[po_id].setdefault(pid, LineMatch(pid))
+        line.received_qty, line.received_value = qty, value
+    results = {}
+    for inv in invoices:
+        lines = list(per_po[inv.purchase_order_id].values())
+        result = MatchResult(
+            inv.pk,
+            po_total=sum((l.ordered_value for l in lines), ZERO).quantize(CENT),
+            received_total=sum((l.received_value for l in lines), ZERO).quantize(CENT),
+            invoiced_total=invoiced.get(inv.purchase_order_id, ZERO),
+            lines=lines,
+        )
+        for line in lines:
+            limit = line.ordered_qty * (1 + tolerance.qty_percent / 100)
+            if line.received_qty > limit:
+                result.issues.append(
+                    f'Product {line.product_id}: received {line.received_qty} of {line.ordered_qty} ordered'
+                )
+        if not result.received_total:
+            result.issues.append('Nothing received yet')
+        diff = result.invoiced_total - result.received_total
+        if abs(diff) > tolerance.allowed(result.received_total):
+            result.issues.append(f'Invoiced total differs from received value by {diff}')
+        results[inv.pk] = result
+    return results
+
+
+def apply_matches(results):
+    """Write matched/exception status for the given results in two updates.
+
+    The updates bypass model signals, so a scorecard refresh for the
+    affected suppliers is queued here once the transaction commits.
+    """
+    matched = [pk for pk, r in results.items() if r.matched]
+    exceptions = [pk for pk, r in results.items() if not r.matched]
+    with transaction.atomic():
+        SupplierInvoice.objects.filter(pk__in=matched).update(
+            status=SupplierInvoice.STATUS_MATCHED, matched_at=timezone.now()
+        )
+        SupplierInvoice.objects.filter(pk__in=exceptions).update(
+            status=SupplierInvoice.STATUS_EXCEPTION, matched_at=None
+        )
+        suppliers = defaultdict(set)
+        rows = SupplierInvoice.objects.filter(pk__in=list(results)).values_list(
+            'company_id', 'purchase_order__supplier_id'
+        ).distinct()
+        for company_id, supplier_id in rows:
+            suppliers[company_id].add(supplier_id)
+        for company_id, ids in suppliers.items():
+            enqueue_on_commit('refresh_scorecards', company_id, supplier_ids=ids)
+    return len(matched), len(exceptions)
+
+
+def match_pending(company=None, batch_size=2000, tolerance=None):
+    """Match pending and previously failed invoices in batches.
+
+    Returns ``(matched, exceptions)`` counts.
+    """
+    qs = SupplierInvoice.objects.filter(
+        status__in=[SupplierInvoice.STATUS_PENDING, SupplierInvoice.STATUS_EXCEPTION]
+    ).only('pk', 'purchase_order_id').order_by('pk')
+    if company is not None:
+        qs = qs.filter(company=company)
+    totals = [0, 0]
+    last_pk = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return tuple(totals)
+        last_pk = batch[-1].pk
+        matched, exceptions = apply_matches(match_invoices(batch, tolerance))
+        totals[0] += matched
+        totals[1] += exceptions
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchasing', '0013_add_asset_it_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goodsreceipt',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_add_letterhead_field'),
+        ('purchasing', '0014_goodsreceipt_unit_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplierinvoice',
+            name='matched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='supplierinvoice',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('matched', 'Matched'), ('exception', 'Match Exception'), ('approved', 'Approved')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='supplierinvoice',
+            index=models.Index(fields=['company', 'status'], name='invoice_company_status_idx'),
+        ),
+    ]
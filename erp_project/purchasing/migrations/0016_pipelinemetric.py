@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_add_letterhead_field'),
+        ('purchasing', '0015_invoice_matching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_metrics', to='accounts.company')),
+            ],
+            options={
+                'unique_together': {('company', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:34
+
+import accounts.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchasing', '0016_pipelinemetric'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='supplier',
+            name='vat_certificate',
+            field=models.FileField(blank=True, storage=accounts.storage.get_blob_storage, upload_to='vat_docs/'),
+        ),
+        migrations.AlterField(
+            model_name='supplierinvoice',
+            name='file',
+            field=models.FileField(blank=True, storage=accounts.storage.get_blob_storage, upload_to='invoices/'),
+        ),
+    ]
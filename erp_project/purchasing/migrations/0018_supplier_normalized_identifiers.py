@@ -0,0 +1,108 @@
+import re
+
+import phonenumbers
+from django.db import migrations, models
+
+# Frozen copies of the purchasing.utils normalizers as of this migration, so
+# later changes to them do not alter what it backfills.
+
+
+def normalize_phone(value):
+    if not value or not value.strip():
+        return None
+    value = value.strip()
+    if value.startswith('00'):
+        value = '+' + value[2:]
+    try:
+        num = phonenumbers.parse(value, None)
+        return phonenumbers.format_number(num, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException:
+        digits = re.sub(r"\D", "", value)
+        return f"+{digits}" if digits else None
+
+
+def normalize_iban(value):
+    # Same as stdnum.iban.compact: drop spaces, dashes and dots, upper-case.
+    if not value:
+        return None
+    return re.sub(r"[ .-]", "", value).strip().upper() or None
+
+
+def normalize_email(value):
+    if not value:
+        return None
+    return value.strip().lower() or None
+
+
+NORMALIZERS = {
+    'phone_e164': ('phone', normalize_phone),
+    'email_normalized': ('email', normalize_email),
+    'iban_compact': ('iban', normalize_iban),
+}
+
+
+def backfill_identifiers(apps, schema_editor):
+    """Fill the normalized columns; the oldest supplier keeps a shared value.
+
+    Later suppliers whose identifier normalizes to a value already taken are
+    left blank so the unique indexes can be created. They are listed by the
+    ``supplier_duplicates`` report.
+    """
+    Supplier = apps.get_model('purchasing', 'Supplier')
+    taken = {column: set() for column in NORMALIZERS}
+    batch = []
+    for supplier in Supplier.objects.order_by('pk').iterator():
+        for column, (source, normalize) in NORMALIZERS.items():
+            value = normalize(getattr(supplier, source))
+            if value in taken[column]:
+                value = None
+            elif value is not None:
+                taken[column].add(value)
+            setattr(supplier, column, value)
+        batch.append(supplier)
+        if len(batch) >= 1000:
+            Supplier.objects.bulk_update(batch, list(NORMALIZERS))
+            batch = []
+    if batch:
+        Supplier.objects.bulk_update(batch, list(NORMALIZERS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchasing', '0017_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='email_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='iban_compact',
+            field=models.CharField(blank=True, editable=False, max_length=34, null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='phone_e164',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_identifiers, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='supplier',
+            name='email_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='iban_compact',
+            field=models.CharField(blank=True, editable=False, max_length=34, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='phone_e164',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, unique=True),
+        ),
+    ]
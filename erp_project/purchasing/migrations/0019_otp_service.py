@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+
+def hash_existing_codes(apps, schema_editor):
+    SupplierOTP = apps.get_model('purchasing', 'SupplierOTP')
+    batch = []
+    for otp in SupplierOTP.objects.iterator():
+        # Same keyed hash as purchasing.otp.hash_code.
+        otp.code_hash = salted_hmac(
+            'purchasing.otp', f'{otp.supplier_id}:{otp.code}', algorithm='sha256'
+        ).hexdigest()
+        otp.expires_at = otp.created_at + timedelta(minutes=10)
+        batch.append(otp)
+        if len(batch) >= 1000:
+            SupplierOTP.objects.bulk_update(batch, ['code_hash', 'expires_at'])
+            batch = []
+    if batch:
+        SupplierOTP.objects.bulk_update(batch, ['code_hash', 'expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchasing', '0018_supplier_normalized_identifiers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplierotp',
+            name='code_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='supplierotp',
+            name='expires_at',
+            field=models.DateTimeField(default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='supplierotp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='supplierotp',
+            name='created_at',
+            field=models.DateTimeField(default=timezone.now),
+        ),
+        migrations.RunPython(hash_existing_codes, reverse_code=migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='supplierotp',
+            name='code',
+        ),
+        migrations.AddIndex(
+            model_name='supplierotp',
+            index=models.Index(fields=['supplier', 'created_at'], name='supplierotp_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplierotp',
+            index=models.Index(fields=['expires_at'], name='supplierotp_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_blob_storage'),
+        ('purchasing', '0019_otp_service'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierScorecard',
+            fields=[
+                ('supplier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='scorecard', serialize=False, to='purchasing.supplier')),
+                ('evaluations', models.PositiveIntegerField(default=0)),
+                ('avg_evaluation', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('receipts', models.PositiveIntegerField(default=0)),
+                ('on_time_receipts', models.PositiveIntegerField(default=0)),
+                ('quoted_lines', models.PositiveIntegerField(default=0)),
+                ('price_variance', models.DecimalField(blank=True, decimal_places=4, max_digits=7, null=True)),
+                ('invoices_checked', models.PositiveIntegerField(default=0)),
+                ('mismatched_invoices', models.PositiveIntegerField(default=0)),
+                ('score', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'score'], name='scorecard_company_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchasing', '0020_supplier_scorecard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotationrequestline',
+            name='freight',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 5.2.3 on 2026-10-19 15:07
+
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# request type -> (line foreign key, app label, item master model)
+ITEM_FIELDS = {
+    'Product': ('product', 'inventory', 'Product'),
+    'Service': ('service_item', 'purchasing', 'ServiceItem'),
+    'Office Supply': ('office_supply_item', 'purchasing', 'OfficeSupplyItem'),
+    'Asset/Capex': ('asset_item', 'purchasing', 'AssetItem'),
+    'IT/Software': ('it_item', 'purchasing', 'ITSoftwareItem'),
+}
+
+
+def _quantity(value):
+    try:
+        qty = Decimal(str(value if value not in (None, '') else 0))
+    except InvalidOperation:
+        return Decimal('0')
+    return qty if qty.is_finite() and qty >= 0 else Decimal('0')
+
+
+def backfill_lines(apps, schema_editor):
+    """Parse ``items`` JSON (or the single product fields) into line rows.
+
+    Items are matched to the master of the requisition type by name within
+    the company. Unmatched items keep their name only.
+    """
+    PurchaseRequisition = apps.get_model('purchasing', 'PurchaseRequisition')
+    Line = apps.get_model('purchasing', 'PurchaseRequisitionLine')
+    masters = {}
+
+    def master(company_id, request_type, name):
+        if request_type not in ITEM_FIELDS or not name:
+            return None
+        key = (company_id, request_type)
+        if key not in masters:
+            _, app, model = ITEM_FIELDS[request_type]
+            rows = apps.get_model(app, model).objects.filter(company_id=company_id)
+            masters[key] = dict(rows.values_list('name', 'pk'))
+        return masters[key].get(name)
+
+    batch = []
+    qs = PurchaseRequisition.objects.select_related('product__unit').order_by('pk')
+    for pr in qs.iterator(chunk_size=500):
+        common = {'requisition_id': pr.pk, 'item_type': pr.request_type,
+                  'company_id': pr.company_id, 'requested_on': pr.created_at}
+        items = pr.items if isinstance(pr.items, list) else []
+        for line_no, item in enumerate(i for i in items if isinstance(i, dict)):
+            name = str(item.get('name') or '')[:255]
+            line = Line(
+                line_no=line_no + 1,
+                name=name,
+                description=str(item.get('description') or ''),
+                quantity=_quantity(item.get('quantity')),
+                unit=str(item.get('unit') or '')[:50],
+                justification=str(item.get('justification') or ''),
+                **common,
+            )
+            pk = master(pr.company_id, pr.request_type, name)
+            if pk is not None:
+                setattr(line, f'{ITEM_FIELDS[pr.request_type][0]}_id', pk)
+            batch.append(line)
+        if not items and pr.product_id:
+            batch.append(Line(
+                line_no=1, product_id=pr.product_id, name=pr.product.name,
+                description=pr.specification, quantity=pr.quantity,
+                unit=pr.product.unit.code, **common,
+            ))
+        if len(batch) >= 1000:
+            Line.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Line.objects.bulk_create(batch)
+    # Decided requisitions were approved or rejected in full.
+    Line.objects.filter(requisition__status='approved').update(approved_quantity=models.F('quantity'))
+    Line.objects.filter(requisition__status='rejected').update(approved_quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_blob_storage'),
+        ('inventory', '0017_blob_storage'),
+        ('purchasing', '0021_quotation_line_freight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseRequisitionLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_no', models.PositiveSmallIntegerField()),
+                ('item_type', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('approved_quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('unit', models.CharField(blank=True, max_length=50)),
+                ('justification', models.TextField(blank=True)),
+                ('requested_on', models.DateField()),
+                ('asset_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='purchasing.assetitem')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+                ('it_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='purchasing.itsoftwareitem')),
+                ('office_supply_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='purchasing.officesupplyitem')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventory.product')),
+                ('requisition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='purchasing.purchaserequisition')),
+                ('service_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='purchasing.serviceitem')),
+            ],
+            options={
+                'ordering': ['line_no'],
+                'indexes': [models.Index(fields=['company', 'requested_on', 'item_type'], name='prline_demand_idx')],
+                'unique_together': {('requisition', 'line_no')},
+            },
+        ),
+        migrations.RunPython(backfill_lines, reverse_code=migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='purchaserequisition',
+            name='items',
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.3 on 2026-10-19 15:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+
+
+def open_pending_tasks(apps, schema_editor):
+    """Queue level-1 tasks for documents already awaiting approval.
+
+    Uses the permission the single-step approval views required.
+    """
+    ApprovalTask = apps.get_model('purchasing', 'ApprovalTask')
+    ApprovalQueueCount = apps.get_model('purchasing', 'ApprovalQueueCount')
+    PurchaseRequisition = apps.get_model('purchasing', 'PurchaseRequisition')
+    Payment = apps.get_model('purchasing', 'Payment')
+    requisitions = PurchaseRequisition.objects.filter(status='pending').annotate(
+        value=Sum(F('lines__quantity') * F('lines__product__sale_price'),
+                  output_field=DecimalField(max_digits=16, decimal_places=2)),
+    )
+    tasks = [
+        ApprovalTask(company_id=pr.company_id, kind='requisition', object_id=pr.pk, level=1,
+                     permission='approve_purchaserequisition', status='pending', title=pr.number,
+                     amount=pr.value or 0, requested_by_id=pr.requester_id)
+        for pr in requisitions.iterator()
+    ]
+    tasks += [
+        ApprovalTask(company_id=p.company_id, kind='payment', object_id=p.pk, level=1,
+                     permission='approve_payment', status='pending', title=f'Payment #{p.pk}',
+                     amount=p.amount)
+        for p in Payment.objects.filter(status='pending').iterator()
+    ]
+    ApprovalTask.objects.bulk_create(tasks, batch_size=1000)
+    counts = (
+        ApprovalTask.objects.filter(status='pending')
+        .values('company_id', 'permission')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    ApprovalQueueCount.objects.bulk_create([
+        ApprovalQueueCount(company_id=c['company_id'], permission=c['permission'], pending=c['n'])
+        for c in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_blob_storage'),
+        ('purchasing', '0022_requisition_lines'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentapproval',
+            name='level',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='ApprovalQueueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.CharField(max_length=150)),
+                ('pending', models.IntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+            ],
+            options={
+                'unique_together': {('company', 'permission')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ApprovalTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('requisition', 'Requisition'), ('payment', 'Payment')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('level', models.PositiveSmallIntegerField()),
+                ('permission', models.CharField(max_length=150)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], default='waiting', max_length=10)),
+                ('title', models.CharField(max_length=255)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('decided_at', models.DateTimeField(blank=True, null=True)),
+                ('comment', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+                ('decided_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'status', 'permission', 'created_at'], name='approvaltask_queue_idx')],
+                'unique_together': {('kind', 'object_id', 'level')},
+            },
+        ),
+        migrations.RunPython(open_pending_tasks, reverse_code=migrations.RunPython.noop),
+    ]
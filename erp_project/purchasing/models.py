@@ -1,10 +1,14 @@
 from decimal import Decimal
 import random
+import re
 from django.db import models
+from django.db.models.functions import Length
 from django.utils import timezone
 from accounts.models import Company
-from inventory.models import Product, Warehouse, ProductSerial
+from accounts.storage import get_blob_storage
+from inventory.models import Product, Warehouse, ProductSerial, StockMovement
 from ledger.utils import post_entry
+from .utils import normalize_email, normalize_iban, normalize_phone
 
 
 class Bank(models.Model):
@@ -27,7 +31,7 @@ class Supplier(models.Model):
 
     trade_license_number = models.CharField(max_length=50, blank=True, null=True, unique=True)
     trn = models.CharField(max_length=15, blank=True, null=True, unique=True)
-    vat_certificate = models.FileField(upload_to='vat_docs/', blank=True)
+    vat_certificate = models.FileField(upload_to='vat_docs/', storage=get_blob_storage, blank=True)
 
     iban = models.CharField(max_length=23, blank=True, null=True, unique=True)
     bank = models.ForeignKey(Bank, on_delete=models.PROTECT, null=True, blank=True)
@@ -38,22 +42,49 @@ class Supplier(models.Model):
     is_connected = models.BooleanField(default=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
 
+    # Normalized copies of the identifiers above, used for duplicate checks.
+    phone_e164 = models.CharField(max_length=16, unique=True, null=True, blank=True, editable=False)
+    email_normalized = models.CharField(max_length=254, unique=True, null=True, blank=True, editable=False)
+    iban_compact = models.CharField(max_length=34, unique=True, null=True, blank=True, editable=False)
+
     def __str__(self):
         return self.name
 
+    def normalize_identifiers(self):
+        self.phone_e164 = normalize_phone(self.phone)
+        self.email_normalized = normalize_email(self.email)
+        self.iban_compact = normalize_iban(self.iban)
+
+    def save(self, *args, **kwargs):
+        self.normalize_identifiers()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'phone_e164', 'email_normalized', 'iban_compact'}
+        super().save(*args, **kwargs)
+
 
 class SupplierOTP(models.Model):
-    """One-time passcode for supplier email verification."""
+    """One-time passcode for supplier email verification.
+
+    Only a keyed hash of the code is stored; see ``purchasing.otp``.
+    """
 
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='otps')
-    code = models.CharField(max_length=6)
-    created_at = models.DateTimeField(auto_now_add=True)
+    code_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['supplier', 'created_at'], name='supplierotp_latest_idx'),
+            models.Index(fields=['expires_at'], name='supplierotp_expiry_idx'),
+        ]
+
     def is_valid(self):
-        """Return True if OTP is within 10 minutes and unused."""
-        expiry = self.created_at + timezone.timedelta(minutes=10)
-        return not self.is_used and timezone.now() < expiry
+        """Return True if the OTP is unused and not yet expired."""
+        return not self.is_used and timezone.now() < self.expires_at
 
 
 class PurchaseOrder(models.Model):
@@ -76,6 +107,29 @@ class PurchaseOrder(models.Model):
     def __str__(self):
         return self.order_number
 
+    @staticmethod
+    def generate_numbers(company: Company, count: int = 1) -> list:
+        """Generate ``count`` consecutive PO numbers for the company.
+
+        Call inside ``transaction.atomic()``: the company row stays locked
+        until the caller commits, so concurrent callers wait rather than get
+        the same numbers. Numbers with a non-numeric suffix are ignored.
+        """
+        prefix = f"{company.code}-PO"
+        list(Company.objects.select_for_update().filter(pk=company.pk).values_list("pk", flat=True))
+        last = (
+            PurchaseOrder.objects.filter(company=company, order_number__regex=rf"^{re.escape(prefix)}[0-9]+$")
+            .order_by(Length("order_number"), "order_number")
+            .values_list("order_number", flat=True)
+            .last()
+        )
+        start = int(last[len(prefix):]) + 1 if last else 1
+        numbers = []
+        for seq in range(start, start + count):
+            width = max(4, len(str(seq)))
+            numbers.append(f"{prefix}{seq:0{width}d}")
+        return numbers
+
 
 class PurchaseOrderLine(models.Model):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='lines')
@@ -148,6 +202,7 @@ class PaymentApproval(models.Model):
     approver = models.ForeignKey('accounts.User', on_delete=models.PROTECT)
     approved = models.BooleanField()
     comment = models.TextField(blank=True)
+    level = models.PositiveIntegerField(default=1)
     approved_at = models.DateTimeField(auto_now_add=True)
 
 
@@ -156,6 +211,7 @@ class GoodsReceipt(models.Model):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.PROTECT)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     qty_received = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
     ean = models.CharField(max_length=13)
     serial = models.CharField(max_length=100)
@@ -164,13 +220,33 @@ class GoodsReceipt(models.Model):
     def __str__(self):
         return f"GRN {self.purchase_order.order_number} {self.product}"
 
+    def order_unit_cost(self):
+        """Unit price of the matching PO line, used as the receipt cost."""
+        line = (
+            self.purchase_order.lines.filter(product=self.product)
+            .order_by('id')
+            .values_list('unit_price', flat=True)
+            .first()
+        )
+        return line if line is not None else Decimal('0')
+
     def save(self, *args, **kwargs):
         creating = self.pk is None
+        if self.unit_cost is None:
+            self.unit_cost = self.order_unit_cost()
         super().save(*args, **kwargs)
         if creating:
             if self.product.track_serial:
                 ProductSerial.objects.create(product=self.product, serial=self.serial)
-            amount = Decimal(self.qty_received) * self.product.sale_price
+            StockMovement.objects.create(
+                product=self.product,
+                warehouse=self.warehouse,
+                quantity=self.qty_received,
+                unit_cost=self.unit_cost,
+                movement_type=StockMovement.IN,
+                reference=f"GRN {self.purchase_order.order_number}",
+            )
+            amount = (Decimal(self.qty_received) * Decimal(self.unit_cost)).quantize(Decimal('0.01'))
             post_entry(
                 self.purchase_order.company,
                 f"GRN {self.purchase_order.order_number}",
@@ -187,19 +263,30 @@ class SupplierInvoice(models.Model):
     number = models.CharField(max_length=50, unique=True)
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.PROTECT)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    file = models.FileField(upload_to='invoices/', blank=True)
+    file = models.FileField(upload_to='invoices/', storage=get_blob_storage, blank=True)
     STATUS_PENDING = 'pending'
+    STATUS_MATCHED = 'matched'
+    STATUS_EXCEPTION = 'exception'
     STATUS_APPROVED = 'approved'
     STATUS_CHOICES = [
         (STATUS_PENDING, 'Pending'),
+        (STATUS_MATCHED, 'Matched'),
+        (STATUS_EXCEPTION, 'Match Exception'),
         (STATUS_APPROVED, 'Approved'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    matched_at = models.DateTimeField(null=True, blank=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'status'], name='invoice_company_status_idx'),
+        ]
+
     def __str__(self):
         return self.number
 
+
 class QuotationRequest(models.Model):
     """Request quotation from a supplier for specific products."""
 
@@ -219,6 +306,8 @@ class QuotationRequestLine(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Per-unit freight, duty and other charges on top of the price.
+    freight = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     ean = models.CharField(max_length=13, blank=True)
     serial_list = models.TextField(blank=True)
     selected = models.BooleanField(default=False)
@@ -259,7 +348,6 @@ class PurchaseRequisition(models.Model):
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     specification = models.CharField(max_length=255, blank=True)
     justification = models.TextField(blank=True)
-    items = models.JSONField(default=list, blank=True)
     requester = models.ForeignKey('accounts.User', on_delete=models.PROTECT)
     approver = models.ForeignKey('accounts.User', on_delete=models.PROTECT, null=True, blank=True, related_name='approved_reqs')
     approved_at = models.DateTimeField(null=True, blank=True)
@@ -288,6 +376,47 @@ class PurchaseRequisition(models.Model):
         return f"{prefix}{seq:0{width}d}"
 
 
+class PurchaseRequisitionLine(models.Model):
+    """One requested item of a requisition.
+
+    The item links to the master matching its type; free-text items keep
+    only ``name``. ``company`` and ``requested_on`` copy the requisition's
+    so demand can be grouped by period without a join.
+    """
+
+    requisition = models.ForeignKey(PurchaseRequisition, on_delete=models.CASCADE, related_name='lines')
+    line_no = models.PositiveSmallIntegerField()
+    item_type = models.CharField(max_length=20)
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, blank=True)
+    service_item = models.ForeignKey('ServiceItem', on_delete=models.PROTECT, null=True, blank=True)
+    office_supply_item = models.ForeignKey('OfficeSupplyItem', on_delete=models.PROTECT, null=True, blank=True)
+    asset_item = models.ForeignKey('AssetItem', on_delete=models.PROTECT, null=True, blank=True)
+    it_item = models.ForeignKey('ITSoftwareItem', on_delete=models.PROTECT, null=True, blank=True)
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    approved_quantity = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    unit = models.CharField(max_length=50, blank=True)
+    justification = models.TextField(blank=True)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    requested_on = models.DateField()
+
+    class Meta:
+        ordering = ['line_no']
+        unique_together = ('requisition', 'line_no')
+        indexes = [
+            models.Index(fields=['company', 'requested_on', 'item_type'], name='prline_demand_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.requisition} #{self.line_no} {self.name}"
+
+    @property
+    def approval_limit(self):
+        """Most a further approval level can approve."""
+        return self.quantity if self.approved_quantity is None else self.approved_quantity
+
+
 class PurchaseRequisitionApproval(models.Model):
     """Approval record for a requisition."""
 
@@ -307,6 +436,81 @@ class PurchaseRequisitionApproval(models.Model):
         return f"{self.approver} - {state}"
 
 
+class ApprovalTask(models.Model):
+    """One level of the approval chain of a requisition or payment.
+
+    Level 1 starts pending and later levels wait until the one before is
+    approved. Approvers holding ``permission`` see pending tasks in their
+    queue; ``title`` and ``amount`` copy the document so the queue needs no
+    joins.
+    """
+
+    KIND_REQUISITION = 'requisition'
+    KIND_PAYMENT = 'payment'
+    KIND_CHOICES = [
+        (KIND_REQUISITION, 'Requisition'),
+        (KIND_PAYMENT, 'Payment'),
+    ]
+
+    WAITING = 'waiting'
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    REJECTED = 'rejected'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'),
+        (PENDING, 'Pending'),
+        (APPROVED, 'Approved'),
+        (REJECTED, 'Rejected'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    level = models.PositiveSmallIntegerField()
+    permission = models.CharField(max_length=150)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    title = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    requested_by = models.ForeignKey(
+        'accounts.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    decided_by = models.ForeignKey(
+        'accounts.User', on_delete=models.PROTECT, null=True, blank=True, related_name='+'
+    )
+    decided_at = models.DateTimeField(null=True, blank=True)
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id', 'level')
+        indexes = [
+            models.Index(fields=['company', 'status', 'permission', 'created_at'], name='approvaltask_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} L{self.level} ({self.status})"
+
+
+class ApprovalQueueCount(models.Model):
+    """Number of pending approval tasks per company and permission.
+
+    Kept in step by ``purchasing.approvals`` so the nav bar count does not
+    scan the queue. ``rollup_approvals`` rebuilds it.
+    """
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    permission = models.CharField(max_length=150)
+    pending = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('company', 'permission')
+
+    def __str__(self):
+        return f"{self.company} {self.permission}: {self.pending}"
+
+
 class SupplierEvaluation(models.Model):
     """Store evaluation scores for suppliers."""
 
@@ -320,6 +524,44 @@ class SupplierEvaluation(models.Model):
         return f"{self.supplier} {self.score}"
 
 
+class SupplierScorecard(models.Model):
+    """Rolled-up supplier performance used to rank quotations.
+
+    Maintained by :mod:`purchasing.scorecards` from evaluations, goods
+    receipts, quotation prices and invoice matching. ``score`` is 0-100.
+    """
+
+    supplier = models.OneToOneField(Supplier, on_delete=models.CASCADE, primary_key=True, related_name='scorecard')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    evaluations = models.PositiveIntegerField(default=0)
+    avg_evaluation = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    receipts = models.PositiveIntegerField(default=0)
+    on_time_receipts = models.PositiveIntegerField(default=0)
+    quoted_lines = models.PositiveIntegerField(default=0)
+    # Mean of (quoted price - product average) / product average.
+    price_variance = models.DecimalField(max_digits=7, decimal_places=4, null=True, blank=True)
+    invoices_checked = models.PositiveIntegerField(default=0)
+    mismatched_invoices = models.PositiveIntegerField(default=0)
+    score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'score'], name='scorecard_company_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier} {self.score}"
+
+    @property
+    def on_time_ratio(self):
+        return self.on_time_receipts / self.receipts if self.receipts else None
+
+    @property
+    def mismatch_rate(self):
+        return self.mismatched_invoices / self.invoices_checked if self.invoices_checked else None
+
+
 class ServiceItem(models.Model):
     """Service master record for requisitions."""
 
@@ -381,3 +623,25 @@ class ITSoftwareItem(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class PipelineMetric(models.Model):
+    """Precomputed procure-to-pay figure shown on the dashboard.
+
+    One row per company and metric key, refreshed by signals on writes and by
+    the ``rollup_pipeline`` command. ``data`` holds breakdowns such as counts
+    per status.
+    """
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='pipeline_metrics')
+    key = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('company', 'key')
+
+    def __str__(self):
+        return f"{self.company} {self.key}"
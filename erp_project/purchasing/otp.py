@@ -0,0 +1,153 @@
+"""Supplier one-time passcodes.
+
+Codes are random six-digit numbers, stored only as an HMAC keyed with
+``SECRET_KEY`` and the supplier id. Issuing a code retires the supplier's
+earlier ones, so verification reads just the latest live row through the
+``(supplier, created_at)`` index and compares hashes in constant time. A code
+accepts ``OTP_MAX_ATTEMPTS`` wrong guesses before it is retired.
+
+Issuing and verifying are rate limited per supplier and per client IP with
+token buckets held in the default cache. The cache must be shared between
+processes (Redis, Memcached, database) for the limits to be global.
+:func:`purge_expired` (``manage.py purge_otps``) deletes spent rows.
+
+Emails are sent by the ``send_supplier_otp`` job, which creates the code
+itself so the clear text never reaches the job table.
+"""
+
+import math
+import secrets
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from erp_project import metrics
+
+from .models import SupplierOTP
+
+OTP_TTL = timedelta(minutes=10)
+OTP_MAX_ATTEMPTS = 5
+# bucket name -> (capacity, seconds to refill completely)
+DEFAULT_RATE_LIMITS = {
+    'issue_supplier': (3, 600),
+    'issue_ip': (20, 3600),
+    'verify_supplier': (10, 600),
+    'verify_ip': (30, 600),
+}
+
+
+class RateLimited(ValueError):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f'Too many requests, retry in {retry_after} seconds')
+
+
+class TokenBucket:
+    """Token bucket stored in the cache as ``(tokens, updated_at)``.
+
+    Reads and writes are not atomic, so concurrent requests may occasionally
+    be let through slightly above the limit; that is acceptable for abuse
+    control.
+    """
+
+    def __init__(self, key, capacity, period):
+        self.key = f'otp-bucket:{key}'
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    def take(self, now=None):
+        """Consume a token or raise :class:`RateLimited`."""
+        now = time.time() if now is None else now
+        tokens, updated = cache.get(self.key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            raise RateLimited(math.ceil((1 - tokens) / self.rate))
+        cache.set(self.key, (tokens - 1, now), timeout=math.ceil(self.capacity / self.rate))
+
+
+def _limit(action, supplier, ip, now=None):
+    limits = {**DEFAULT_RATE_LIMITS, **getattr(settings, 'OTP_RATE_LIMITS', {})}
+    buckets = [TokenBucket(f'{action}:s:{supplier.pk}', *limits[f'{action}_supplier'])]
+    if ip:
+        buckets.append(TokenBucket(f'{action}:ip:{ip}', *limits[f'{action}_ip']))
+    for bucket in buckets:
+        bucket.take(now)
+
+
+def hash_code(supplier_id, code):
+    return salted_hmac('purchasing.otp', f'{supplier_id}:{code}', algorithm='sha256').hexdigest()
+
+
+def new_code():
+    return f'{secrets.randbelow(10 ** 6):06d}'
+
+
+def build(supplier, code, now=None):
+    """Return an unsaved :class:`SupplierOTP` for ``code``."""
+    now = now or timezone.now()
+    return SupplierOTP(
+        supplier=supplier, code_hash=hash_code(supplier.pk, code), created_at=now, expires_at=now + OTP_TTL
+    )
+
+
+def check_issue(supplier, ip=None):
+    """Raise :class:`RateLimited` when the supplier or IP asked too often."""
+    _limit('issue', supplier, ip)
+
+
+def create(supplier):
+    """Replace the supplier's live code with a fresh one, returned in clear text."""
+    code = new_code()
+    SupplierOTP.objects.filter(supplier=supplier, is_used=False).update(is_used=True)
+    build(supplier, code).save()
+    metrics.OTP_ISSUED.inc()
+    return code
+
+
+def issue(supplier, ip=None):
+    """Create a fresh code for ``supplier`` and return it in clear text.
+
+    Raises :class:`RateLimited` when the supplier or IP asked too often.
+    """
+    check_issue(supplier, ip)
+    return create(supplier)
+
+
+def verify(supplier, code, ip=None):
+    """Check ``code`` against the supplier's latest live OTP and consume it."""
+    _limit('verify', supplier, ip)
+    now = timezone.now()
+    otp = (
+        SupplierOTP.objects.filter(supplier=supplier, is_used=False, expires_at__gt=now)
+        .order_by('-created_at').first()
+    )
+    if otp is None:
+        return False
+    if constant_time_compare(otp.code_hash, hash_code(supplier.pk, code.strip())):
+        SupplierOTP.objects.filter(pk=otp.pk).update(is_used=True)
+        return True
+    otp.attempts += 1
+    SupplierOTP.objects.filter(pk=otp.pk).update(
+        attempts=otp.attempts, is_used=otp.attempts >= OTP_MAX_ATTEMPTS
+    )
+    return False
+
+
+def purge_expired(now=None, batch_size=1000):
+    """Delete expired codes in batches. Returns the count.
+
+    Used codes are retired but kept until they expire like any other.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = list(
+            SupplierOTP.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += SupplierOTP.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,129 @@
+"""Procure-to-pay pipeline figures for the dashboard.
+
+Each metric is computed by one function returning ``(count, amount, data)``
+and stored in :class:`~purchasing.models.PipelineMetric`. Signals in
+:mod:`purchasing.signals` queue a job that refreshes only the metrics a
+transaction's writes can affect. The ``rollup_pipeline`` command recomputes
+everything, which also catches bulk writes that bypass signals. Reading the
+dashboard is then a single query per company.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from inventory.models import Product
+from inventory.stock import stock_by_product
+
+from .matching import line_totals, receipt_totals
+from .models import (
+    Payment,
+    PipelineMetric,
+    PurchaseOrder,
+    PurchaseRequisition,
+    SupplierInvoice,
+)
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+LOW_STOCK_SAMPLE = 20
+
+OPEN_REQUISITIONS = 'open_requisitions'
+PO_AWAITING_ACK = 'po_awaiting_ack'
+UNRECEIVED_PO_VALUE = 'unreceived_po_value'
+UNMATCHED_INVOICES = 'unmatched_invoices'
+PENDING_PAYMENTS = 'pending_payments'
+LOW_STOCK = 'low_stock'
+
+
+def _open_requisitions(company):
+    open_statuses = [PurchaseRequisition.DRAFT, PurchaseRequisition.PENDING]
+    rows = (
+        PurchaseRequisition.objects.filter(company=company, status__in=open_statuses)
+        .values('status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    by_status = {r['status']: r['n'] for r in rows}
+    return sum(by_status.values()), ZERO, {'by_status': by_status}
+
+
+def _po_awaiting_ack(company):
+    count = PurchaseOrder.objects.filter(company=company, acknowledged=False).count()
+    return count, ZERO, {}
+
+
+def _unreceived_po_value(company):
+    po_ids = PurchaseOrder.objects.filter(company=company).values('pk')
+    received = receipt_totals(po_ids)
+    total = ZERO
+    orders = set()
+    for (po_id, pid), (qty, value) in line_totals(po_ids).items():
+        got = received.get((po_id, pid), (ZERO, ZERO))[0]
+        if qty and got < qty:
+            total += (qty - got) * value / qty
+            orders.add(po_id)
+    return len(orders), total.quantize(CENT), {}
+
+
+def _unmatched_invoices(company):
+    agg = SupplierInvoice.objects.filter(
+        company=company,
+        status__in=[SupplierInvoice.STATUS_PENDING, SupplierInvoice.STATUS_EXCEPTION],
+    ).aggregate(n=Count('id'), total=Sum('amount'))
+    return agg['n'], agg['total'] or ZERO, {}
+
+
+def _pending_payments(company):
+    agg = Payment.objects.filter(company=company, status=Payment.STATUS_PENDING).aggregate(
+        n=Count('id'), total=Sum('amount')
+    )
+    return agg['n'], agg['total'] or ZERO, {}
+
+
+def _low_stock(company):
+    watched = list(
+        Product.objects.filter(company=company, is_discontinued=False, reorder_level__gt=0)
+        .values_list('pk', 'sku', 'reorder_level')
+    )
+    if not watched:
+        return 0, ZERO, {'skus': []}
+    levels = stock_by_product(company, products=[pk for pk, _, _ in watched])
+    low = [sku for pk, sku, level in watched if levels.get(pk, ZERO) <= level]
+    return len(low), ZERO, {'skus': sorted(low)[:LOW_STOCK_SAMPLE]}
+
+
+METRICS = {
+    OPEN_REQUISITIONS: _open_requisitions,
+    PO_AWAITING_ACK: _po_awaiting_ack,
+    UNRECEIVED_PO_VALUE: _unreceived_po_value,
+    UNMATCHED_INVOICES: _unmatched_invoices,
+    PENDING_PAYMENTS: _pending_payments,
+    LOW_STOCK: _low_stock,
+}
+
+
+def refresh_metrics(company, keys=None):
+    """Recompute the given metrics (all by default) for one company."""
+    keys = list(keys or METRICS)
+    rows = []
+    for key in keys:
+        count, amount, data = METRICS[key](company)
+        rows.append(PipelineMetric(company_id=getattr(company, 'pk', company), key=key,
+                                   count=count, amount=amount, data=data))
+    PipelineMetric.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['company', 'key'],
+        update_fields=['count', 'amount', 'data', 'updated_at'],
+    )
+
+
+def dashboard_metrics(company):
+    """Return ``{key: PipelineMetric}`` for a company, computing on first use."""
+    metrics = {m.key: m for m in PipelineMetric.objects.filter(company=company)}
+    missing = [key for key in METRICS if key not in metrics]
+    if missing:
+        refresh_metrics(company, missing)
+        metrics = {m.key: m for m in PipelineMetric.objects.filter(company=company)}
+    return metrics
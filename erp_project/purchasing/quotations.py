@@ -0,0 +1,159 @@
+"""Quotation comparison and award.
+
+Open quotation lines are ranked per product in SQL with window functions:
+best unit price, landed cost (price plus per-unit freight) and its rank, and
+the saving against the dearest quote. :func:`comparison_matrix` pivots one
+page of products into a product x supplier grid. :func:`award_lines` turns
+any number of chosen lines into one purchase order per supplier inside a
+single transaction.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Q, Window
+from django.db.models.functions import Rank
+
+from accounts.jobs import enqueue_on_commit
+from inventory.models import Product
+
+from . import pipeline
+from .models import PurchaseOrder, PurchaseOrderLine, QuotationRequestLine
+
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+AWARD_ATTEMPTS = 3
+
+
+def open_lines(company):
+    return QuotationRequestLine.objects.filter(quotation__company=company, selected=False)
+
+
+def ranked_lines(company, product_ids=None):
+    """Open lines annotated with per-product price statistics.
+
+    Adds ``landed``, ``best_price``, ``best_landed``, ``landed_rank`` (1 is
+    cheapest), ``quotes`` and ``savings`` (``(dearest landed - landed) *
+    quantity``).
+    """
+    lines = open_lines(company)
+    if product_ids is not None:
+        lines = lines.filter(product_id__in=product_ids)
+    per_product = {'partition_by': [F('product_id')]}
+    return lines.annotate(
+        landed=ExpressionWrapper(F('unit_price') + F('freight'), output_field=MONEY),
+    ).annotate(
+        best_price=Window(Min('unit_price'), **per_product),
+        best_landed=Window(Min('landed'), **per_product),
+        landed_rank=Window(Rank(), order_by=F('landed').asc(), **per_product),
+        quotes=Window(Count('pk'), **per_product),
+        savings=ExpressionWrapper(
+            (Window(Max('landed'), **per_product) - F('landed')) * F('quantity'), output_field=MONEY
+        ),
+    )
+
+
+def quoted_products(company, search=''):
+    """Products with open quotation lines, for paginating the matrix."""
+    products = Product.objects.filter(pk__in=open_lines(company).values('product_id'))
+    if search:
+        products = products.filter(Q(name__icontains=search) | Q(sku__icontains=search))
+    return products.order_by('name', 'pk')
+
+
+@dataclass
+class MatrixRow:
+    product: Product
+    cells: list  # one best line (or None) per supplier column
+    best: QuotationRequestLine = None
+
+
+@dataclass
+class Matrix:
+    suppliers: list = field(default_factory=list)
+    rows: list = field(default_factory=list)
+
+
+def comparison_matrix(company, products, sort='price'):
+    """Pivot the open lines of ``products`` into a product x supplier grid.
+
+    A supplier quoting a product more than once shows its cheapest line.
+    Columns are ordered by supplier name, or by scorecard score when
+    ``sort`` is ``'score'``. Runs one query.
+    """
+    products = list(products)
+    lines = ranked_lines(company, [p.pk for p in products]).select_related(
+        'quotation__supplier__scorecard'
+    ).order_by('product_id', 'landed_rank', 'pk')
+    cells = {}
+    suppliers = {}
+    for line in lines:
+        supplier = line.quotation.supplier
+        suppliers[supplier.pk] = supplier
+        cells.setdefault((line.product_id, supplier.pk), line)
+    if sort == 'score':
+        def key(s):
+            card = getattr(s, 'scorecard', None)
+            score = card.score if card is not None and card.score is not None else -1
+            return (-score, s.name)
+    else:
+        def key(s):
+            return (s.name, s.pk)
+    columns = sorted(suppliers.values(), key=key)
+    matrix = Matrix(suppliers=columns)
+    for product in products:
+        row = MatrixRow(product, [cells.get((product.pk, s.pk)) for s in columns])
+        row.best = min((c for c in row.cells if c is not None), key=lambda c: c.landed_rank, default=None)
+        matrix.rows.append(row)
+    return matrix
+
+
+def award_lines(company, line_ids):
+    """Create one purchase order per supplier from the chosen open lines.
+
+    Lines already selected or belonging to another company are skipped.
+    Returns ``(orders, skipped)``. On backends without row locks a number
+    clash with a concurrent award is retried.
+    """
+    line_ids = set(line_ids)
+    for attempt in range(1, AWARD_ATTEMPTS + 1):
+        try:
+            return _award(company, line_ids)
+        except IntegrityError:
+            if attempt == AWARD_ATTEMPTS:
+                raise
+
+
+def _award(company, line_ids):
+    with transaction.atomic():
+        lines = list(
+            open_lines(company).filter(pk__in=line_ids)
+            .select_for_update(of=('self',))
+            .select_related('quotation')
+            .order_by('pk')
+        )
+        if not lines:
+            return [], len(line_ids)
+        QuotationRequestLine.objects.filter(pk__in=[l.pk for l in lines]).update(selected=True)
+        by_supplier = defaultdict(list)
+        for line in lines:
+            by_supplier[line.quotation.supplier_id].append(line)
+        numbers = PurchaseOrder.generate_numbers(company, len(by_supplier))
+        orders = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(order_number=number, supplier_id=supplier_id, company=company)
+            for number, supplier_id in zip(numbers, by_supplier)
+        ])
+        if any(po.pk is None for po in orders):
+            # Backends that do not return primary keys from bulk inserts.
+            saved = PurchaseOrder.objects.in_bulk(numbers, field_name='order_number')
+            orders = [saved[number] for number in numbers]
+        PurchaseOrderLine.objects.bulk_create([
+            PurchaseOrderLine(
+                purchase_order=po, product_id=line.product_id, quantity=line.quantity, unit_price=line.unit_price
+            )
+            for po, supplier_lines in zip(orders, by_supplier.values())
+            for line in supplier_lines
+        ])
+        # Bulk inserts skip the signals that keep the dashboard current.
+        enqueue_on_commit('refresh_pipeline', company.pk, keys=[pipeline.PO_AWAITING_ACK, pipeline.UNRECEIVED_PO_VALUE])
+    return orders, len(line_ids) - len(lines)
@@ -0,0 +1,172 @@
+"""Requisition line items and demand reporting.
+
+Line items posted by the requisition form are resolved against the item
+master for the request type and stored as
+:class:`~purchasing.models.PurchaseRequisitionLine` rows with one bulk
+insert. :func:`demand_by_month` aggregates them per item and month in SQL.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import CharField, Count, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from inventory.models import Product
+
+from .models import (
+    AssetItem,
+    ITSoftwareItem,
+    OfficeSupplyItem,
+    PurchaseRequisition,
+    PurchaseRequisitionLine,
+    ServiceItem,
+)
+
+# Also offered by the line item search on the requisition form.
+TYPE_ASSET = 'Asset/Capex'
+TYPE_IT = 'IT/Software'
+
+# request type -> (line foreign key, item master model)
+ITEM_FIELDS = {
+    PurchaseRequisition.TYPE_PRODUCT: ('product', Product),
+    PurchaseRequisition.TYPE_SERVICE: ('service_item', ServiceItem),
+    PurchaseRequisition.TYPE_OFFICE: ('office_supply_item', OfficeSupplyItem),
+    TYPE_ASSET: ('asset_item', AssetItem),
+    TYPE_IT: ('it_item', ITSoftwareItem),
+}
+DEMAND_STATUSES = (PurchaseRequisition.PENDING, PurchaseRequisition.APPROVED)
+
+
+class RequisitionError(ValueError):
+    pass
+
+
+def _quantity(value, line_no):
+    try:
+        qty = Decimal(str(value if value not in (None, '') else 0))
+    except InvalidOperation:
+        raise RequisitionError(f'Line {line_no}: invalid quantity')
+    if qty < 0 or not qty.is_finite():
+        raise RequisitionError(f'Line {line_no}: invalid quantity')
+    return qty
+
+
+def _masters(company, request_type, items):
+    """Return ``(by_id, by_name)`` for the masters referenced by ``items``."""
+    if request_type not in ITEM_FIELDS:
+        return {}, {}
+    model = ITEM_FIELDS[request_type][1]
+    ids = {str(i.get('item_id')) for i in items if str(i.get('item_id') or '').isdigit()}
+    names = {i.get('name') for i in items if i.get('name')}
+    found = model.objects.filter(Q(pk__in=ids) | Q(name__in=names), company=company).select_related('unit')
+    by_id = {str(m.pk): m for m in found}
+    by_name = {m.name: m for m in found}
+    return by_id, by_name
+
+
+def build_lines(pr, items):
+    """Return unsaved lines for ``pr`` from posted item dicts.
+
+    Items carry ``item_id`` (or just ``name``), ``description``,
+    ``quantity``, ``unit`` and ``justification``. Raises
+    :class:`RequisitionError` for invalid quantities.
+    """
+    by_id, by_name = _masters(pr.company, pr.request_type, items)
+    field = ITEM_FIELDS.get(pr.request_type, (None,))[0]
+    lines = []
+    for line_no, item in enumerate(items, start=1):
+        master = by_id.get(str(item.get('item_id'))) or by_name.get(item.get('name'))
+        line = PurchaseRequisitionLine(
+            requisition=pr,
+            line_no=line_no,
+            item_type=pr.request_type,
+            name=(master.name if master else item.get('name') or '')[:255],
+            description=item.get('description') or '',
+            quantity=_quantity(item.get('quantity'), line_no),
+            unit=(item.get('unit') or (master.unit.name if master else ''))[:50],
+            justification=item.get('justification') or '',
+            company=pr.company,
+            requested_on=pr.created_at,
+        )
+        if master is not None:
+            setattr(line, field, master)
+        lines.append(line)
+    return lines
+
+
+def legacy_line(pr):
+    """Line for the single product/quantity fields of the original form."""
+    return PurchaseRequisitionLine(
+        requisition=pr,
+        line_no=1,
+        item_type=pr.request_type,
+        product=pr.product,
+        name=pr.product.name,
+        description=pr.specification,
+        quantity=pr.quantity,
+        unit=pr.product.unit.code,
+        company=pr.company,
+        requested_on=pr.created_at,
+    )
+
+
+def create_lines(pr, items):
+    """Bulk-create the lines for a new requisition."""
+    lines = build_lines(pr, items) if items else []
+    if not lines and pr.product_id:
+        lines = [legacy_line(pr)]
+    return PurchaseRequisitionLine.objects.bulk_create(lines)
+
+
+def decide_lines(pr, approved, quantities=None):
+    """Record approved quantities at each approval level of ``pr``.
+
+    ``quantities`` maps line pks to approved amounts. Lines without an
+    entry keep the amount approved so far, or are approved in full. A level
+    can lower an earlier level's amount but not raise it. Rejection
+    approves nothing.
+    """
+    quantities = quantities or {}
+    lines = list(pr.lines.all())
+    for line in lines:
+        if not approved:
+            line.approved_quantity = 0
+        else:
+            qty = quantities.get(line.pk)
+            qty = line.approval_limit if qty in (None, '') else _quantity(qty, line.line_no)
+            line.approved_quantity = min(qty, line.approval_limit)
+    PurchaseRequisitionLine.objects.bulk_update(lines, ['approved_quantity'])
+    return lines
+
+
+def demand_by_month(company, start=None, end=None, item_type=None, statuses=DEMAND_STATUSES):
+    """Requested and approved quantity per item and month.
+
+    Lines are grouped by their item master, or by name for free-text items.
+    Returns dicts with ``month``, ``item_type``, ``item``, ``unit_label``,
+    ``requested``, ``approved`` and ``requisitions``. Runs one query.
+    """
+    lines = PurchaseRequisitionLine.objects.filter(company=company)
+    if statuses:
+        lines = lines.filter(requisition__status__in=statuses)
+    if start:
+        lines = lines.filter(requested_on__gte=start)
+    if end:
+        lines = lines.filter(requested_on__lt=end)
+    if item_type:
+        lines = lines.filter(item_type=item_type)
+    masters = [field for field, _ in ITEM_FIELDS.values()]
+    return (
+        lines.annotate(
+            month=TruncMonth('requested_on'),
+            item=Coalesce(*[f'{field}__name' for field in masters], 'name', output_field=CharField()),
+        )
+        .values('month', 'item_type', 'item', *[f'{field}_id' for field in masters])
+        .annotate(
+            unit_label=Max('unit'),
+            requested=Sum('quantity'),
+            approved=Coalesce(Sum('approved_quantity'), Value(Decimal('0'))),
+            requisitions=Count('requisition', distinct=True),
+        )
+        .order_by('month', 'item_type', 'item')
+    )
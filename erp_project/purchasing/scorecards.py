@@ -0,0 +1,181 @@
+"""Supplier scorecards.
+
+Each supplier's evaluation average, on-time receipt ratio, quoted price
+variance and invoice mismatch rate are aggregated into one
+:class:`~purchasing.models.SupplierScorecard` row. :func:`refresh_scorecards`
+computes any set of suppliers with one grouped query per component. Signals in
+:mod:`purchasing.signals` queue one ``refresh_scorecards`` job per
+transaction for the affected suppliers and the ``rollup_scorecards`` command
+recomputes everything, so ranking quotations only reads the stored rows.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Avg, Count, DateField, ExpressionWrapper, F, Q
+
+from .models import (
+    GoodsReceipt,
+    QuotationRequestLine,
+    Supplier,
+    SupplierEvaluation,
+    SupplierInvoice,
+    SupplierScorecard,
+)
+
+DEFAULTS = {
+    'on_time_days': 14,
+    'evaluation_max': '10',
+    'weights': {'quality': 30, 'delivery': 30, 'price': 20, 'accuracy': 20},
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SUPPLIER_SCORECARD', {})}
+
+
+def _evaluations(suppliers):
+    rows = (
+        SupplierEvaluation.objects.filter(supplier__in=suppliers)
+        .values('supplier_id')
+        .annotate(n=Count('id'), avg=Avg('score'))
+        .order_by()
+    )
+    return {r['supplier_id']: (r['n'], r['avg']) for r in rows}
+
+
+def _receipts(suppliers, on_time_days):
+    due = ExpressionWrapper(F('purchase_order__date') + timedelta(days=on_time_days), output_field=DateField())
+    rows = (
+        GoodsReceipt.objects.filter(purchase_order__supplier__in=suppliers)
+        .values('purchase_order__supplier_id')
+        .annotate(n=Count('id'), on_time=Count('id', filter=Q(date__lte=due)))
+        .order_by()
+    )
+    return {r['purchase_order__supplier_id']: (r['n'], r['on_time']) for r in rows}
+
+
+def _price_variance(company_id, suppliers):
+    quoted = QuotationRequestLine.objects.filter(quotation__company_id=company_id, unit_price__gt=0)
+    lines = list(
+        quoted.filter(quotation__supplier__in=suppliers)
+        .values_list('quotation__supplier_id', 'product_id', 'unit_price')
+    )
+    averages = dict(
+        quoted.filter(product__in={product for _, product, _ in lines})
+        .values('product_id')
+        .annotate(avg=Avg('unit_price'))
+        .order_by()
+        .values_list('product_id', 'avg')
+    )
+    deviations = defaultdict(list)
+    for supplier, product, price in lines:
+        avg = Decimal(averages[product])
+        deviations[supplier].append((price - avg) / avg)
+    return {s: (len(d), sum(d) / len(d)) for s, d in deviations.items()}
+
+
+def _invoices(suppliers):
+    rows = (
+        SupplierInvoice.objects.filter(purchase_order__supplier__in=suppliers)
+        .exclude(status=SupplierInvoice.STATUS_PENDING)
+        .values('purchase_order__supplier_id')
+        .annotate(n=Count('id'), bad=Count('id', filter=Q(status=SupplierInvoice.STATUS_EXCEPTION)))
+        .order_by()
+    )
+    return {r['purchase_order__supplier_id']: (r['n'], r['bad']) for r in rows}
+
+
+def composite_score(card, config=None):
+    """Weighted 0-100 score over the components that have data, or ``None``."""
+    config = config or _config()
+    parts = {}
+    if card.avg_evaluation is not None:
+        parts['quality'] = card.avg_evaluation / Decimal(config['evaluation_max'])
+    if card.receipts:
+        parts['delivery'] = Decimal(card.on_time_receipts) / card.receipts
+    if card.price_variance is not None:
+        # Quoting at the average scores 0.5; 50% below it scores 1.
+        parts['price'] = Decimal('0.5') - card.price_variance
+    if card.invoices_checked:
+        parts['accuracy'] = 1 - Decimal(card.mismatched_invoices) / card.invoices_checked
+    weights = {k: Decimal(config['weights'].get(k, 0)) for k in parts}
+    total = sum(weights.values())
+    if not total:
+        return None
+    score = sum(min(max(parts[k], 0), 1) * weights[k] for k in parts) * 100 / total
+    return score.quantize(Decimal('0.01'))
+
+
+def refresh_scorecards(company, supplier_ids=None):
+    """Recompute scorecards for a company's suppliers (all by default).
+
+    Also copies the score to ``Supplier.rating`` on a 0-10 scale.
+    """
+    company_id = getattr(company, 'pk', company)
+    config = _config()
+    suppliers = Supplier.objects.filter(company_id=company_id)
+    if supplier_ids is not None:
+        suppliers = suppliers.filter(pk__in=supplier_ids)
+    ids = list(suppliers.values_list('pk', flat=True))
+    if not ids:
+        return 0
+    evaluations = _evaluations(ids)
+    receipts = _receipts(ids, config['on_time_days'])
+    prices = _price_variance(company_id, ids)
+    invoices = _invoices(ids)
+    cards = []
+    for pk in ids:
+        evaluated, avg = evaluations.get(pk, (0, None))
+        received, on_time = receipts.get(pk, (0, 0))
+        quoted, variance = prices.get(pk, (0, None))
+        checked, bad = invoices.get(pk, (0, 0))
+        card = SupplierScorecard(
+            supplier_id=pk,
+            company_id=company_id,
+            evaluations=evaluated,
+            avg_evaluation=Decimal(avg).quantize(Decimal('0.01')) if avg is not None else None,
+            receipts=received,
+            on_time_receipts=on_time,
+            quoted_lines=quoted,
+            price_variance=variance.quantize(Decimal('0.0001')) if variance is not None else None,
+            invoices_checked=checked,
+            mismatched_invoices=bad,
+        )
+        card.score = composite_score(card, config)
+        cards.append(card)
+    SupplierScorecard.objects.bulk_create(
+        cards,
+        update_conflicts=True,
+        unique_fields=['supplier'],
+        update_fields=[
+            'company', 'evaluations', 'avg_evaluation', 'receipts', 'on_time_receipts', 'quoted_lines',
+            'price_variance', 'invoices_checked', 'mismatched_invoices', 'score', 'updated_at',
+        ],
+    )
+    Supplier.objects.bulk_update(
+        [
+            Supplier(pk=c.supplier_id, rating=(c.score / 10).quantize(Decimal('0.1')) if c.score is not None else None)
+            for c in cards
+        ],
+        ['rating'],
+        batch_size=500,
+    )
+    return len(cards)
+
+
+def refresh_affected(company_id, supplier_ids=(), product_ids=()):
+    """Refresh ``supplier_ids`` and every supplier that quoted one of ``product_ids``.
+
+    A new quote moves its product's average price, and so the variance of
+    every supplier quoting that product.
+    """
+    ids = set(supplier_ids)
+    if product_ids:
+        ids.update(
+            QuotationRequestLine.objects.filter(quotation__company_id=company_id, product_id__in=product_ids)
+            .values_list('quotation__supplier_id', flat=True)
+        )
+    return refresh_scorecards(company_id, ids)
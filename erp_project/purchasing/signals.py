@@ -0,0 +1,90 @@
+"""Refresh pipeline metrics and supplier scorecards when records change.
+
+Both are recomputed by jobs (``refresh_pipeline``, ``refresh_scorecards``)
+queued once per transaction with the union of the metrics, suppliers and
+products its writes touched, so a write does not pay for the recompute
+inside the request.
+"""
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
+
+from accounts.jobs import enqueue_on_commit
+from inventory.models import InventoryAdjustment, Product, StockLot, StockMovement
+
+from . import pipeline
+from .models import (
+    GoodsReceipt,
+    Payment,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    PurchaseRequisition,
+    QuotationRequestLine,
+    SupplierEvaluation,
+    SupplierInvoice,
+)
+
+# model -> (how to find the company id, metrics the model feeds)
+WATCHED = {
+    PurchaseRequisition: ('company_id', [pipeline.OPEN_REQUISITIONS]),
+    PurchaseOrder: ('company_id', [pipeline.PO_AWAITING_ACK, pipeline.UNRECEIVED_PO_VALUE]),
+    PurchaseOrderLine: ('purchase_order.company_id', [pipeline.UNRECEIVED_PO_VALUE]),
+    GoodsReceipt: ('purchase_order.company_id', [pipeline.UNRECEIVED_PO_VALUE]),
+    SupplierInvoice: ('company_id', [pipeline.UNMATCHED_INVOICES]),
+    Payment: ('company_id', [pipeline.PENDING_PAYMENTS]),
+    Product: ('company_id', [pipeline.LOW_STOCK]),
+    StockLot: ('product.company_id', [pipeline.LOW_STOCK]),
+    StockMovement: ('product.company_id', [pipeline.LOW_STOCK]),
+    InventoryAdjustment: ('product.company_id', [pipeline.LOW_STOCK]),
+}
+
+# model -> (company id path, supplier id path)
+SCORED = {
+    SupplierEvaluation: ('company_id', 'supplier_id'),
+    GoodsReceipt: ('purchase_order.company_id', 'purchase_order.supplier_id'),
+    SupplierInvoice: ('company_id', 'purchase_order.supplier_id'),
+}
+
+
+def _company_id(instance, path):
+    value = instance
+    try:
+        for attr in path.split('.'):
+            value = getattr(value, attr)
+    except ObjectDoesNotExist:
+        # Parent already removed, e.g. during a cascading delete.
+        return None
+    return value
+
+
+def _on_change(sender, instance, **kwargs):
+    path, keys = WATCHED[sender]
+    company_id = _company_id(instance, path)
+    if company_id is not None:
+        enqueue_on_commit('refresh_pipeline', company_id, keys=keys)
+
+
+def _on_scored_change(sender, instance, **kwargs):
+    company_path, supplier_path = SCORED[sender]
+    company_id = _company_id(instance, company_path)
+    supplier_id = _company_id(instance, supplier_path)
+    if company_id is not None and supplier_id is not None:
+        enqueue_on_commit('refresh_scorecards', company_id, supplier_ids=[supplier_id])
+
+
+def _on_quote_change(sender, instance, **kwargs):
+    # A new price moves the product average, and so every quoting supplier.
+    company_id = _company_id(instance, 'quotation.company_id')
+    if company_id is not None:
+        enqueue_on_commit('refresh_scorecards', company_id, product_ids=[instance.product_id])
+
+
+def connect():
+    for model in WATCHED:
+        post_save.connect(_on_change, sender=model, dispatch_uid=f'pipeline_save_{model.__name__}')
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f'pipeline_delete_{model.__name__}')
+    for model in SCORED:
+        post_save.connect(_on_scored_change, sender=model, dispatch_uid=f'scorecard_save_{model.__name__}')
+        post_delete.connect(_on_scored_change, sender=model, dispatch_uid=f'scorecard_delete_{model.__name__}')
+    post_save.connect(_on_quote_change, sender=QuotationRequestLine, dispatch_uid='scorecard_save_quote')
+    post_delete.connect(_on_quote_change, sender=QuotationRequestLine, dispatch_uid='scorecard_delete_quote')
@@ -0,0 +1,200 @@
+"""Bulk supplier onboarding from CSV.
+
+Rows use the same field names as the supplier form. Import runs in three
+stages:
+
+1. :func:`validate_row` checks formats with no database access. Phone
+   parsing is CPU-bound, so large files are validated in a process pool.
+2. Rows are checked against each other and, in batches, against existing
+   suppliers with :func:`~purchasing.suppliers.find_conflicts`. Banks are
+   resolved once per distinct name/SWIFT pair.
+3. Unless it is a dry run, valid rows are inserted with ``bulk_create``
+   and one ``send_supplier_otp`` job is queued per supplier with an email.
+
+The returned :class:`ImportReport` lists every rejected line with its
+errors.
+"""
+
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.jobs import enqueue_many
+
+from .models import Bank, Supplier
+from .suppliers import find_conflicts, identifier_keys
+from .utils import (
+    normalize_iban,
+    validate_iban,
+    validate_phone,
+    validate_swift,
+    validate_trade_license,
+    validate_trn,
+)
+
+FIELDS = [
+    'name', 'description', 'contact_person', 'phone', 'email', 'trade_license_number',
+    'trn', 'iban', 'bank_name', 'swift_code', 'address',
+]
+PARALLEL_THRESHOLD = 500
+CONFLICT_BATCH = 500
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    created: int = 0
+    dry_run: bool = False
+    errors: list = field(default_factory=list)  # [(line, {field: message})]
+
+    @property
+    def valid(self):
+        return self.total - len(self.errors)
+
+
+def read_rows(fh):
+    """Read CSV rows from a text or binary file object."""
+    if isinstance(fh.read(0), bytes):
+        fh = io.TextIOWrapper(fh, encoding='utf-8-sig')
+    return [{f: (row.get(f) or '').strip() for f in FIELDS} for row in csv.DictReader(fh)]
+
+
+def validate_row(row):
+    """Return ``{field: message}`` format errors for one row (no queries)."""
+    errors = {}
+    if not row['name']:
+        errors['name'] = 'Name required'
+    if not row['contact_person']:
+        errors['contact_person'] = 'Contact person required'
+    if row['phone'] and not validate_phone(row['phone']):
+        errors['phone'] = 'Invalid phone number'
+    if row['trade_license_number'] and not validate_trade_license(row['trade_license_number']):
+        errors['trade_license_number'] = 'Invalid trade license number'
+    if row['trn'] and not validate_trn(row['trn']):
+        errors['trn'] = 'Invalid TRN'
+    if row['iban'] and not validate_iban(row['iban']):
+        errors['iban'] = 'Invalid IBAN'
+    if row['bank_name'] or row['swift_code']:
+        if not row['bank_name'] or not row['swift_code']:
+            errors['bank_name'] = 'Bank name and SWIFT required together'
+        elif not validate_swift(row['swift_code']):
+            errors['swift_code'] = 'Invalid SWIFT code'
+    return errors
+
+
+def validate_rows(rows, workers=None):
+    """Validate ``rows`` in order, using a process pool for large inputs."""
+    if workers == 1 or len(rows) < PARALLEL_THRESHOLD:
+        return [validate_row(r) for r in rows]
+    with ProcessPoolExecutor(workers) as pool:
+        chunk = max(len(rows) // ((workers or 4) * 4), 1)
+        return list(pool.map(validate_row, rows, chunksize=chunk))
+
+
+class BankResolver:
+    """Resolve name/SWIFT pairs to banks, loading existing ones in one query."""
+
+    def __init__(self, rows):
+        pairs = {(r['bank_name'], r['swift_code']) for r in rows if r['bank_name'] and r['swift_code']}
+        names = {n for n, _ in pairs}
+        swifts = {s for _, s in pairs}
+        banks = list(Bank.objects.filter(Q(name__in=names) | Q(swift_code__in=swifts))) if pairs else []
+        self.by_name = {b.name: b for b in banks}
+        self.by_swift = {b.swift_code: b for b in banks}
+        self.cache = {}
+
+    def resolve(self, name, swift_code):
+        """Return ``(bank, errors)``; new banks are unsaved until :meth:`save`."""
+        key = (name, swift_code)
+        if key not in self.cache:
+            self.cache[key] = self._resolve(name, swift_code)
+        return self.cache[key]
+
+    def _resolve(self, name, swift_code):
+        bank = self.by_name.get(name)
+        other = self.by_swift.get(swift_code)
+        if other is not None and other.name != name:
+            return None, {'swift_code': 'SWIFT code already used by another bank'}
+        if bank is not None:
+            if bank.swift_code != swift_code:
+                return None, {'swift_code': 'Bank exists with different SWIFT code'}
+            return bank, {}
+        bank = Bank(name=name, swift_code=swift_code)
+        self.by_name[name] = self.by_swift[swift_code] = bank
+        return bank, {}
+
+    def save(self):
+        new = [b for b in self.by_name.values() if b.pk is None]
+        Bank.objects.bulk_create(new)
+        if new and any(b.pk is None for b in new):
+            # Backends that do not return primary keys from bulk inserts.
+            saved = Bank.objects.in_bulk([b.name for b in new], field_name='name')
+            for bank in new:
+                bank.pk = saved[bank.name].pk
+
+
+def _duplicates_within(rows, errors):
+    seen = {}
+    for idx, row in enumerate(rows):
+        if errors[idx]:
+            continue
+        for key, value in identifier_keys(row).items():
+            first = seen.setdefault((key, value), idx)
+            if first != idx:
+                errors[idx][key] = f'Duplicate of line {first + 2}'
+
+
+def import_suppliers(company, rows, dry_run=False, workers=None, send_otp=True):
+    """Validate and create suppliers for ``company``; return an :class:`ImportReport`."""
+    report = ImportReport(total=len(rows), dry_run=dry_run)
+    errors = validate_rows(rows, workers)
+    _duplicates_within(rows, errors)
+    pending = [i for i, e in enumerate(errors) if not e]
+    for start in range(0, len(pending), CONFLICT_BATCH):
+        batch = pending[start:start + CONFLICT_BATCH]
+        for idx, found in zip(batch, find_conflicts([rows[i] for i in batch])):
+            errors[idx].update({f: message for f, (message, _) in found.items()})
+    banks = BankResolver(rows)
+    resolved = {}
+    for idx, row in enumerate(rows):
+        if not errors[idx] and row['bank_name']:
+            bank, bank_errors = banks.resolve(row['bank_name'], row['swift_code'])
+            errors[idx].update(bank_errors)
+            resolved[idx] = bank
+    # Line numbers count the CSV header as line 1.
+    report.errors = [(idx + 2, e) for idx, e in enumerate(errors) if e]
+    if dry_run:
+        return report
+
+    valid = [idx for idx, e in enumerate(errors) if not e]
+    with transaction.atomic():
+        banks.save()
+        suppliers = []
+        for idx in valid:
+            row = rows[idx]
+            supplier = Supplier(
+                name=row['name'],
+                description=row['description'],
+                contact_person=row['contact_person'],
+                phone=row['phone'] or None,
+                email=row['email'] or None,
+                trade_license_number=row['trade_license_number'] or None,
+                trn=row['trn'] or None,
+                iban=normalize_iban(row['iban']),
+                bank=resolved.get(idx),
+                address=row['address'],
+                company=company,
+            )
+            supplier.normalize_identifiers()
+            suppliers.append(supplier)
+        suppliers = Supplier.objects.bulk_create(suppliers, batch_size=500)
+        if send_otp:
+            enqueue_many('send_supplier_otp', [
+                {'supplier_id': s.pk} for s in suppliers if s.email
+            ], company=company)
+    report.created = len(suppliers)
+    return report
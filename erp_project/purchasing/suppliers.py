@@ -0,0 +1,124 @@
+"""Supplier identity checks.
+
+Identifiers are compared in normalized form (E.164 phone, compact IBAN,
+lower-cased email) against the indexed ``*_e164``/``*_normalized``/
+``*_compact`` columns of :class:`~purchasing.models.Supplier`.
+:func:`find_conflicts` checks any number of candidate records against the
+supplier master in a single query and reports every clashing field.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Bank, Supplier
+from .utils import normalize_email, normalize_iban, normalize_phone
+
+# form field -> (model column compared, normalizer, error message)
+IDENTIFIERS = {
+    'email': ('email_normalized', normalize_email, 'Email already exists'),
+    'phone': ('phone_e164', normalize_phone, 'Phone already exists'),
+    'trade_license_number': ('trade_license_number', lambda v: (v or '').strip() or None,
+                             'Trade license number exists'),
+    'trn': ('trn', lambda v: (v or '').strip() or None, 'TRN exists'),
+    'iban': ('iban_compact', normalize_iban, 'IBAN exists'),
+}
+
+
+def identifier_keys(data):
+    """Return ``{field: normalized value}`` for the identifiers present in ``data``."""
+    keys = {}
+    for field, (_, normalize, _) in IDENTIFIERS.items():
+        value = normalize(data.get(field))
+        if value is not None:
+            keys[field] = value
+    return keys
+
+
+def find_conflicts(records, exclude_pks=()):
+    """Check candidate supplier records against existing suppliers.
+
+    ``records`` is a list of dicts with form field names. Returns a list
+    aligned with it of ``{field: (message, supplier_pk)}`` dicts. Suppliers in
+    ``exclude_pks`` (the record being edited) are ignored. Runs one query.
+    """
+    keys = [identifier_keys(r) for r in records]
+    wanted = defaultdict(set)
+    for k in keys:
+        for field, value in k.items():
+            wanted[IDENTIFIERS[field][0]].add(value)
+    results = [{} for _ in records]
+    if not wanted:
+        return results
+    query = Q()
+    for column, values in wanted.items():
+        query |= Q(**{f'{column}__in': values})
+    columns = [column for column, _, _ in IDENTIFIERS.values()]
+    owners = defaultdict(dict)
+    for row in Supplier.objects.filter(query).exclude(pk__in=exclude_pks).values('pk', *columns):
+        for column in columns:
+            if row[column] is not None:
+                owners[column][row[column]] = row['pk']
+    for result, k in zip(results, keys):
+        for field, value in k.items():
+            column, _, message = IDENTIFIERS[field]
+            if value in owners[column]:
+                result[field] = (message, owners[column][value])
+    return results
+
+
+def conflict_errors(data, exclude_pk=None):
+    """Return ``{field: message}`` for identifiers already used by another supplier."""
+    excluded = [exclude_pk] if exclude_pk else []
+    return {field: message for field, (message, _) in find_conflicts([data], excluded)[0].items()}
+
+
+def resolve_bank(name, swift_code, create=True):
+    """Return ``(bank, errors)`` for a bank name and SWIFT code pair.
+
+    A bank is matched by name; a new one is created when neither the name nor
+    the SWIFT code exists yet (unless ``create`` is false, in which case an
+    unsaved instance is returned).
+    """
+    errors = {}
+    matches = list(Bank.objects.filter(Q(name=name) | Q(swift_code=swift_code)))
+    by_name = next((b for b in matches if b.name == name), None)
+    if any(b.swift_code == swift_code and b.name != name for b in matches):
+        errors['swift_code'] = 'SWIFT code already used by another bank'
+    if by_name is not None:
+        if by_name.swift_code != swift_code:
+            errors['swift_code'] = 'Bank exists with different SWIFT code'
+        return by_name, errors
+    if errors:
+        return None, errors
+    bank = Bank(name=name, swift_code=swift_code)
+    if create:
+        bank.save()
+    return bank, errors
+
+
+def duplicate_report(company=None):
+    """Group suppliers sharing an identifier or a name.
+
+    Unlike the unique indexes, the report normalizes the raw columns itself,
+    so it also finds records that predate them. Returns a list of
+    ``{'field', 'value', 'suppliers': [(pk, name, company_id)]}`` dicts.
+    """
+    qs = Supplier.objects.order_by('pk')
+    if company is not None:
+        qs = qs.filter(company=company)
+    groups = defaultdict(list)
+    normalizers = {field: normalize for field, (_, normalize, _) in IDENTIFIERS.items()}
+    normalizers['name'] = lambda v: ' '.join((v or '').lower().split()) or None
+    rows = qs.values_list('pk', 'company_id', *normalizers).iterator(chunk_size=2000)
+    for pk, company_id, *values in rows:
+        name = values[-1]
+        for field, raw in zip(normalizers, values):
+            value = normalizers[field](raw)
+            if value is not None:
+                groups[(field, value)].append((pk, name, company_id))
+    return [
+        {'field': field, 'value': value, 'suppliers': members}
+        for (field, value), members in sorted(groups.items())
+        if len(members) > 1
+    ]
@@ -0,0 +1,42 @@
+from django.core.mail import send_mail
+
+from accounts.documents import cached_pdf
+from accounts.jobs import task
+
+from . import otp, pipeline, scorecards
+from .documents import is_final, requisition_document
+from .models import PurchaseRequisition, Supplier
+
+
+@task('render_requisition_pdf')
+def render_requisition_pdf(requisition_id):
+    """Render a decided requisition into the document cache ahead of download."""
+    pr = PurchaseRequisition.objects.select_related('company').filter(pk=requisition_id).first()
+    if pr is None or not is_final(pr):
+        return
+    cached_pdf(pr.company, requisition_document(pr))
+
+
+@task('refresh_pipeline')
+def refresh_pipeline(company_id, keys):
+    pipeline.refresh_metrics(company_id, keys)
+
+
+@task('refresh_scorecards')
+def refresh_scorecards(company_id, supplier_ids=(), product_ids=()):
+    scorecards.refresh_affected(company_id, supplier_ids, product_ids)
+
+
+@task('send_supplier_otp')
+def send_supplier_otp(supplier_id):
+    """Create a verification code and email it.
+
+    The code is made here rather than by the caller so it is never stored in
+    clear text. A retry after a failed send issues a new code.
+    """
+    supplier = Supplier.objects.filter(pk=supplier_id).first()
+    if supplier is None or not supplier.email:
+        return
+    code = otp.create(supplier)
+    send_mail('Supplier Verification', f'Your verification code is {code}', None, [supplier.email],
+              fail_silently=False)
@@ -1,16 +1,18 @@
 from django.urls import reverse
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 import json
 from django.contrib.auth import get_user_model
 from accounts.models import Company, Role, UserRole, Permission
 from inventory.models import (
     ProductCategory, ProductUnit, Product, Warehouse,
-    IdentifierType, ProductSerial, StockMovement
+    IdentifierType, ProductSerial, StockLot, StockMovement
 )
 from ledger.models import LedgerAccount, LedgerEntry
 from .models import (
     Bank,
     Supplier,
+    SupplierOTP,
     PurchaseOrder,
     PurchaseOrderLine,
     GoodsReceipt,
@@ -331,6 +333,7 @@ class PosScanTests(TestCase):
 
 class SupplierEnhancementTests(TestCase):
     def setUp(self):
+        cache.clear()  # OTP rate-limit buckets are keyed by supplier pk
         self.company = Company.objects.create(name='SupCo', code='SC')
         self.user = User.objects.create_user(username='sup', password='pass', company=self.company)
         role = Role.objects.get(name='Admin')
@@ -364,25 +367,71 @@ class SupplierEnhancementTests(TestCase):
         self.assertEqual(supplier.description, 'Widgets')
 
     def test_update_email_triggers_verification(self):
+        from django.core import mail
         supplier = Supplier.objects.create(name='ACME', description='', contact_person='CP', email='a@x.com', phone='+14155550110', company=self.company, bank=self.bank, is_verified=True)
         url = reverse('supplier_edit', args=[supplier.id])
-        resp = self.client.post(url, {
-            'name': 'ACME',
-            'description': '',
-            'contact_person': 'CP',
-            'phone': '+14155550111',
-            'email': 'new@example.com',
-            'trade_license_number': '',
-            'trn': '',
-            'iban': '',
-            'bank_name': 'TestBank',
-            'swift_code': 'TESTBANK',
-            'address': 'A',
-        })
+        with self.settings(JOBS_EAGER=True):
+            resp = self.client.post(url, {
+                'name': 'ACME',
+                'description': '',
+                'contact_person': 'CP',
+                'phone': '+14155550111',
+                'email': 'new@example.com',
+                'trade_license_number': '',
+                'trn': '',
+                'iban': '',
+                'bank_name': 'TestBank',
+                'swift_code': 'TESTBANK',
+                'address': 'A',
+            })
         self.assertEqual(resp.status_code, 302)
         supplier.refresh_from_db()
         self.assertFalse(supplier.is_verified)
         self.assertEqual(supplier.otps.count(), 1)
+        self.assertEqual(mail.outbox[-1].to, ['new@example.com'])
+
+    def test_duplicate_identifiers_are_normalized_and_reported_together(self):
+        from .suppliers import duplicate_report, find_conflicts
+
+        existing = Supplier.objects.create(
+            name='ACME', contact_person='CP', email='Dup@Example.com', phone='+14155550123',
+            iban='GB82WEST12345698765432', company=self.company,
+        )
+        self.assertEqual(existing.phone_e164, '+14155550123')
+        self.assertEqual(existing.email_normalized, 'dup@example.com')
+        resp = self.client.post(reverse('supplier_add'), {
+            'name': 'ACME 2', 'contact_person': 'Bob', 'phone': '+1 415-555-0123',
+            'email': 'dup@example.com', 'iban': 'gb82 west 1234 5698 7654 32',
+            'trade_license_number': '', 'trn': '', 'bank_name': '', 'swift_code': '', 'address': '',
+        })
+        self.assertEqual(resp.status_code, 200)
+        for message in ['Phone already exists', 'Email already exists', 'IBAN exists']:
+            self.assertContains(resp, message)
+        self.assertEqual(Supplier.objects.count(), 1)
+
+        records = [{'phone': '+1 (415) 555 0123'}, {'email': 'other@example.com'}, {'email': 'DUP@example.com'}]
+        with self.assertNumQueries(1):
+            found = find_conflicts(records)
+        self.assertEqual(found[0], {'phone': ('Phone already exists', existing.pk)})
+        self.assertEqual(found[1], {})
+        self.assertIn('email', found[2])
+        self.assertEqual(find_conflicts(records, exclude_pks=[existing.pk]), [{}, {}, {}])
+
+        Supplier.objects.create(name=' acme ', contact_person='CP', company=self.company)
+        groups = duplicate_report(self.company)
+        self.assertEqual([(g['field'], g['value'], len(g['suppliers'])) for g in groups], [('name', 'acme', 2)])
+
+    def test_reformatted_phone_keeps_verification(self):
+        supplier = Supplier.objects.create(name='ACME', contact_person='CP', email='a@x.com', phone='+14155550110', company=self.company, bank=self.bank, is_verified=True)
+        resp = self.client.post(reverse('supplier_edit', args=[supplier.id]), {
+            'name': 'ACME', 'description': '', 'contact_person': 'CP', 'phone': '+1 415 555 0110',
+            'email': 'A@x.com', 'trade_license_number': '', 'trn': '', 'iban': '',
+            'bank_name': 'TestBank', 'swift_code': 'TESTBANK', 'address': 'A',
+        })
+        self.assertEqual(resp.status_code, 302)
+        supplier.refresh_from_db()
+        self.assertTrue(supplier.is_verified)
+        self.assertEqual(supplier.otps.count(), 0)
 
     def test_toggle_requires_permission(self):
         supplier = Supplier.objects.create(name='X', contact_person='CP', company=self.company)
@@ -403,6 +452,15 @@ class SupplierEnhancementTests(TestCase):
         resp = self.client.get(reverse('supplier_list'), {'is_connected': 'False'})
         self.assertContains(resp, 'BBB')
 
+    def test_list_export_csv_uses_filters(self):
+        Supplier.objects.create(name='AAA', contact_person='c1', company=self.company)
+        Supplier.objects.create(name='BBB', contact_person='c2', company=self.company, is_connected=False)
+        resp = self.client.get(reverse('supplier_list'), {'is_connected': 'False', 'export': 'csv'})
+        body = b''.join(resp.streaming_content).decode()
+        self.assertIn('BBB', body)
+        self.assertNotIn('AAA', body)
+        self.assertNotIn('iban', body.splitlines()[0])
+
     def test_bank_ajax_search_and_create(self):
         Bank.objects.create(name='AjaxBank', swift_code='AJAX12345')
         resp = self.client.get(reverse('bank_search'), {'q': 'Ajax'})
@@ -492,7 +550,69 @@ class PurchaseRequisitionTests(TestCase):
         })
         self.assertEqual(resp.status_code, 302)
         pr = PurchaseRequisition.objects.first()
-        self.assertEqual(len(pr.items), 1)
+        self.assertEqual(pr.lines.count(), 1)
+
+    def test_lines_link_masters_and_approval_sets_quantities(self):
+        from .models import PurchaseRequisitionLine
+        data = [
+            {'type': 'Product', 'item_id': str(self.product.id), 'name': 'Item', 'quantity': '5', 'unit': ''},
+            {'type': 'Product', 'name': 'Custom part', 'quantity': '2', 'unit': 'box'},
+        ]
+        resp = self.client.post(reverse('requisition_add'), {
+            'request_type': PurchaseRequisition.TYPE_PRODUCT,
+            'items_json': json.dumps(data),
+        })
+        self.assertEqual(resp.status_code, 302)
+        pr = PurchaseRequisition.objects.get()
+        first, second = pr.lines.all()
+        self.assertEqual((first.product, first.quantity, first.unit), (self.product, 5, 'Pieces'))
+        self.assertEqual((second.product, second.name, second.line_no), (None, 'Custom part', 2))
+
+        bad = self.client.post(reverse('requisition_add'), {
+            'request_type': PurchaseRequisition.TYPE_PRODUCT,
+            'items_json': json.dumps([{'name': 'X', 'quantity': 'lots'}]),
+        })
+        self.assertContains(bad, 'Line 1: invalid quantity')
+        self.assertEqual(PurchaseRequisition.objects.count(), 1)
+
+        approver = User.objects.create_user(username='approver', password='pass', company=self.company)
+        UserRole.objects.create(user=approver, role=Role.objects.get(name='Admin'), company=self.company)
+        self.client.login(username='approver', password='pass')
+        detail = self.client.get(reverse('requisition_detail', args=[pr.id]))
+        self.assertContains(detail, f'name="approved_qty_{first.id}"')
+        self.client.post(reverse('requisition_approve', args=[pr.id]), {
+            'action': 'approve', f'approved_qty_{first.id}': '3',
+        })
+        approved = dict(PurchaseRequisitionLine.objects.values_list('line_no', 'approved_quantity'))
+        self.assertEqual(approved, {1: 3, 2: 2})
+
+    def test_demand_by_month_report(self):
+        from datetime import date
+        from decimal import Decimal
+        from .models import PurchaseRequisitionLine
+        from .requisitions import demand_by_month
+        for month, qty, status in [(1, 4, PurchaseRequisition.APPROVED), (1, 6, PurchaseRequisition.PENDING),
+                                   (2, 1, PurchaseRequisition.PENDING), (2, 9, PurchaseRequisition.REJECTED)]:
+            self.client.post(reverse('requisition_add'), {
+                'request_type': PurchaseRequisition.TYPE_PRODUCT, 'product': self.product.id, 'quantity': str(qty),
+            })
+            pr = PurchaseRequisition.objects.latest('pk')
+            PurchaseRequisition.objects.filter(pk=pr.pk).update(status=status)
+            PurchaseRequisitionLine.objects.filter(requisition=pr).update(requested_on=date(2026, month, 15))
+        with self.assertNumQueries(1):
+            rows = list(demand_by_month(self.company))
+        self.assertEqual(
+            [(r['month'], r['item'], r['requested'], r['requisitions']) for r in rows],
+            [(date(2026, 1, 1), 'Item', Decimal('10'), 2), (date(2026, 2, 1), 'Item', Decimal('1'), 1)],
+        )
+        resp = self.client.get(reverse('requisition_demand'), {'start': '2026-02', 'end': '2026-02', 'export': 'csv'})
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'month,item_type,item,unit_label,requested,approved,requisitions')
+        self.assertEqual(lines[1:], ['2026-02-01,Product,Item,PCS,1,0,1'])
+        resp = self.client.get(reverse('requisition_demand'), {'end': '2026-01'})
+        self.assertContains(resp, '2026-01')
+        self.assertNotContains(resp, '2026-02')
+        self.assertEqual(self.client.get(reverse('requisition_demand'), {'start': 'jan'}).status_code, 400)
 
     def test_requisition_form_get_contains_json(self):
         resp = self.client.get(reverse('requisition_add'))
@@ -547,6 +667,69 @@ class PurchaseRequisitionTests(TestCase):
         self.assertEqual(resp['Content-Type'], 'application/pdf')
 
 
+class RequisitionDocumentTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='DocCo', code='DC')
+        self.user = User.objects.create_user(username='doc', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        perm, _ = Permission.objects.get_or_create(codename='view_purchaserequisition')
+        role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='doc', password='pass')
+
+    def make_pr(self, number, items=3, status=PurchaseRequisition.APPROVED):
+        from .requisitions import create_lines
+        rows = [{'name': f'Item {n}', 'description': 'Spare & part <A>', 'quantity': n, 'unit': 'pcs'} for n in range(items)]
+        pr = PurchaseRequisition.objects.create(
+            number=number, request_type='Product', requester=self.user, company=self.company, status=status,
+        )
+        create_lines(pr, rows)
+        return pr
+
+    def test_long_item_list_flows_onto_more_pages(self):
+        pr = self.make_pr('DC-PR-1', items=120)
+        resp = self.client.get(reverse('requisition_pdf', args=[pr.id]))
+        data = b''.join(resp.streaming_content)
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertGreater(data.count(b'/Type /Page\n'), 1)
+
+    def test_final_requisition_pdf_is_rendered_once(self):
+        from unittest import mock
+        from accounts import documents
+        pr = self.make_pr('DC-PR-2')
+        with mock.patch.object(documents, 'render_pdf', wraps=documents.render_pdf) as render:
+            first = b''.join(self.client.get(reverse('requisition_pdf', args=[pr.id])).streaming_content)
+            second = b''.join(self.client.get(reverse('requisition_pdf', args=[pr.id])).streaming_content)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first, second)
+
+    def test_batch_download_as_zip_and_combined_pdf(self):
+        import io
+        import zipfile
+        a, b = self.make_pr('DC-PR-3'), self.make_pr('DC-PR-4', status=PurchaseRequisition.REJECTED)
+        pending = self.make_pr('DC-PR-5', status=PurchaseRequisition.PENDING)
+        ids = f'{a.id},{b.id},{pending.id}'
+        resp = self.client.get(reverse('requisition_batch_pdf'), {'ids': ids, 'format': 'zip'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(resp.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['DC-PR-3.pdf', 'DC-PR-4.pdf'])
+        resp = self.client.get(reverse('requisition_batch_pdf'), {'ids': ids})
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertEqual(self.client.get(reverse('requisition_batch_pdf'), {'ids': 'x'}).status_code, 400)
+
+    def test_letterhead_is_parsed_once_per_upload(self):
+        import io
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from accounts.documents import letterhead_image
+        buf = io.BytesIO()
+        Image.new('RGB', (40, 10), 'blue').save(buf, 'PNG')
+        self.company.letterhead = SimpleUploadedFile('head.png', buf.getvalue(), content_type='image/png')
+        self.company.save()
+        image = letterhead_image(self.company)
+        self.assertIsNotNone(image)
+        self.assertIs(letterhead_image(self.company), image)
+
+
 class ProcurementExtrasTests(TestCase):
     def setUp(self):
         self.company = Company.objects.create(name='EXCo', code='EX')
@@ -588,6 +771,53 @@ class ProcurementExtrasTests(TestCase):
         resp = self.client.get(reverse('invoice_match', args=[inv.id]))
         self.assertContains(resp, 'All documents match')
 
+    def test_goods_receipt_posts_at_cost_and_adds_stock(self):
+        from inventory.stock import stock_by_product
+        po = PurchaseOrder.objects.create(order_number='PO77', supplier=self.supplier, company=self.company)
+        PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=3, unit_price=7)
+        wh = Warehouse.objects.create(name='W', location='A', company=self.company)
+        grn = GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=3, warehouse=wh, ean='', serial='S7')
+        self.assertEqual(grn.unit_cost, 7)
+        entry = LedgerEntry.objects.get(description='GRN PO77')
+        self.assertIn(('Inventory', 21, 0), list(entry.lines.values_list('account__code', 'debit', 'credit')))
+        self.assertEqual(stock_by_product(self.company)[self.product.id], 3)
+
+    def test_invoice_match_uses_decimal_totals_with_tolerance(self):
+        from decimal import Decimal
+        from .matching import Tolerance, match_invoices
+        po = PurchaseOrder.objects.create(order_number='PO31', supplier=self.supplier, company=self.company)
+        PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=3, unit_price=Decimal('0.10'))
+        wh = Warehouse.objects.create(name='W', location='A', company=self.company)
+        GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=3, warehouse=wh, ean='', serial='S31')
+        inv = SupplierInvoice.objects.create(number='INV31', purchase_order=po, amount=Decimal('0.30'), company=self.company)
+        strict = Tolerance(percent=Decimal('0'), amount=Decimal('0'))
+        self.assertTrue(match_invoices([inv], strict)[inv.pk].matched)
+        SupplierInvoice.objects.filter(pk=inv.pk).update(amount=Decimal('0.35'))
+        inv.refresh_from_db()
+        self.assertFalse(match_invoices([inv], strict)[inv.pk].matched)
+        self.assertTrue(match_invoices([inv], Tolerance(percent=Decimal('20'), amount=Decimal('0')))[inv.pk].matched)
+
+    def test_match_command_updates_status_in_bulk(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .matching import match_invoices
+        wh = Warehouse.objects.create(name='W', location='A', company=self.company)
+        invoices = []
+        for n in range(4):
+            po = PurchaseOrder.objects.create(order_number=f'PB{n}', supplier=self.supplier, company=self.company)
+            PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=2, unit_price=5)
+            GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=3 if n == 3 else 2, warehouse=wh, ean='', serial=f'SB{n}')
+            invoices.append(SupplierInvoice.objects.create(number=f'IB{n}', purchase_order=po, amount=20 if n == 2 else 10, company=self.company))
+        with self.assertNumQueries(3):
+            results = match_invoices(invoices)
+        self.assertIn('received 3', results[invoices[3].pk].issues[0])
+        out = StringIO()
+        call_command('match_invoices', company='EX', stdout=out)
+        self.assertIn('2 matched, 2 exceptions', out.getvalue())
+        statuses = dict(SupplierInvoice.objects.values_list('number', 'status'))
+        self.assertEqual(statuses['IB0'], SupplierInvoice.STATUS_MATCHED)
+        self.assertEqual(statuses['IB2'], SupplierInvoice.STATUS_EXCEPTION)
+
     def test_payment_approval_posts_ledger(self):
         for code in ['Supplier', 'Cash']:
             LedgerAccount.objects.get_or_create(code=code, name=code, company=self.company)
@@ -823,3 +1053,511 @@ class ITSoftwareItemTests(TestCase):
         self.assertEqual(resp.status_code, 302)
         item.refresh_from_db()
         self.assertFalse(item.is_active)
+
+
+@override_settings(JOBS_EAGER=True)
+class PipelineDashboardTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='DashCo', code='DB')
+        self.user = User.objects.create_user(username='dash', password='pass', company=self.company)
+        self.client.login(username='dash', password='pass')
+        for code in ['Inventory', 'Supplier', 'Cash']:
+            LedgerAccount.objects.create(code=code, name=code, company=self.company)
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Pen', sku='PEN', unit=unit, company=self.company, reorder_level=5)
+        self.supplier = Supplier.objects.create(name='Sup', contact_person='CP', phone='+111', email='d@e.com', company=self.company)
+        self.wh = Warehouse.objects.create(name='W', location='A', company=self.company)
+
+    def make_po(self, number, qty=4, price=10):
+        po = PurchaseOrder.objects.create(order_number=number, supplier=self.supplier, company=self.company)
+        PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=qty, unit_price=price)
+        return po
+
+    def test_writes_refresh_metrics_after_commit(self):
+        from .models import PipelineMetric
+        with self.captureOnCommitCallbacks(execute=True):
+            po = self.make_po('PD1')
+            PurchaseRequisition.objects.create(number='PR-D1', request_type='Product', requester=self.user, company=self.company, status=PurchaseRequisition.PENDING)
+            SupplierInvoice.objects.create(number='ID1', purchase_order=po, amount=40, company=self.company)
+            Payment.objects.create(purchase_order=po, amount=15, method=Payment.METHOD_CASH, company=self.company)
+            StockLot.objects.create(product=self.product, warehouse=self.wh, batch_number='L', qty=2)
+        metrics = {m.key: m for m in PipelineMetric.objects.filter(company=self.company)}
+        self.assertEqual(metrics['po_awaiting_ack'].count, 1)
+        self.assertEqual(metrics['unreceived_po_value'].amount, 40)
+        self.assertEqual(metrics['open_requisitions'].data, {'by_status': {'pending': 1}})
+        self.assertEqual((metrics['unmatched_invoices'].count, metrics['unmatched_invoices'].amount), (1, 40))
+        self.assertEqual(metrics['pending_payments'].amount, 15)
+        self.assertEqual(metrics['low_stock'].data, {'skus': ['PEN']})
+        with self.captureOnCommitCallbacks(execute=True):
+            GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=3, warehouse=self.wh, ean='', serial='SD1')
+        self.assertEqual(PipelineMetric.objects.get(company=self.company, key='unreceived_po_value').amount, 10)
+
+    def test_one_refresh_job_per_transaction(self):
+        from accounts.models import Job
+        with self.settings(JOBS_EAGER=False):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.make_po('PM1')
+                self.make_po('PM2')
+                Payment.objects.create(amount=5, method=Payment.METHOD_CASH, company=self.company)
+            self.assertEqual(len(callbacks), 1)
+            job = Job.objects.get(name='refresh_pipeline', status=Job.QUEUED)
+        self.assertEqual(job.company, self.company)
+        self.assertEqual(job.payload, {
+            'company_id': self.company.pk,
+            'keys': ['pending_payments', 'po_awaiting_ack', 'unreceived_po_value'],
+        })
+
+    def test_dashboard_reads_do_not_grow_with_data(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.make_po('PQ0')
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('dashboard'))
+        for n in range(1, 15):
+            self.make_po(f'PQ{n}')
+        call_command_out = self.rollup()
+        self.assertIn('1 companies', call_command_out)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(large), len(small))
+        self.assertContains(resp, 'POs Awaiting Acknowledgement')
+        self.assertEqual(resp.context['pipeline']['po_awaiting_ack'].count, 15)
+        api = self.client.get(reverse('dashboard_api')).json()
+        self.assertEqual(api['pipeline']['unreceived_po_value']['amount'], '600.00')
+
+    def rollup(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('rollup_pipeline', company='DB', stdout=out)
+        return out.getvalue()
+
+
+@override_settings(JOBS_EAGER=True)
+class SupplierScorecardTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='ScoreCo', code='SCO')
+        self.user = User.objects.create_user(username='score', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        perm, _ = Permission.objects.get_or_create(codename='add_purchaseorder')
+        role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='score', password='pass')
+        for code in ['Inventory', 'Supplier']:
+            LedgerAccount.objects.create(code=code, name=code, company=self.company)
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Bolt', sku='BOLT', unit=unit, company=self.company)
+        self.wh = Warehouse.objects.create(name='W', location='A', company=self.company)
+        self.good = Supplier.objects.create(name='Good', contact_person='G', email='g@sc.com', company=self.company)
+        self.cheap = Supplier.objects.create(name='Cheap', contact_person='C', email='c@sc.com', company=self.company)
+
+    def quote(self, number, supplier, price):
+        q = QuotationRequest.objects.create(number=number, supplier=supplier, company=self.company)
+        return QuotationRequestLine.objects.create(quotation=q, product=self.product, quantity=1, unit_price=price)
+
+    def test_writes_update_scorecards_and_rank_quotations(self):
+        from decimal import Decimal
+        from .models import SupplierEvaluation
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quote('SQ1', self.good, 12)
+            self.quote('SQ2', self.cheap, 8)
+            po = PurchaseOrder.objects.create(order_number='SPO1', supplier=self.good, company=self.company)
+            PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=1, unit_price=12)
+            GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=1, warehouse=self.wh, ean='', serial='SC1')
+            SupplierEvaluation.objects.create(supplier=self.good, score=9, company=self.company)
+            SupplierEvaluation.objects.create(supplier=self.cheap, score=5, company=self.company)
+            po2 = PurchaseOrder.objects.create(order_number='SPO2', supplier=self.cheap, company=self.company)
+            SupplierInvoice.objects.create(number='SI1', purchase_order=po2, amount=5, company=self.company,
+                                           status=SupplierInvoice.STATUS_EXCEPTION)
+        good = self.good.scorecard
+        self.assertEqual((good.evaluations, good.receipts, good.on_time_receipts), (1, 1, 1))
+        self.assertEqual(good.price_variance, Decimal('0.2'))
+        self.assertEqual(good.score, Decimal('78.75'))
+        cheap = self.cheap.scorecard
+        self.assertEqual(cheap.mismatch_rate, 1)
+        self.assertEqual(cheap.score, Decimal('41.43'))
+        self.good.refresh_from_db()
+        self.assertEqual(self.good.rating, Decimal('7.9'))
+
+        resp = self.client.get(reverse('quotation_compare'))
+        self.assertEqual(resp.context['matrix'].suppliers, [self.cheap, self.good])
+        resp = self.client.get(reverse('quotation_compare'), {'sort': 'score'})
+        with self.assertNumQueries(0):
+            scores = [s.scorecard.score for s in resp.context['matrix'].suppliers]
+        self.assertEqual(scores, [good.score, cheap.score])
+        self.assertContains(resp, '78.75')
+
+    def test_quotes_in_one_transaction_queue_one_refresh(self):
+        from unittest import mock
+        from accounts.jobs import run_worker
+        from accounts.models import Job
+        with self.settings(JOBS_EAGER=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                for n in range(5):
+                    self.quote(f'SQM{n}', self.good if n % 2 else self.cheap, 10 + n)
+            job = Job.objects.get(name='refresh_scorecards')
+        self.assertEqual(job.payload, {'company_id': self.company.pk, 'product_ids': [self.product.pk]})
+        with mock.patch('purchasing.scorecards.refresh_scorecards', return_value=2) as refresh:
+            run_worker(once=True)
+        refresh.assert_called_once_with(self.company.pk, {self.good.pk, self.cheap.pk})
+
+    def test_rollup_command_recomputes_late_receipts(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from io import StringIO
+        from django.core.management import call_command
+        po = PurchaseOrder.objects.create(order_number='SPO3', supplier=self.good, company=self.company)
+        PurchaseOrderLine.objects.create(purchase_order=po, product=self.product, quantity=1, unit_price=12)
+        receipt = GoodsReceipt.objects.create(purchase_order=po, product=self.product, qty_received=1, warehouse=self.wh, ean='', serial='SC2')
+        GoodsReceipt.objects.filter(pk=receipt.pk).update(date=po.date + timedelta(days=30))
+        out = StringIO()
+        call_command('rollup_scorecards', company='SCO', stdout=out)
+        self.assertIn('Refreshed 2 supplier scorecards', out.getvalue())
+        from .models import SupplierScorecard
+        card = SupplierScorecard.objects.get(supplier=self.good)
+        self.assertEqual((card.receipts, card.on_time_receipts, card.score), (1, 0, Decimal('0.00')))
+        self.assertIsNone(SupplierScorecard.objects.get(supplier=self.cheap).score)
+
+
+class QuotationMatrixTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='QuoteCo', code='QM')
+        self.user = User.objects.create_user(username='quote', password='pass', company=self.company, email='q@qm.com')
+        role = Role.objects.get(name='Admin')
+        perm, _ = Permission.objects.get_or_create(codename='add_purchaseorder')
+        role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='quote', password='pass')
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.bolt = Product.objects.create(name='Bolt', sku='BOLT', unit=unit, company=self.company)
+        self.nut = Product.objects.create(name='Nut', sku='NUT', unit=unit, company=self.company)
+        self.a = Supplier.objects.create(name='Alpha', contact_person='A', email='a@qm.com', company=self.company)
+        self.b = Supplier.objects.create(name='Beta', contact_person='B', email='b@qm.com', company=self.company)
+        self.lines = {}
+        for number, supplier, product, price, freight in [
+            ('QM1', self.a, self.bolt, 10, 3),
+            ('QM2', self.b, self.bolt, 11, 0),
+            ('QM3', self.a, self.nut, 2, 0),
+            ('QM4', self.b, self.nut, 3, 0),
+        ]:
+            q = QuotationRequest.objects.create(number=number, supplier=supplier, company=self.company)
+            self.lines[number] = QuotationRequestLine.objects.create(
+                quotation=q, product=product, quantity=4, unit_price=price, freight=freight
+            )
+
+    def test_matrix_ranks_by_landed_cost(self):
+        from decimal import Decimal
+        from .quotations import comparison_matrix, quoted_products
+        products = list(quoted_products(self.company))
+        with self.assertNumQueries(1):
+            matrix = comparison_matrix(self.company, products)
+        self.assertEqual(matrix.suppliers, [self.a, self.b])
+        bolt, nut = matrix.rows
+        self.assertEqual(bolt.product, self.bolt)
+        alpha, beta = bolt.cells
+        self.assertEqual((alpha.landed, alpha.landed_rank), (Decimal('13'), 2))
+        self.assertEqual((beta.best_price, beta.best_landed, beta.landed_rank), (Decimal('10'), Decimal('11'), 1))
+        self.assertEqual(bolt.best, beta)
+        self.assertEqual(bolt.best.savings, Decimal('8'))
+        self.assertEqual(nut.best.quotation.supplier, self.a)
+
+        resp = self.client.get(reverse('quotation_compare'), {'q': 'nu'})
+        self.assertEqual([r.product for r in resp.context['matrix'].rows], [self.nut])
+
+    def test_po_numbers_skip_non_numeric_and_clashes_are_retried(self):
+        from unittest import mock
+        from .quotations import award_lines
+        PurchaseOrder.objects.create(order_number='QM-PODRAFT', supplier=self.a, company=self.company)
+        PurchaseOrder.objects.create(order_number='QM-PO0007', supplier=self.a, company=self.company)
+        self.assertEqual(PurchaseOrder.generate_numbers(self.company, 2), ['QM-PO0008', 'QM-PO0009'])
+
+        taken = [['QM-PO0007'], ['QM-PO0008']]
+        with mock.patch.object(PurchaseOrder, 'generate_numbers', side_effect=taken) as generate:
+            orders, skipped = award_lines(self.company, [self.lines['QM1'].pk])
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(([po.order_number for po in orders], skipped), (['QM-PO0008'], 0))
+        self.assertEqual(orders[0].lines.count(), 1)
+
+    def test_award_creates_one_po_per_supplier(self):
+        from accounts.models import Job
+        lines = [self.lines[n].pk for n in ('QM2', 'QM3', 'QM4')]
+        resp = self.client.post(reverse('quotation_award'), {'lines': lines})
+        self.assertRedirects(resp, reverse('quotation_compare'), fetch_redirect_response=False)
+        orders = PurchaseOrder.objects.filter(company=self.company).order_by('order_number')
+        self.assertEqual([po.order_number for po in orders], ['QM-PO0001', 'QM-PO0002'])
+        by_supplier = {po.supplier: sorted(l.unit_price for l in po.lines.all()) for po in orders}
+        self.assertEqual(by_supplier, {self.a: [2], self.b: [3, 11]})
+        self.assertEqual(QuotationRequestLine.objects.filter(selected=True).count(), 3)
+        self.assertEqual(Job.objects.filter(name='send_mail').count(), 1)
+
+        resp = self.client.post(reverse('quotation_award'), {'lines': lines + [self.lines['QM1'].pk]})
+        po = PurchaseOrder.objects.get(order_number='QM-PO0003')
+        self.assertRedirects(resp, reverse('purchase_order_detail', args=[po.pk]), fetch_redirect_response=False)
+        self.assertEqual(po.supplier, self.a)
+        self.assertEqual(po.lines.count(), 1)
+
+
+class SupplierOTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='OtpCo', code='OTP')
+        self.user = User.objects.create_user(username='otp', password='pass', company=self.company)
+        role = Role.objects.get(name='Admin')
+        for codename in ['change_supplier', 'view_supplier']:
+            perm, _ = Permission.objects.get_or_create(codename=codename)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=self.user, role=role, company=self.company)
+        self.client.login(username='otp', password='pass')
+        self.supplier = Supplier.objects.create(name='S', contact_person='C', email='s@otp.com', company=self.company)
+
+    def test_codes_are_hashed_and_only_latest_is_accepted(self):
+        from . import otp
+
+        first = otp.issue(self.supplier)
+        second = otp.issue(self.supplier)
+        row = SupplierOTP.objects.get(is_used=False)
+        self.assertNotIn(second, row.code_hash)
+        self.assertEqual(row.code_hash, otp.hash_code(self.supplier.pk, second))
+        if first != second:
+            self.assertFalse(otp.verify(self.supplier, first))
+        self.assertTrue(otp.verify(self.supplier, second))
+        self.assertFalse(otp.verify(self.supplier, second))
+
+    def test_wrong_guesses_retire_the_code(self):
+        from . import otp
+
+        code = otp.issue(self.supplier)
+        wrong = '000000' if code != '000000' else '111111'
+        for _ in range(otp.OTP_MAX_ATTEMPTS):
+            self.assertFalse(otp.verify(self.supplier, wrong))
+        self.assertFalse(otp.verify(self.supplier, code))
+
+    def test_request_view_is_rate_limited_and_purge(self):
+        import re
+        from datetime import timedelta
+        from django.core import mail
+        from django.utils import timezone
+        from accounts.jobs import run_worker
+        from accounts.models import Job
+        from . import otp
+
+        url = reverse('supplier_request_otp', args=[self.supplier.id])
+        for _ in range(otp.DEFAULT_RATE_LIMITS['issue_supplier'][0]):
+            self.assertEqual(self.client.post(url).status_code, 302)
+        resp = self.client.post(url, follow=True)
+        self.assertContains(resp, 'Too many requests')
+        jobs = Job.objects.filter(name='send_supplier_otp')
+        self.assertEqual([job.payload for job in jobs], [{'supplier_id': self.supplier.pk}] * 3)
+        self.assertFalse(SupplierOTP.objects.exists())
+        self.assertEqual(run_worker(once=True), 3)
+        self.assertEqual(SupplierOTP.objects.filter(supplier=self.supplier).count(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        latest = SupplierOTP.objects.get(is_used=False)
+        code = re.search(r'\d{6}', mail.outbox[-1].body).group()
+        self.assertEqual(latest.code_hash, otp.hash_code(self.supplier.pk, code))
+
+        self.assertEqual(otp.purge_expired(), 0)
+        self.assertEqual(otp.purge_expired(now=timezone.now() + timedelta(minutes=11)), 3)
+
+    def test_token_bucket_refills(self):
+        from . import otp
+
+        bucket = otp.TokenBucket('test', capacity=2, period=10)
+        bucket.take(now=100)
+        bucket.take(now=100)
+        with self.assertRaises(otp.RateLimited) as ctx:
+            bucket.take(now=101)
+        self.assertEqual(ctx.exception.retry_after, 4)
+        bucket.take(now=106)
+
+
+class SupplierImportTests(TestCase):
+    CSV = (
+        'name,contact_person,phone,email,trn,iban,bank_name,swift_code\n'
+        'Alpha,Ann,+14155550201,alpha@example.com,,GB82WEST12345698765432,NewBank,NEWBANK1\n'
+        'Beta,Ben,+14155550202,beta@example.com,,,NewBank,NEWBANK1\n'
+        'Gamma,Gus,+1 415 555 0200,gamma@example.com,,,,\n'
+        'Delta,Dan,,delta@example.com,123,,,\n'
+        'Echo,Eve,,ALPHA@example.com,,,,\n'
+    )
+
+    def setUp(self):
+        self.company = Company.objects.create(name='ImpCo', code='IMP')
+        Supplier.objects.create(name='Old', contact_person='O', phone='+14155550200', company=self.company)
+
+    def _rows(self):
+        import io
+        from .supplier_import import read_rows
+
+        return read_rows(io.BytesIO(self.CSV.encode()))
+
+    def test_dry_run_then_import(self):
+        from accounts.models import Job
+        from .supplier_import import import_suppliers
+
+        with self.assertNumQueries(2):
+            report = import_suppliers(self.company, self._rows(), dry_run=True)
+        self.assertEqual((report.total, report.valid, report.created), (5, 2, 0))
+        errors = dict(report.errors)
+        self.assertEqual(errors[4], {'phone': 'Phone already exists'})
+        self.assertEqual(errors[5], {'trn': 'Invalid TRN'})
+        self.assertEqual(errors[6], {'email': 'Duplicate of line 2'})
+        self.assertEqual(Supplier.objects.count(), 1)
+        self.assertFalse(Bank.objects.exists())
+
+        report = import_suppliers(self.company, self._rows())
+        self.assertEqual(report.created, 2)
+        alpha = Supplier.objects.get(name='Alpha')
+        beta = Supplier.objects.get(name='Beta')
+        self.assertEqual(alpha.bank_id, beta.bank_id)
+        self.assertEqual(Bank.objects.get().swift_code, 'NEWBANK1')
+        self.assertEqual(alpha.phone_e164, '+14155550201')
+        self.assertEqual(
+            sorted(job.payload['supplier_id'] for job in Job.objects.filter(name='send_supplier_otp')),
+            sorted([alpha.pk, beta.pk]),
+        )
+
+    def test_parallel_validation_matches_serial(self):
+        from unittest import mock
+        from . import supplier_import
+
+        rows = self._rows() * 3
+        serial = supplier_import.validate_rows(rows, workers=1)
+        with mock.patch.object(supplier_import, 'PARALLEL_THRESHOLD', 2):
+            parallel = supplier_import.validate_rows(rows, workers=2)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(parallel[3], {'trn': 'Invalid TRN'})
+
+
+WORKFLOWS = {
+    'requisition': [
+        {'permission': 'approve_purchaserequisition'},
+        {'permission': 'approve_purchaserequisition_l2', 'min_amount': '1000'},
+    ],
+    'payment': [
+        {'permission': 'approve_payment'},
+        {'permission': 'approve_payment_l2', 'min_amount': '1000', 'types': ['bank']},
+    ],
+}
+
+
+@override_settings(APPROVAL_WORKFLOWS=WORKFLOWS)
+class ApprovalWorkflowTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='ApproveCo', code='AW')
+        self.requester = self.make_user('requester', ['add_purchaserequisition', 'add_payment'])
+        self.manager = self.make_user('manager', ['approve_purchaserequisition', 'approve_payment'])
+        self.director = self.make_user('director', ['approve_purchaserequisition_l2', 'approve_payment_l2'])
+        unit = ProductUnit.objects.create(code='PCS', name='Pieces')
+        self.product = Product.objects.create(name='Laptop', sku='LAP', unit=unit, company=self.company, sale_price=600)
+
+    def make_user(self, username, perms):
+        user = User.objects.create_user(username=username, password='pass', company=self.company)
+        role = Role.objects.create(name=username, company=self.company)
+        for codename in perms:
+            perm, _ = Permission.objects.get_or_create(codename=codename)
+            role.permissions.add(perm)
+        UserRole.objects.create(user=user, role=role, company=self.company)
+        return user
+
+    def raise_pr(self, quantity):
+        self.client.login(username='requester', password='pass')
+        self.client.post(reverse('requisition_add'), {
+            'request_type': PurchaseRequisition.TYPE_PRODUCT, 'product': self.product.id, 'quantity': quantity,
+        })
+        return PurchaseRequisition.objects.latest('id')
+
+    def test_levels_follow_amount_threshold(self):
+        from .models import ApprovalTask
+        small = self.raise_pr('1')
+        large = self.raise_pr('2')
+        levels = dict(ApprovalTask.objects.values_list('object_id', 'permission').filter(level=2))
+        self.assertEqual(levels, {large.pk: 'approve_purchaserequisition_l2'})
+        self.assertFalse(ApprovalTask.objects.filter(object_id=small.pk, level=2).exists())
+
+        self.client.login(username='director', password='pass')
+        resp = self.client.post(reverse('requisition_approve', args=[large.pk]), {'action': 'approve'})
+        self.assertEqual(resp.status_code, 403)
+
+        self.client.login(username='manager', password='pass')
+        self.client.post(reverse('requisition_approve', args=[large.pk]), {
+            'action': 'approve', f'approved_qty_{large.lines.get().pk}': '1',
+        })
+        large.refresh_from_db()
+        self.assertEqual(large.status, PurchaseRequisition.PENDING)
+        resp = self.client.post(reverse('requisition_approve', args=[large.pk]), {'action': 'approve'})
+        self.assertEqual(resp.status_code, 403)
+
+        self.client.login(username='director', password='pass')
+        self.client.post(reverse('requisition_approve', args=[large.pk]), {'action': 'approve'})
+        large.refresh_from_db()
+        self.assertEqual(large.status, PurchaseRequisition.APPROVED)
+        self.assertEqual(large.approver, self.director)
+        self.assertEqual(list(large.approvals.values_list('level', 'approver__username')),
+                         [(1, 'manager'), (2, 'director')])
+        self.assertEqual(large.lines.get().approved_quantity, 1)
+
+    def test_queue_bulk_decide_and_nav_count(self):
+        from .approvals import queue, queue_count
+        from .models import ApprovalTask
+        prs = [self.raise_pr('2') for _ in range(3)]
+        self.assertEqual(queue_count(self.requester), 0)
+        self.assertEqual(queue_count(self.director), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(queue_count(self.manager), 3)
+
+        self.client.login(username='manager', password='pass')
+        resp = self.client.get(reverse('approval_queue'))
+        self.assertEqual(resp.context['approval_queue_count'], 3)
+        tasks = list(resp.context['page_obj'])
+        self.assertEqual([t.title for t in tasks], [pr.number for pr in prs])
+        self.client.post(reverse('approval_bulk_decide'), {'action': 'approve', 'task': [t.pk for t in tasks[:2]]})
+        self.client.post(reverse('approval_bulk_decide'), {'action': 'reject', 'task': [tasks[2].pk]})
+
+        self.assertEqual(queue_count(self.manager), 0)
+        self.assertEqual([t.object_id for t in queue(self.director)], [prs[0].pk, prs[1].pk])
+        self.assertEqual(queue_count(self.director), 2)
+        statuses = dict(PurchaseRequisition.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[pr.pk] for pr in prs], ['pending', 'pending', 'rejected'])
+        self.assertEqual(ApprovalTask.objects.get(object_id=prs[2].pk, level=2).status, ApprovalTask.CANCELLED)
+
+        # Tasks outside the user's queue are ignored.
+        self.client.post(reverse('approval_bulk_decide'), {'action': 'approve', 'task': [t.pk for t in queue(self.director)]})
+        self.assertEqual(queue_count(self.director), 2)
+
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ApprovalQueueCount
+        ApprovalQueueCount.objects.update(pending=9)
+        call_command('rollup_approvals', company='AW', stdout=StringIO())
+        self.assertEqual(queue_count(self.director), 2)
+        self.assertEqual(queue_count(self.manager), 0)
+
+    def test_payment_chain_by_method(self):
+        from ledger.utils import post_entry
+        for code in ['Supplier', 'Cash', 'Bank']:
+            LedgerAccount.objects.create(code=code, name=code, company=self.company)
+        post_entry(self.company, 'opening', [('Cash', 10000, 0), ('Bank', 10000, 0)])
+        self.client.login(username='requester', password='pass')
+        self.client.post(reverse('payment_add'), {'amount': '5000', 'method': Payment.METHOD_CASH})
+        self.client.post(reverse('payment_add'), {'amount': '5000', 'method': Payment.METHOD_BANK})
+        cash, bank = Payment.objects.order_by('id')
+
+        self.client.login(username='manager', password='pass')
+        self.client.post(reverse('payment_approve', args=[cash.pk]), {'action': 'approve'})
+        self.client.post(reverse('payment_approve', args=[bank.pk]), {'action': 'approve'})
+        cash.refresh_from_db()
+        bank.refresh_from_db()
+        self.assertEqual(cash.status, Payment.STATUS_APPROVED)
+        self.assertEqual(bank.status, Payment.STATUS_PENDING)
+        self.assertEqual(LedgerEntry.objects.filter(company=self.company).count(), 2)
+
+        self.client.login(username='director', password='pass')
+        self.client.post(reverse('payment_approve', args=[bank.pk]), {'action': 'approve'})
+        bank.refresh_from_db()
+        self.assertEqual(bank.status, Payment.STATUS_APPROVED)
+        self.assertEqual(list(bank.approvals.values_list('level', flat=True)), [1, 2])
+        self.assertEqual(LedgerEntry.objects.filter(company=self.company).count(), 3)
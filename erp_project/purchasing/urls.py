@@ -11,22 +11,29 @@ urlpatterns = [
     path('suppliers/<int:pk>/request-otp/', views.SupplierRequestOTPView.as_view(), name='supplier_request_otp'),
     path('purchase-orders/add/', views.PurchaseOrderCreateView.as_view(), name='purchase_order_add'),
     path('purchase-orders/<int:pk>/', views.PurchaseOrderDetailView.as_view(), name='purchase_order_detail'),
+    path('purchase-orders/<int:pk>/pdf/', views.PurchaseOrderPDFView.as_view(), name='purchase_order_pdf'),
     path('purchase-orders/<int:pk>/ack/', views.PurchaseOrderAcknowledgeView.as_view(), name='purchase_order_ack'),
     path('purchase-orders/<int:po_id>/lines/<int:line_id>/receive/', views.GoodsReceiptCreateView.as_view(), name='goods_receipt_add'),
     path('quotations/add/', views.QuotationRequestCreateView.as_view(), name='quotation_add'),
     path('quotations/compare/', views.QuotationComparisonView.as_view(), name='quotation_compare'),
+    path('quotations/award/', views.QuotationAwardView.as_view(), name='quotation_award'),
     path('quotations/<int:line_id>/select/', views.QuotationSelectView.as_view(), name='quotation_select'),
     path('invoices/', views.SupplierInvoiceListView.as_view(), name='invoice_list'),
     path('invoices/add/', views.SupplierInvoiceCreateView.as_view(), name='invoice_add'),
     path('invoices/<int:pk>/match/', views.InvoiceMatchView.as_view(), name='invoice_match'),
+    path('invoices/<int:pk>/pdf/', views.SupplierInvoicePDFView.as_view(), name='invoice_pdf'),
     path('payments/', views.PaymentListView.as_view(), name='payment_list'),
     path('payments/add/', views.PaymentCreateView.as_view(), name='payment_add'),
     path('payments/<int:pk>/approve/', views.PaymentApprovalView.as_view(), name='payment_approve'),
+    path('approvals/', views.ApprovalQueueView.as_view(), name='approval_queue'),
+    path('approvals/decide/', views.ApprovalBulkDecideView.as_view(), name='approval_bulk_decide'),
     path('requisitions/', views.PurchaseRequisitionListView.as_view(), name='requisition_list'),
     path('requisitions/add/', views.PurchaseRequisitionCreateView.as_view(), name='requisition_add'),
     path('requisitions/<int:pk>/', views.PurchaseRequisitionDetailView.as_view(), name='requisition_detail'),
     path('requisitions/<int:pk>/approve/', views.PurchaseRequisitionApproveView.as_view(), name='requisition_approve'),
     path('requisitions/<int:pk>/pdf/', views.PurchaseRequisitionPDFView.as_view(), name='requisition_pdf'),
+    path('requisitions/demand/', views.RequisitionDemandReportView.as_view(), name='requisition_demand'),
+    path('requisitions/pdf/', views.PurchaseRequisitionBatchPDFView.as_view(), name='requisition_batch_pdf'),
     path('suppliers/<int:supplier_id>/evaluate/', views.SupplierEvaluationCreateView.as_view(), name='supplier_evaluate'),
     path('banks/search/', views.BankSearchView.as_view(), name='bank_search'),
     path('services/search/', views.ServiceItemSearchView.as_view(), name='service_search'),
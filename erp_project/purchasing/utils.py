@@ -33,3 +33,36 @@ def validate_iban(value: str) -> bool:
 def validate_swift(value: str) -> bool:
     """SWIFT codes are 8 or 11 uppercase letters/digits."""
     return bool(re.fullmatch(r"[A-Z0-9]{8}([A-Z0-9]{3})?", value))
+
+
+def normalize_phone(value):
+    """Return ``value`` in E.164 form, or ``None`` when blank.
+
+    Numbers that cannot be parsed fall back to their digits with a leading
+    ``+`` so that formatting variants still compare equal.
+    """
+    if not value or not value.strip():
+        return None
+    value = value.strip()
+    if value.startswith('00'):
+        value = '+' + value[2:]
+    try:
+        num = phonenumbers.parse(value, None)
+        return phonenumbers.format_number(num, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException:
+        digits = re.sub(r"\D", "", value)
+        return f"+{digits}" if digits else None
+
+
+def normalize_iban(value):
+    """Upper-case IBAN without spaces or separators, or ``None`` when blank."""
+    if not value:
+        return None
+    return stdnum_iban.compact(value) or None
+
+
+def normalize_email(value):
+    """Lower-cased, trimmed email, or ``None`` when blank."""
+    if not value:
+        return None
+    return value.strip().lower() or None
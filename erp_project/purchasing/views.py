@@ -2,26 +2,29 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView, View
 from django.utils.decorators import method_decorator
-from django.core.mail import send_mail
 from django.contrib import messages
 from django.utils import timezone
-import random
+from django.db import IntegrityError, transaction
+from django.core.paginator import Paginator
+import io
 import json
+from datetime import datetime, timedelta
+from accounts.exports import EXPORT_FORMATS
 from accounts.utils import (
     AdvancedListMixin,
+    AsyncLoginRequiredMixin,
     require_permission,
     user_has_permission,
     log_action,
 )
 from .models import (
+    ApprovalTask,
     Bank,
     Supplier,
-    SupplierOTP,
     PurchaseOrder,
     PurchaseOrderLine,
     GoodsReceipt,
     Payment,
-    PaymentApproval,
     SupplierInvoice,
     SupplierEvaluation,
     ServiceItem,
@@ -31,7 +34,6 @@ from .models import (
     QuotationRequest,
     QuotationRequestLine,
     PurchaseRequisition,
-    PurchaseRequisitionApproval,
 )
 from .utils import (
     validate_phone,
@@ -39,9 +41,23 @@ from .utils import (
     validate_trn,
     validate_iban,
     validate_swift,
+    normalize_email,
+    normalize_iban,
+    normalize_phone,
 )
+from .documents import invoice_document, is_final, purchase_order_document, requisition_document
+from .matching import match_invoices
+from .quotations import award_lines, comparison_matrix, quoted_products
+from .requisitions import RequisitionError, create_lines, demand_by_month
+from .suppliers import conflict_errors, resolve_bank
+from . import approvals
+from . import otp as otp_service
 from inventory.models import Product, Warehouse, ProductSerial, ProductUnit
-from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
+from django.http import (
+    FileResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
+from accounts.documents import cached_pdf, render_combined, zip_documents
+from accounts.jobs import enqueue, enqueue_mail
 
 
 class SupplierListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
@@ -50,6 +66,10 @@ class SupplierListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
     search_fields = ['name', 'contact_person', 'phone', 'email']
     filter_fields = ['is_verified', 'is_connected']
     default_sort = 'name'
+    export_fields = [
+        'name', 'contact_person', 'phone', 'email', 'trade_license_number',
+        'trn', 'rating', 'is_verified', 'is_connected',
+    ]
 
     def base_queryset(self):
         return Supplier.objects.filter(company=self.request.user.company)
@@ -91,6 +111,21 @@ class SupplierListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
         return context
 
 
+def _client_ip(request):
+    return request.META.get('REMOTE_ADDR')
+
+
+def _send_supplier_otp(request, supplier, ip=None):
+    """Queue a verification code for the supplier. May raise RateLimited.
+
+    Pass ``ip`` to also count the request against the client's IP bucket.
+    The job creates the code, so only the supplier id is stored with it.
+    """
+    otp_service.check_issue(supplier, ip=ip)
+    if supplier.email:
+        enqueue('send_supplier_otp', company=request.user.company, supplier_id=supplier.pk)
+
+
 @method_decorator(require_permission('add_supplier'), name='dispatch')
 class SupplierCreateView(LoginRequiredMixin, View):
     def get(self, request):
@@ -122,22 +157,13 @@ class SupplierCreateView(LoginRequiredMixin, View):
             errors['contact_person'] = 'Contact person required'
         if data['phone'] and not validate_phone(data['phone']):
             errors['phone'] = 'Invalid phone number'
-        if Supplier.objects.filter(email=data['email']).exists():
-            errors['email'] = 'Email already exists'
-        if data['phone'] and Supplier.objects.filter(phone=data['phone']).exists():
-            errors['phone'] = 'Phone already exists'
         if data['trade_license_number'] and not validate_trade_license(data['trade_license_number']):
             errors['trade_license_number'] = 'Invalid trade license number'
-        if data['trade_license_number'] and Supplier.objects.filter(trade_license_number=data['trade_license_number']).exists():
-            errors['trade_license_number'] = 'Trade license number exists'
         if data['trn'] and not validate_trn(data['trn']):
             errors['trn'] = 'Invalid TRN'
-        if data['trn'] and Supplier.objects.filter(trn=data['trn']).exists():
-            errors['trn'] = 'TRN exists'
         if data['iban'] and not validate_iban(data['iban']):
             errors['iban'] = 'Invalid IBAN'
-        if data['iban'] and Supplier.objects.filter(iban=data['iban']).exists():
-            errors['iban'] = 'IBAN exists'
+        errors.update(conflict_errors(data))
         bank = None
         if data['bank_name'] or data['swift_code']:
             if not data['bank_name'] or not data['swift_code']:
@@ -145,42 +171,39 @@ class SupplierCreateView(LoginRequiredMixin, View):
             elif not validate_swift(data['swift_code']):
                 errors['swift_code'] = 'Invalid SWIFT code'
             else:
-                if Bank.objects.filter(swift_code=data['swift_code']).exclude(name=data['bank_name']).exists():
-                    errors['swift_code'] = 'SWIFT code already used by another bank'
-                bank, created = Bank.objects.get_or_create(
-                    name=data['bank_name'],
-                    defaults={'swift_code': data['swift_code']},
-                )
-                if not created and bank.swift_code != data['swift_code']:
-                    errors['swift_code'] = 'Bank exists with different SWIFT code'
+                bank, bank_errors = resolve_bank(data['bank_name'], data['swift_code'])
+                errors.update(bank_errors)
         if errors:
             data['errors'] = errors
             data['banks'] = Bank.objects.all()
             data['title'] = 'Add Supplier'
             return render(request, 'supplier_form.html', data)
 
-        supplier = Supplier.objects.create(
-            name=data['name'],
-            description=data['description'],
-            contact_person=data['contact_person'],
-            phone=data['phone'],
-            email=data['email'],
-            trade_license_number=data['trade_license_number'],
-            trn=data['trn'],
-            iban=data['iban'],
-            bank=bank,
-            address=data['address'],
-            company=request.user.company,
-        )
-        code = f"{random.randint(100000, 999999)}"
-        SupplierOTP.objects.create(supplier=supplier, code=code)
-        send_mail(
-            'Supplier Verification',
-            f'Your verification code is {code}',
-            'noreply@example.com',
-            [supplier.email],
-            fail_silently=True,
-        )
+        try:
+            with transaction.atomic():
+                supplier = Supplier.objects.create(
+                    name=data['name'],
+                    description=data['description'],
+                    contact_person=data['contact_person'],
+                    phone=data['phone'] or None,
+                    email=data['email'] or None,
+                    trade_license_number=data['trade_license_number'] or None,
+                    trn=data['trn'] or None,
+                    iban=normalize_iban(data['iban']),
+                    bank=bank,
+                    address=data['address'],
+                    company=request.user.company,
+                )
+        except IntegrityError:
+            # Another request registered the same identifier since the check.
+            data['errors'] = conflict_errors(data) or {'name': 'Supplier could not be saved'}
+            data['banks'] = Bank.objects.all()
+            data['title'] = 'Add Supplier'
+            return render(request, 'supplier_form.html', data)
+        try:
+            _send_supplier_otp(request, supplier)
+        except otp_service.RateLimited as exc:
+            messages.warning(request, f'Verification code not sent: {exc}')
         log_action(request.user, 'create_supplier', details={'name': supplier.name}, company=request.user.company)
         messages.success(request, 'Supplier added successfully')
         return redirect('supplier_detail', pk=supplier.pk)
@@ -248,22 +271,13 @@ class SupplierUpdateView(LoginRequiredMixin, View):
             errors['contact_person'] = 'Contact person required'
         if data['phone'] and not validate_phone(data['phone']):
             errors['phone'] = 'Invalid phone number'
-        if data['email'] and Supplier.objects.filter(email=data['email']).exclude(pk=supplier.pk).exists():
-            errors['email'] = 'Email already exists'
-        if data['phone'] and Supplier.objects.filter(phone=data['phone']).exclude(pk=supplier.pk).exists():
-            errors['phone'] = 'Phone already exists'
         if data['trade_license_number'] and not validate_trade_license(data['trade_license_number']):
             errors['trade_license_number'] = 'Invalid trade license number'
-        if data['trade_license_number'] and Supplier.objects.filter(trade_license_number=data['trade_license_number']).exclude(pk=supplier.pk).exists():
-            errors['trade_license_number'] = 'Trade license number exists'
         if data['trn'] and not validate_trn(data['trn']):
             errors['trn'] = 'Invalid TRN'
-        if data['trn'] and Supplier.objects.filter(trn=data['trn']).exclude(pk=supplier.pk).exists():
-            errors['trn'] = 'TRN exists'
         if data['iban'] and not validate_iban(data['iban']):
             errors['iban'] = 'Invalid IBAN'
-        if data['iban'] and Supplier.objects.filter(iban=data['iban']).exclude(pk=supplier.pk).exists():
-            errors['iban'] = 'IBAN exists'
+        errors.update(conflict_errors(data, exclude_pk=supplier.pk))
         bank = None
         if data['bank_name'] or data['swift_code']:
             if not data['bank_name'] or not data['swift_code']:
@@ -271,14 +285,8 @@ class SupplierUpdateView(LoginRequiredMixin, View):
             elif not validate_swift(data['swift_code']):
                 errors['swift_code'] = 'Invalid SWIFT code'
             else:
-                if Bank.objects.filter(swift_code=data['swift_code']).exclude(name=data['bank_name']).exists():
-                    errors['swift_code'] = 'SWIFT code already used by another bank'
-                bank, created = Bank.objects.get_or_create(
-                    name=data['bank_name'],
-                    defaults={'swift_code': data['swift_code']},
-                )
-                if not created and bank.swift_code != data['swift_code']:
-                    errors['swift_code'] = 'Bank exists with different SWIFT code'
+                bank, bank_errors = resolve_bank(data['bank_name'], data['swift_code'])
+                errors.update(bank_errors)
         if errors:
             data['errors'] = errors
             data['banks'] = Bank.objects.all()
@@ -286,7 +294,11 @@ class SupplierUpdateView(LoginRequiredMixin, View):
             data['title'] = 'Update Supplier'
             return render(request, 'supplier_form.html', data)
 
-        changed_contact = data['email'] != (supplier.email or '') or data['phone'] != (supplier.phone or '')
+        # Reformatting the same number or email does not require re-verification.
+        changed_contact = (
+            normalize_email(data['email']) != supplier.email_normalized
+            or normalize_phone(data['phone']) != supplier.phone_e164
+        )
         supplier.name = data['name']
         supplier.description = data['description']
         supplier.contact_person = data['contact_person']
@@ -294,21 +306,18 @@ class SupplierUpdateView(LoginRequiredMixin, View):
         supplier.email = data['email'] or None
         supplier.trade_license_number = data['trade_license_number'] or None
         supplier.trn = data['trn'] or None
-        supplier.iban = data['iban'] or None
+        supplier.iban = normalize_iban(data['iban'])
         supplier.bank = bank
         supplier.address = data['address']
         if changed_contact:
             supplier.is_verified = False
-            code = f"{random.randint(100000, 999999)}"
-            SupplierOTP.objects.create(supplier=supplier, code=code)
-            send_mail(
-                'Supplier Verification',
-                f'Your verification code is {code}',
-                'noreply@example.com',
-                [supplier.email],
-                fail_silently=True,
-            )
         supplier.save()
+        if changed_contact:
+            # After the save, so the job reads the new address.
+            try:
+                _send_supplier_otp(request, supplier)
+            except otp_service.RateLimited as exc:
+                messages.warning(request, f'Verification code not sent: {exc}')
         log_action(request.user, 'update_supplier', details={'id': supplier.id}, company=request.user.company)
         messages.success(request, 'Supplier updated successfully')
         return redirect('supplier_detail', pk=supplier.pk)
@@ -318,30 +327,28 @@ class SupplierUpdateView(LoginRequiredMixin, View):
 class SupplierVerifyView(LoginRequiredMixin, View):
     def post(self, request, pk):
         supplier = get_object_or_404(Supplier, pk=pk, company=request.user.company)
-        code = request.POST.get('otp', '').strip()
-        otp = supplier.otps.filter(code=code, is_used=False).order_by('-created_at').first()
-        if otp and otp.is_valid():
+        code = request.POST.get('otp', '')
+        try:
+            valid = otp_service.verify(supplier, code, ip=_client_ip(request))
+            error = 'Invalid OTP'
+        except otp_service.RateLimited as exc:
+            valid, error = False, str(exc)
+        if valid:
             supplier.is_verified = True
             supplier.save()
-            otp.is_used = True
-            otp.save()
             return redirect('supplier_detail', pk=pk)
-        return render(request, 'supplier_detail.html', {'supplier': supplier, 'error': 'Invalid OTP', 'can_toggle': user_has_permission(request.user, 'can_discontinue_supplier'), 'can_verify': True})
+        return render(request, 'supplier_detail.html', {'supplier': supplier, 'error': error, 'can_toggle': user_has_permission(request.user, 'can_discontinue_supplier'), 'can_verify': True})
 
 
 @method_decorator(require_permission('change_supplier'), name='dispatch')
 class SupplierRequestOTPView(LoginRequiredMixin, View):
     def post(self, request, pk):
         supplier = get_object_or_404(Supplier, pk=pk, company=request.user.company)
-        code = f"{random.randint(100000, 999999)}"
-        SupplierOTP.objects.create(supplier=supplier, code=code)
-        send_mail(
-            'Supplier Verification',
-            f'Your verification code is {code}',
-            'noreply@example.com',
-            [supplier.email],
-            fail_silently=True,
-        )
+        try:
+            _send_supplier_otp(request, supplier, ip=_client_ip(request))
+        except otp_service.RateLimited as exc:
+            messages.error(request, str(exc))
+            return redirect('supplier_detail', pk=pk)
         request.session['show_otp_for'] = supplier.id
         messages.success(request, 'OTP sent to supplier')
         return redirect('supplier_detail', pk=pk)
@@ -382,6 +389,7 @@ class PurchaseOrderDetailView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         po = get_object_or_404(PurchaseOrder, pk=self.kwargs['pk'], company=self.request.user.company)
         context['po'] = po
+        context['lines'] = po.lines.select_related('product')
         context['can_receive'] = user_has_permission(self.request.user, 'add_goodsreceipt')
         context['can_ack'] = user_has_permission(self.request.user, 'ack_purchaseorder') and not po.acknowledged
         return context
@@ -413,6 +421,7 @@ class GoodsReceiptCreateView(LoginRequiredMixin, View):
             purchase_order=line.purchase_order,
             product=line.product,
             qty_received=qty,
+            unit_cost=line.unit_price,
             warehouse=warehouse,
             ean=ean,
             serial=serial,
@@ -436,12 +445,11 @@ class PurchaseOrderAcknowledgeView(LoginRequiredMixin, View):
             po.acknowledged = True
             po.acknowledged_at = timezone.now()
             po.save()
-            send_mail(
+            enqueue_mail(
                 'PO Acknowledged',
                 f'Purchase order {po.order_number} acknowledged',
-                'noreply@example.com',
                 [request.user.email],
-                fail_silently=True,
+                company=request.user.company,
             )
         return redirect('purchase_order_detail', pk=pk)
 
@@ -481,6 +489,7 @@ class QuotationRequestCreateView(LoginRequiredMixin, View):
         )
         qty = request.POST.get('quantity', '0').strip()
         price = request.POST.get('unit_price', '0').strip()
+        freight = request.POST.get('freight', '0').strip()
         ean = request.POST.get('ean', '').strip()
         serials = request.POST.get('serial_list', '').strip()
         # Identifier compliance
@@ -520,6 +529,7 @@ class QuotationRequestCreateView(LoginRequiredMixin, View):
             product=product,
             quantity=qty or 0,
             unit_price=price or 0,
+            freight=freight or 0,
             ean=ean,
             serial_list=serials,
         )
@@ -527,45 +537,53 @@ class QuotationRequestCreateView(LoginRequiredMixin, View):
         return redirect('purchase_order_add')
 
 
-class BankSearchView(LoginRequiredMixin, View):
+class BankSearchView(AsyncLoginRequiredMixin, View):
     """Return bank names matching a query for AJAX search."""
 
-    def get(self, request):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        banks = Bank.objects.filter(name__icontains=q)[:10]
-        data = [{'name': b.name} for b in banks]
+        banks = Bank.objects.filter(name__icontains=q).values_list('name', flat=True)[:10]
+        data = [{'name': name} async for name in banks]
         return JsonResponse(data, safe=False)
 
 
-class ServiceItemSearchView(LoginRequiredMixin, View):
-    def get(self, request):
+class ServiceItemSearchView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        items = ServiceItem.objects.filter(company=request.user.company, name__icontains=q, is_active=True)[:10]
-        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} for i in items]
+        items = ServiceItem.objects.filter(
+            company_id=request.user.company_id, name__icontains=q, is_active=True
+        ).select_related('unit')[:10]
+        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} async for i in items]
         return JsonResponse({'results': data})
 
 
-class OfficeSupplyItemSearchView(LoginRequiredMixin, View):
-    def get(self, request):
+class OfficeSupplyItemSearchView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        items = OfficeSupplyItem.objects.filter(company=request.user.company, name__icontains=q, is_active=True)[:10]
-        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} for i in items]
+        items = OfficeSupplyItem.objects.filter(
+            company_id=request.user.company_id, name__icontains=q, is_active=True
+        ).select_related('unit')[:10]
+        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} async for i in items]
         return JsonResponse({'results': data})
 
 
-class AssetItemSearchView(LoginRequiredMixin, View):
-    def get(self, request):
+class AssetItemSearchView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        items = AssetItem.objects.filter(company=request.user.company, name__icontains=q, is_active=True)[:10]
-        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} for i in items]
+        items = AssetItem.objects.filter(
+            company_id=request.user.company_id, name__icontains=q, is_active=True
+        ).select_related('unit')[:10]
+        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} async for i in items]
         return JsonResponse({'results': data})
 
 
-class ITSoftwareItemSearchView(LoginRequiredMixin, View):
-    def get(self, request):
+class ITSoftwareItemSearchView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
         q = request.GET.get('q', '')
-        items = ITSoftwareItem.objects.filter(company=request.user.company, name__icontains=q, is_active=True)[:10]
-        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} for i in items]
+        items = ITSoftwareItem.objects.filter(
+            company_id=request.user.company_id, name__icontains=q, is_active=True
+        ).select_related('unit')[:10]
+        data = [{'id': i.id, 'text': i.name, 'description': i.description, 'unit': i.unit.name} async for i in items]
         return JsonResponse({'results': data})
 
 class PurchaseRequisitionListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
@@ -576,7 +594,7 @@ class PurchaseRequisitionListView(LoginRequiredMixin, AdvancedListMixin, Templat
     default_sort = '-created_at'
 
     def base_queryset(self):
-        return PurchaseRequisition.objects.filter(company=self.request.user.company)
+        return PurchaseRequisition.objects.filter(company=self.request.user.company).select_related('requester')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -626,11 +644,14 @@ class PurchaseRequisitionListView(LoginRequiredMixin, AdvancedListMixin, Templat
 
 @method_decorator(require_permission('add_purchaserequisition'), name='dispatch')
 class PurchaseRequisitionCreateView(LoginRequiredMixin, View):
-    def get(self, request):
+    def render_form(self, request, error=None):
         products = list(
             Product.objects.filter(company=request.user.company).values('id', 'name', 'description', 'unit__name')
         )
-        return render(request, 'requisition_form.html', {'products': products})
+        return render(request, 'requisition_form.html', {'products': products, 'error': error})
+
+    def get(self, request):
+        return self.render_form(request)
 
     def post(self, request):
         just = request.POST.get('justification', '').strip()
@@ -641,38 +662,38 @@ class PurchaseRequisitionCreateView(LoginRequiredMixin, View):
             try:
                 items = json.loads(items_raw)
             except json.JSONDecodeError:
-                products = Product.objects.filter(company=request.user.company)
-                err = 'Invalid items data'
-                return render(request, 'requisition_form.html', {'products': products, 'error': err})
+                return self.render_form(request, 'Invalid items data')
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return self.render_form(request, 'Invalid items data')
         product_id = request.POST.get('product')
         qty = request.POST.get('quantity', '').strip()
         spec = request.POST.get('specification', '').strip()
         if not items and (not product_id or not qty):
-            products = Product.objects.filter(company=request.user.company)
-            return render(request, 'requisition_form.html', {'products': products, 'error': 'All fields required'})
+            return self.render_form(request, 'All fields required')
         product = None
         if product_id:
             product = get_object_or_404(Product, pk=product_id, company=request.user.company)
         # validate single type
         if any(item.get('type') and item['type'] != req_type for item in items):
-            products = Product.objects.filter(company=request.user.company)
-            return render(request, 'requisition_form.html', {
-                'products': products,
-                'error': 'All line items must match the request type',
-            })
+            return self.render_form(request, 'All line items must match the request type')
         number = PurchaseRequisition.generate_number(request.user.company)
-        pr = PurchaseRequisition.objects.create(
-            number=number,
-            request_type=req_type,
-            product=product,
-            quantity=qty or 0,
-            specification=spec,
-            justification=just,
-            requester=request.user,
-            status=PurchaseRequisition.PENDING,
-            company=request.user.company,
-            items=items,
-        )
+        try:
+            with transaction.atomic():
+                pr = PurchaseRequisition.objects.create(
+                    number=number,
+                    request_type=req_type,
+                    product=product,
+                    quantity=qty or 0,
+                    specification=spec,
+                    justification=just,
+                    requester=request.user,
+                    status=PurchaseRequisition.PENDING,
+                    company=request.user.company,
+                )
+                create_lines(pr, items)
+                approvals.start(approvals.KIND_REQUISITION, pr)
+        except RequisitionError as exc:
+            return self.render_form(request, str(exc))
         log_action(request.user, 'create_pr', details={'number': number}, company=request.user.company)
         return redirect('requisition_detail', pk=pr.pk)
 
@@ -681,104 +702,301 @@ class PurchaseRequisitionDetailView(LoginRequiredMixin, TemplateView):
     template_name = 'requisition_detail.html'
 
     def get_context_data(self, **kwargs):
-        pr = get_object_or_404(PurchaseRequisition, pk=self.kwargs['pk'], company=self.request.user.company)
+        pr = get_object_or_404(
+            PurchaseRequisition.objects.select_related('requester').prefetch_related('lines'),
+            pk=self.kwargs['pk'], company=self.request.user.company,
+        )
+        tasks = list(approvals.tasks_for(approvals.KIND_REQUISITION, pr).select_related('decided_by'))
+        current = next((t for t in tasks if t.status == ApprovalTask.PENDING), None)
+        if pr.status != PurchaseRequisition.PENDING:
+            can_approve = False
+        elif current is None:
+            can_approve = user_has_permission(self.request.user, 'approve_purchaserequisition')
+        else:
+            can_approve = approvals.can_decide(self.request.user, current)
         context = super().get_context_data(**kwargs)
         context['pr'] = pr
-        context['can_approve'] = user_has_permission(self.request.user, 'approve_purchaserequisition') and pr.status == PurchaseRequisition.PENDING
+        context['approval_tasks'] = tasks
+        context['can_approve'] = can_approve
         return context
 
 
-@method_decorator(require_permission('approve_purchaserequisition'), name='dispatch')
+def _after_decision(request, task, approved, final):
+    """Audit an approval decision and run the follow-ups of a final one."""
+    company = request.user.company
+    action = 'approve_pr' if task.kind == approvals.KIND_REQUISITION else 'approve_payment'
+    log_action(request.user, action, details={
+        'id': task.object_id, 'approved': approved, 'level': task.level, 'final': final,
+    }, company=company)
+    if not final:
+        return
+    if task.kind == approvals.KIND_REQUISITION:
+        enqueue('render_requisition_pdf', company=company, requisition_id=task.object_id)
+    else:
+        status = Payment.STATUS_APPROVED if approved else Payment.STATUS_REJECTED
+        enqueue_mail('Payment Approval', f'Payment {task.object_id} {status}', [request.user.email], company=company)
+
+
+def _decide_document(request, kind, document, **options):
+    """Decide the pending level of ``document`` from a POSTed form.
+
+    Returns a 403 response when the user cannot approve at that level and
+    ``None`` otherwise; refusals are reported with messages.
+    """
+    task = approvals.current_task(kind, document)
+    if task is None:
+        return None
+    approved = request.POST.get('action') == 'approve'
+    comment = request.POST.get('comment', '').strip()
+    try:
+        final = approvals.decide(task, request.user, approved, comment, **options)
+    except approvals.NotAllowed:
+        return render(request, '403.html', {'missing_permission': task.permission}, status=403)
+    except (approvals.ApprovalError, RequisitionError) as exc:
+        messages.error(request, str(exc))
+        return None
+    _after_decision(request, task, approved, final)
+    if not final:
+        messages.info(request, f'Approved at level {task.level}; sent to the next approver')
+    return None
+
+
 class PurchaseRequisitionApproveView(LoginRequiredMixin, View):
     def post(self, request, pk):
         pr = get_object_or_404(PurchaseRequisition, pk=pk, company=request.user.company)
         if pr.status != PurchaseRequisition.PENDING:
             return redirect('requisition_detail', pk=pk)
-        if pr.requester_id == request.user.id:
-            messages.error(request, 'Creator cannot approve their own requisition')
-            return redirect('requisition_detail', pk=pk)
-        action = request.POST.get('action')
-        comment = request.POST.get('comment', '').strip()
-        approved = action == 'approve'
-        pr.status = PurchaseRequisition.APPROVED if approved else PurchaseRequisition.REJECTED
-        pr.approver = request.user
-        pr.approved_at = timezone.now()
-        pr.save()
-        PurchaseRequisitionApproval.objects.create(
-            requisition=pr,
-            approver=request.user,
-            approved=approved,
-            comment=comment,
-            approved_at=timezone.now(),
+        quantities = {
+            int(key[len('approved_qty_'):]): value.strip()
+            for key, value in request.POST.items()
+            if key.startswith('approved_qty_') and key[len('approved_qty_'):].isdigit()
+        }
+        denied = _decide_document(request, approvals.KIND_REQUISITION, pr, quantities=quantities)
+        return denied or redirect('requisition_detail', pk=pk)
+
+
+class ApprovalQueueView(LoginRequiredMixin, TemplateView):
+    """Pending approvals the user can decide, oldest first.
+
+    ``kind`` limits the queue to requisitions or payments.
+    """
+
+    template_name = 'approval_queue.html'
+    paginate_by = 50
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        kind = self.request.GET.get('kind', '')
+        tasks = approvals.queue(self.request.user, kind or None).select_related('requested_by')
+        page = Paginator(tasks, self.paginate_by).get_page(self.request.GET.get('page'))
+        context.update({
+            'page_obj': page,
+            'kind': kind,
+            'kinds': ApprovalTask.KIND_CHOICES,
+            'query_string': f'kind={kind}' if kind else '',
+        })
+        return context
+
+
+class ApprovalBulkDecideView(LoginRequiredMixin, View):
+    """Approve or reject the tasks ticked in the approval queue."""
+
+    def post(self, request):
+        ids = [int(pk) for pk in request.POST.getlist('task') if pk.isdigit()]
+        if not ids:
+            messages.error(request, 'Select at least one approval')
+            return redirect('approval_queue')
+        approved = request.POST.get('action') == 'approve'
+        decided, errors = approvals.decide_many(
+            request.user, ids, approved, request.POST.get('comment', '').strip()
         )
-        log_action(request.user, 'approve_pr', details={'id': pr.id, 'approved': approved}, company=request.user.company)
-        return redirect('requisition_detail', pk=pk)
+        for task, final in decided:
+            _after_decision(request, task, approved, final)
+        if decided:
+            messages.success(request, f"{len(decided)} {'approved' if approved else 'rejected'}")
+        for message in errors.values():
+            messages.error(request, message)
+        return redirect('approval_queue')
+
+
+def _month(value):
+    return datetime.strptime(value, '%Y-%m').date() if value else None
+
+
+@method_decorator(require_permission('view_purchaserequisition'), name='dispatch')
+class RequisitionDemandReportView(LoginRequiredMixin, TemplateView):
+    """Requested and approved quantities per item and month.
+
+    ``start``/``end`` are inclusive ``YYYY-MM`` months, ``type`` limits to
+    one request type and ``export`` streams the rows in an export format.
+    """
+
+    template_name = 'requisition_demand.html'
+    read_replica = True
+    columns = ['month', 'item_type', 'item', 'unit_label', 'requested', 'approved', 'requisitions']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            start = _month(request.GET.get('start', ''))
+            end = _month(request.GET.get('end', ''))
+        except ValueError:
+            return HttpResponseBadRequest('Months must be YYYY-MM')
+        if end:
+            end = (end + timedelta(days=31)).replace(day=1)
+        self.rows = demand_by_month(request.user.company, start, end, request.GET.get('type') or None)
+        fmt = request.GET.get('export')
+        if fmt:
+            if fmt not in EXPORT_FORMATS:
+                return HttpResponseBadRequest('Unknown export format')
+            writer, content_type, ext = EXPORT_FORMATS[fmt]
+            rows = (tuple(row[c] for c in self.columns) for row in self.rows.iterator(chunk_size=2000))
+            response = StreamingHttpResponse(writer(self.columns, rows), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="requisition-demand.{ext}"'
+            return response
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'rows': self.rows,
+            'types': [t for t, _ in PurchaseRequisition.TYPE_CHOICES],
+            'export_formats': list(EXPORT_FORMATS),
+            'query_string': self.request.GET.urlencode(),
+        })
+        return context
+
+
+def _pdf_response(data, filename):
+    response = FileResponse(io.BytesIO(data), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @method_decorator(require_permission('view_purchaserequisition'), name='dispatch')
 class PurchaseRequisitionPDFView(LoginRequiredMixin, View):
     def get(self, request, pk):
-        pr = get_object_or_404(PurchaseRequisition, pk=pk, company=request.user.company)
-        if pr.status not in [PurchaseRequisition.APPROVED, PurchaseRequisition.REJECTED]:
+        pr = get_object_or_404(
+            PurchaseRequisition.objects.select_related('requester', 'approver').prefetch_related('lines'),
+            pk=pk, company=request.user.company,
+        )
+        if not is_final(pr):
             return HttpResponseForbidden()
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{pr.number}.pdf"'
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
+        document = requisition_document(pr)
+        return _pdf_response(cached_pdf(request.user.company, document), document.filename)
+
+
+@method_decorator(require_permission('view_purchaserequisition'), name='dispatch')
+class PurchaseRequisitionBatchPDFView(LoginRequiredMixin, View):
+    """Download many approved/rejected requisitions as one PDF or a zip.
+
+    ``?ids=1,2,3&format=pdf`` (default) merges them into one file and
+    ``format=zip`` returns one PDF per requisition.
+    """
 
-        p = canvas.Canvas(response, pagesize=A4)
-        y = 800
+    max_documents = 500
+
+    def get(self, request):
+        try:
+            ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return HttpResponseBadRequest('Invalid ids')
+        if not ids or len(ids) > self.max_documents:
+            return HttpResponseBadRequest(f'Provide 1 to {self.max_documents} ids')
+        prs = list(
+            PurchaseRequisition.objects.filter(
+                company=request.user.company,
+                pk__in=ids,
+                status__in=[PurchaseRequisition.APPROVED, PurchaseRequisition.REJECTED],
+            ).select_related('requester', 'approver').prefetch_related('lines').order_by('number')
+        )
+        if not prs:
+            return HttpResponseForbidden()
+        documents = [requisition_document(pr) for pr in prs]
         company = request.user.company
-        if company.letterhead:
-            try:
-                from django.core.files.storage import default_storage
-                with default_storage.open(company.letterhead.name, 'rb') as img:
-                    p.drawImage(img, 40, y, width=200, preserveAspectRatio=True, mask='auto')
-                y -= 60
-            except Exception:
-                pass
-        p.setFont('Helvetica-Bold', 14)
-        p.drawString(40, y, f'Purchase Requisition {pr.number}')
-        y -= 30
-        p.setFont('Helvetica', 12)
-        p.drawString(40, y, f'Status: {pr.get_status_display()}')
-        y -= 20
-        p.drawString(40, y, f'Requester: {pr.requester.username}')
-        y -= 20
-        if pr.approver:
-            p.drawString(40, y, f'Approver: {pr.approver.username}')
-            y -= 20
-        p.drawString(40, y, 'Items:')
-        y -= 20
-        for item in pr.items:
-            line = f"{item.get('name','')} - {item.get('description','')} ({item.get('quantity')} {item.get('unit')})"
-            p.drawString(60, y, line)
-            y -= 15
-        p.drawString(40, y - 10, f"Justification: {pr.justification}")
-        p.showPage()
-        p.save()
-        return response
+        if request.GET.get('format') == 'zip':
+            response = FileResponse(io.BytesIO(zip_documents(company, documents)), content_type='application/zip')
+            response['Content-Disposition'] = 'attachment; filename="requisitions.zip"'
+            return response
+        return _pdf_response(render_combined(company, documents), 'requisitions.pdf')
+
+
+class PurchaseOrderPDFView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        po = get_object_or_404(
+            PurchaseOrder.objects.select_related('supplier'), pk=pk, company=request.user.company
+        )
+        document = purchase_order_document(po)
+        return _pdf_response(cached_pdf(request.user.company, document), document.filename)
+
+
+@method_decorator(require_permission('view_supplierinvoice'), name='dispatch')
+class SupplierInvoicePDFView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        invoice = get_object_or_404(
+            SupplierInvoice.objects.select_related('purchase_order__supplier'),
+            pk=pk, company=request.user.company,
+        )
+        document = invoice_document(invoice)
+        return _pdf_response(cached_pdf(request.user.company, document), document.filename)
 
 
 class QuotationComparisonView(LoginRequiredMixin, TemplateView):
-    """List quotations for comparison and allow selection."""
+    """Product x supplier quotation matrix, paginated by product.
+
+    ``q`` searches products, ``product`` limits to one product, and
+    ``sort=score`` orders supplier columns by scorecard instead of name.
+    """
 
     template_name = 'quotation_compare.html'
+    read_replica = True
+    paginate_by = 20
 
     def get_context_data(self, **kwargs):
+        company = self.request.user.company
+        q = self.request.GET.get('q', '').strip()
         product_id = self.request.GET.get('product')
-        lines = QuotationRequestLine.objects.filter(quotation__company=self.request.user.company, selected=False)
+        sort = 'score' if self.request.GET.get('sort') == 'score' else 'price'
+        products = quoted_products(company, q)
         if product_id:
-            lines = lines.filter(product__id=product_id)
-        lines = lines.select_related('quotation', 'product', 'quotation__supplier').order_by('unit_price')
-        products = Product.objects.filter(company=self.request.user.company)
+            products = products.filter(pk=product_id)
+        page = Paginator(products, self.paginate_by).get_page(self.request.GET.get('page'))
+        qd = self.request.GET.copy()
+        qd.pop('page', None)
         return {
-            'lines': lines,
-            'products': products,
-            'product_id': int(product_id) if product_id else '',
+            'matrix': comparison_matrix(company, page, sort),
+            'page_obj': page,
+            'query_string': qd.urlencode(),
+            'q': q,
+            'sort': sort,
         }
 
 
+@method_decorator(require_permission('add_purchaseorder'), name='dispatch')
+class QuotationAwardView(LoginRequiredMixin, View):
+    """Award the chosen lines, creating one PO per supplier."""
+
+    def post(self, request):
+        ids = [int(pk) for pk in request.POST.getlist('lines') if pk.isdigit()]
+        orders, skipped = award_lines(request.user.company, ids)
+        if not orders:
+            messages.error(request, 'No open quotation lines selected')
+            return redirect('quotation_compare')
+        numbers = ', '.join(po.order_number for po in orders)
+        log_action(request.user, 'award_quotations', details={'lines': ids, 'orders': numbers}, company=request.user.company)
+        enqueue_mail(
+            'Quotations Awarded',
+            f'Purchase orders {numbers} created from {len(ids) - skipped} quotation lines',
+            [request.user.email],
+            company=request.user.company,
+        )
+        if skipped:
+            messages.warning(request, f'{skipped} lines were already awarded and skipped')
+        messages.success(request, f'Created purchase orders {numbers}')
+        if len(orders) == 1:
+            return redirect('purchase_order_detail', pk=orders[0].pk)
+        return redirect('quotation_compare')
+
+
 @method_decorator(require_permission('add_purchaseorder'), name='dispatch')
 class QuotationSelectView(LoginRequiredMixin, View):
     """Create a PO from the chosen quotation line."""
@@ -789,27 +1007,15 @@ class QuotationSelectView(LoginRequiredMixin, View):
             pk=line_id,
             quotation__company=request.user.company,
         )
-        if line.selected:
+        orders, _ = award_lines(request.user.company, [line.pk])
+        if not orders:
             return redirect('quotation_compare')
-        line.selected = True
-        line.save()
-        po = PurchaseOrder.objects.create(
-            order_number=f"PO{random.randint(1000,9999)}",
-            supplier=line.quotation.supplier,
-            company=request.user.company,
-        )
-        PurchaseOrderLine.objects.create(
-            purchase_order=po,
-            product=line.product,
-            quantity=line.quantity,
-            unit_price=line.unit_price,
-        )
-        send_mail(
+        po = orders[0]
+        enqueue_mail(
             'Quotation Selected',
             f'PO {po.order_number} created from quotation {line.quotation.number}',
-            'noreply@example.com',
             [request.user.email],
-            fail_silently=True,
+            company=request.user.company,
         )
         return redirect('purchase_order_detail', pk=po.pk)
 
@@ -818,7 +1024,7 @@ class SupplierInvoiceListView(LoginRequiredMixin, TemplateView):
     template_name = 'invoice_list.html'
 
     def get_context_data(self, **kwargs):
-        invoices = SupplierInvoice.objects.filter(company=self.request.user.company)
+        invoices = SupplierInvoice.objects.filter(company=self.request.user.company).select_related('purchase_order')
         return {'invoices': invoices}
 
 
@@ -837,7 +1043,7 @@ class SupplierInvoiceCreateView(LoginRequiredMixin, View):
             pos = PurchaseOrder.objects.filter(company=request.user.company)
             return render(request, 'invoice_form.html', {'pos': pos, 'error': 'All fields required'})
         inv = SupplierInvoice.objects.create(number=number, purchase_order=po, amount=amount, file=file or None, company=request.user.company)
-        send_mail('Invoice Submitted', f'Invoice {number} submitted', 'noreply@example.com', [request.user.email], fail_silently=True)
+        enqueue_mail('Invoice Submitted', f'Invoice {number} submitted', [request.user.email], company=request.user.company)
         return redirect('invoice_list')
 
 
@@ -846,33 +1052,34 @@ class InvoiceMatchView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         invoice = get_object_or_404(SupplierInvoice, pk=self.kwargs['pk'], company=self.request.user.company)
-        po = invoice.purchase_order
-        po_total = sum(l.quantity * l.unit_price for l in po.lines.all())
-        grn_total = sum(gr.qty_received * gr.product.sale_price for gr in GoodsReceipt.objects.filter(purchase_order=po))
-        match = po_total == grn_total == float(invoice.amount)
-        return {'invoice': invoice, 'po_total': po_total, 'grn_total': grn_total, 'match': match}
+        result = match_invoices([invoice])[invoice.pk]
+        products = Product.objects.in_bulk([line.product_id for line in result.lines])
+        lines = [{'product': products.get(line.product_id), 'line': line} for line in result.lines]
+        return {
+            'invoice': invoice,
+            'po_total': result.po_total,
+            'grn_total': result.received_total,
+            'invoiced_total': result.invoiced_total,
+            'lines': lines,
+            'issues': result.issues,
+            'match': result.matched,
+        }
 
 
-@method_decorator(require_permission('approve_payment'), name='dispatch')
 class PaymentApprovalView(LoginRequiredMixin, View):
     def post(self, request, pk):
         payment = get_object_or_404(Payment, pk=pk, company=request.user.company)
-        action = request.POST.get('action')
-        approved = action == 'approve'
-        payment.status = Payment.STATUS_APPROVED if approved else Payment.STATUS_REJECTED
-        payment.save()
-        PaymentApproval.objects.create(payment=payment, approver=request.user, approved=approved, comment=request.POST.get('comment', ''))
-        if approved:
-            payment.post_ledger_entry()
-        send_mail('Payment Approval', f'Payment {payment.id} {payment.status}', 'noreply@example.com', [request.user.email], fail_silently=True)
-        return redirect('payment_list')
+        if payment.status != Payment.STATUS_PENDING:
+            return redirect('payment_list')
+        denied = _decide_document(request, approvals.KIND_PAYMENT, payment)
+        return denied or redirect('payment_list')
 
 
 class PaymentListView(LoginRequiredMixin, TemplateView):
     template_name = 'payment_list.html'
 
     def get_context_data(self, **kwargs):
-        payments = Payment.objects.filter(company=self.request.user.company)
+        payments = Payment.objects.filter(company=self.request.user.company).select_related('purchase_order')
         return {'payments': payments}
 
 
@@ -887,8 +1094,10 @@ class PaymentCreateView(LoginRequiredMixin, View):
         po = get_object_or_404(PurchaseOrder, pk=po_id, company=request.user.company) if po_id else None
         amount = request.POST.get('amount', '0').strip()
         method = request.POST.get('method', Payment.METHOD_CASH)
-        Payment.objects.create(purchase_order=po, amount=amount, method=method, company=request.user.company)
-        send_mail('Payment Request', f'Payment for {amount} submitted', 'noreply@example.com', [request.user.email], fail_silently=True)
+        with transaction.atomic():
+            payment = Payment.objects.create(purchase_order=po, amount=amount, method=method, company=request.user.company)
+            approvals.start(approvals.KIND_PAYMENT, payment, requested_by=request.user)
+        enqueue_mail('Payment Request', f'Payment for {amount} submitted', [request.user.email], company=request.user.company)
         return redirect('payment_list')
 
 
@@ -913,7 +1122,7 @@ class ServiceItemListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
     default_sort = 'name'
 
     def base_queryset(self):
-        return ServiceItem.objects.filter(company=self.request.user.company)
+        return ServiceItem.objects.filter(company=self.request.user.company).select_related('unit')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -990,7 +1199,7 @@ class OfficeSupplyItemListView(LoginRequiredMixin, AdvancedListMixin, TemplateVi
     default_sort = 'name'
 
     def base_queryset(self):
-        return OfficeSupplyItem.objects.filter(company=self.request.user.company)
+        return OfficeSupplyItem.objects.filter(company=self.request.user.company).select_related('unit')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1099,7 +1308,7 @@ class AssetItemListView(LoginRequiredMixin, AdvancedListMixin, TemplateView):
     default_sort = 'name'
 
     def base_queryset(self):
-        return AssetItem.objects.filter(company=self.request.user.company)
+        return AssetItem.objects.filter(company=self.request.user.company).select_related('unit')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1195,7 +1404,7 @@ class ITSoftwareItemListView(LoginRequiredMixin, AdvancedListMixin, TemplateView
     default_sort = 'name'
 
     def base_queryset(self):
-        return ITSoftwareItem.objects.filter(company=self.request.user.company)
+        return ITSoftwareItem.objects.filter(company=self.request.user.company).select_related('unit')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -64,7 +64,7 @@ function collect(){
     const j=div.querySelector('input[name="line_just"]').value;
     const q=div.querySelector('input[name="line_qty"]').value;
     const u=div.querySelector('input[name="line_unit"]').value;
-    items.push({name:n,description:d,justification:j,quantity:q,unit:u});
+    items.push({item_id:sel.value,name:n,description:d,justification:j,quantity:q,unit:u});
   });
   document.getElementById('items_json').value=JSON.stringify(items);
 }